@@ -0,0 +1,43 @@
+"""add_file_size_to_iso_file_index
+
+Revision ID: 3c8e1f9a2b47
+Revises: 7d5eaf7e2f73
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c8e1f9a2b47'
+down_revision: Union[str, None] = '7d5eaf7e2f73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    اضافه کردن فیلد file_size به جدول iso_file_index
+    برای مقایسه سریع (mtime + size) در حالت اسکن دوره‌ای مسیر ISO
+    """
+    # دیتابیسی که با create_all ساخته شده ستون را از قبل دارد
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name'] for column in inspector.get_columns('iso_file_index')}
+    if 'file_size' not in columns:
+        op.add_column('iso_file_index',
+            sa.Column('file_size', sa.BigInteger(), nullable=True)
+        )
+
+    print("✅ فیلد file_size به جدول iso_file_index اضافه شد")
+
+
+def downgrade() -> None:
+    """
+    حذف تغییرات در صورت نیاز به بازگشت
+    """
+    op.drop_column('iso_file_index', 'file_size')
+
+    print("⚠️ فیلد file_size از جدول iso_file_index حذف شد")
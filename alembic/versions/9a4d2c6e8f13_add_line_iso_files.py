@@ -0,0 +1,61 @@
+"""add_line_iso_files
+
+Revision ID: 9a4d2c6e8f13
+Revises: 3c8e1f9a2b47
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4d2c6e8f13'
+down_revision: Union[str, None] = '3c8e1f9a2b47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    ایجاد جدول line_iso_files
+    نگاشت پیش‌محاسبه‌شده هر خط پروژه به فایل‌های ISO مربوطه (به ترتیب ویرایش)
+    """
+    # دیتابیسی که با create_all ساخته شده جدول و ایندکس‌ها را از قبل دارد
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('line_iso_files'):
+        op.create_table(
+            'line_iso_files',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('project_id', sa.Integer(),
+                      sa.ForeignKey('projects.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('line_no', sa.String(), nullable=False),
+            sa.Column('iso_file_id', sa.Integer(),
+                      sa.ForeignKey('iso_file_index.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('file_path', sa.String(), nullable=False),
+            sa.Column('revision', sa.String(20)),
+            sa.Column('revision_rank', sa.Integer(), server_default='0'),
+            sa.Column('match_type', sa.String(20)),
+            sa.Column('last_modified', sa.DateTime()),
+            sa.UniqueConstraint('project_id', 'line_no', 'iso_file_id', name='uq_line_iso_file'),
+        )
+
+        op.create_index('ix_line_iso_project_line', 'line_iso_files',
+                        ['project_id', 'line_no', 'revision_rank'])
+        op.create_index('ix_line_iso_file', 'line_iso_files', ['iso_file_id'])
+
+    print("✅ جدول line_iso_files ایجاد شد")
+    print("ℹ️ برای پر کردن نگاشت، ایندکس ISO را یک بار بازسازی کنید")
+
+
+def downgrade() -> None:
+    """
+    حذف تغییرات در صورت نیاز به بازگشت
+    """
+    op.drop_index('ix_line_iso_file', table_name='line_iso_files')
+    op.drop_index('ix_line_iso_project_line', table_name='line_iso_files')
+    op.drop_table('line_iso_files')
+
+    print("⚠️ جدول line_iso_files حذف شد")
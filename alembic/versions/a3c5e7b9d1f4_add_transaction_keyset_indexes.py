@@ -0,0 +1,53 @@
+"""add_transaction_keyset_indexes
+
+Revision ID: a3c5e7b9d1f4
+Revises: f2b4d6a8c0e3
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c5e7b9d1f4'
+down_revision: Union[str, None] = 'f2b4d6a8c0e3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    افزودن id به انتهای ایندکس‌های تاریخ تراکنش برای صفحه‌بندی keyset
+    روی (transaction_date, id)؛ ایندکس‌های جدید جایگزین ایندکس‌های قبلی هستند
+    """
+    # دیتابیسی که با create_all ساخته شده ایندکس‌های جدید را از قبل دارد
+    op.create_index('ix_transaction_date_id', 'inventory_transactions', ['transaction_date', 'id'],
+                    if_not_exists=True)
+    op.create_index(
+        'ix_transaction_warehouse_date_id', 'inventory_transactions',
+        ['warehouse_id', 'transaction_date', 'id'],
+        if_not_exists=True
+    )
+    # ix_transaction_date با create_all اولیه ساخته شده و ممکن است در همه دیتابیس‌ها نباشد
+    op.execute("DROP INDEX IF EXISTS ix_transaction_date")
+    op.execute("DROP INDEX IF EXISTS ix_transaction_warehouse_date")
+
+    print("✅ ایندکس‌های keyset تراکنش‌ها ایجاد شد")
+
+
+def downgrade() -> None:
+    """
+    حذف تغییرات در صورت نیاز به بازگشت
+    """
+    op.create_index('ix_transaction_date', 'inventory_transactions', ['transaction_date'])
+    op.create_index(
+        'ix_transaction_warehouse_date', 'inventory_transactions',
+        ['warehouse_id', 'transaction_date']
+    )
+    op.drop_index('ix_transaction_warehouse_date_id', table_name='inventory_transactions')
+    op.drop_index('ix_transaction_date_id', table_name='inventory_transactions')
+
+    print("⚠️ ایندکس‌های keyset تراکنش‌ها حذف شد")
@@ -0,0 +1,139 @@
+"""partition_inventory_transactions
+
+Revision ID: b5d7f9a1c3e6
+Revises: a3c5e7b9d1f4
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d7f9a1c3e6'
+down_revision: Union[str, None] = 'a3c5e7b9d1f4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# تعداد ماه‌های آینده که پارتیشن آن‌ها از پیش ساخته می‌شود
+MONTHS_AHEAD = 3
+
+
+def _create_monthly_partitions(source_table: str) -> None:
+    """پارتیشن هر ماه از قدیمی‌ترین تراکنش source_table تا MONTHS_AHEAD ماه آینده"""
+    op.execute(f"""
+        DO $$
+        DECLARE
+            month_start date := date_trunc('month', COALESCE(
+                (SELECT MIN(transaction_date) FROM {source_table}), now()
+            ))::date;
+            last_month date := (date_trunc('month', now()) + interval '{MONTHS_AHEAD} months')::date;
+        BEGIN
+            WHILE month_start <= last_month LOOP
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF inventory_transactions '
+                    'FOR VALUES FROM (%L) TO (%L)',
+                    'inventory_transactions_' || to_char(month_start, 'YYYYMM'),
+                    month_start, (month_start + interval '1 month')::date
+                );
+                month_start := (month_start + interval '1 month')::date;
+            END LOOP;
+        END
+        $$
+    """)
+
+
+def upgrade() -> None:
+    """
+    تبدیل inventory_transactions به جدول پارتیشن‌بندی‌شده ماهانه روی transaction_date
+    - جدول فعلی به inventory_transactions_legacy تغییر نام می‌دهد
+    - جدول والد با همان ستون‌ها و sequence شناسه ساخته می‌شود؛ کلید اصلی (id, transaction_date)
+    - برای هر ماه از قدیمی‌ترین تراکنش تا MONTHS_AHEAD ماه آینده یک پارتیشن ساخته می‌شود
+    - داده‌ها منتقل و جدول قدیمی حذف می‌شود
+    پارتیشن‌های ماه‌های بعد را WarehouseService.ensure_transaction_partitions می‌سازد.
+    """
+    # دیتابیسی که با create_all ساخته شده جدول والد پارتیشن‌بندی‌شده و ایندکس‌ها را از قبل دارد؛
+    # فقط پارتیشن‌ها ساخته می‌شوند
+    already_partitioned = op.get_bind().execute(sa.text("""
+        SELECT 1 FROM pg_partitioned_table p
+        JOIN pg_class c ON c.oid = p.partrelid
+        WHERE c.relname = 'inventory_transactions' AND c.relnamespace = 'public'::regnamespace
+    """)).scalar()
+    if already_partitioned:
+        _create_monthly_partitions('inventory_transactions')
+        print("ℹ️ جدول inventory_transactions از قبل پارتیشن‌بندی شده است؛ پارتیشن‌های ماهانه ساخته شد")
+        return
+
+    op.execute("ALTER TABLE inventory_transactions RENAME TO inventory_transactions_legacy")
+    op.execute(
+        "ALTER TABLE inventory_transactions_legacy "
+        "RENAME CONSTRAINT inventory_transactions_pkey TO inventory_transactions_legacy_pkey"
+    )
+    for index_name in ('ix_transaction_date_id', 'ix_transaction_reference', 'ix_transaction_warehouse_date_id'):
+        op.execute(f"DROP INDEX IF EXISTS {index_name}")
+    # sequence شناسه نباید همراه جدول قدیمی حذف شود
+    op.execute("ALTER SEQUENCE inventory_transactions_id_seq OWNED BY NONE")
+
+    op.execute("""
+        CREATE TABLE inventory_transactions (
+            LIKE inventory_transactions_legacy INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+            PRIMARY KEY (id, transaction_date),
+            FOREIGN KEY (warehouse_id) REFERENCES warehouses (id),
+            FOREIGN KEY (inventory_item_id) REFERENCES inventory_items (id)
+        ) PARTITION BY RANGE (transaction_date)
+    """)
+    op.execute("ALTER SEQUENCE inventory_transactions_id_seq OWNED BY inventory_transactions.id")
+
+    _create_monthly_partitions('inventory_transactions_legacy')
+
+    op.execute("INSERT INTO inventory_transactions SELECT * FROM inventory_transactions_legacy")
+    op.drop_table('inventory_transactions_legacy')
+
+    # ایندکس‌های والد روی همه پارتیشن‌ها (فعلی و آینده) ساخته می‌شوند
+    op.create_index('ix_transaction_date_id', 'inventory_transactions', ['transaction_date', 'id'])
+    op.create_index('ix_transaction_reference', 'inventory_transactions', ['reference_type', 'reference_id'])
+    op.create_index(
+        'ix_transaction_warehouse_date_id', 'inventory_transactions',
+        ['warehouse_id', 'transaction_date', 'id']
+    )
+    op.execute("ANALYZE inventory_transactions")
+
+    print("✅ جدول inventory_transactions به پارتیشن‌های ماهانه تبدیل شد")
+
+
+def downgrade() -> None:
+    """
+    حذف تغییرات در صورت نیاز به بازگشت
+    (پارتیشن‌های جداشده و بایگانی‌شده به جدول برنمی‌گردند)
+    """
+    op.execute("ALTER TABLE inventory_transactions RENAME TO inventory_transactions_partitioned")
+    for index_name in ('ix_transaction_date_id', 'ix_transaction_reference', 'ix_transaction_warehouse_date_id'):
+        op.execute(f"DROP INDEX IF EXISTS {index_name}")
+    op.execute(
+        "ALTER TABLE inventory_transactions_partitioned "
+        "RENAME CONSTRAINT inventory_transactions_pkey TO inventory_transactions_partitioned_pkey"
+    )
+    op.execute("ALTER SEQUENCE inventory_transactions_id_seq OWNED BY NONE")
+
+    op.execute("""
+        CREATE TABLE inventory_transactions (
+            LIKE inventory_transactions_partitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+            PRIMARY KEY (id),
+            FOREIGN KEY (warehouse_id) REFERENCES warehouses (id),
+            FOREIGN KEY (inventory_item_id) REFERENCES inventory_items (id)
+        )
+    """)
+    op.execute("ALTER SEQUENCE inventory_transactions_id_seq OWNED BY inventory_transactions.id")
+    op.execute("INSERT INTO inventory_transactions SELECT * FROM inventory_transactions_partitioned")
+    op.execute("DROP TABLE inventory_transactions_partitioned CASCADE")
+
+    op.create_index('ix_transaction_date_id', 'inventory_transactions', ['transaction_date', 'id'])
+    op.create_index('ix_transaction_reference', 'inventory_transactions', ['reference_type', 'reference_id'])
+    op.create_index(
+        'ix_transaction_warehouse_date_id', 'inventory_transactions',
+        ['warehouse_id', 'transaction_date', 'id']
+    )
+
+    print("⚠️ پارتیشن‌بندی inventory_transactions حذف شد")
@@ -0,0 +1,71 @@
+"""add_iso_file_contents
+
+Revision ID: b5e7a1c3d9f2
+Revises: 9a4d2c6e8f13
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e7a1c3d9f2'
+down_revision: Union[str, None] = '9a4d2c6e8f13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    ایجاد جدول iso_file_contents برای جستجو در متن جدول عنوان PDFها
+    - ستون tsvector تولیدشده با ایندکس GIN برای جستجوی کلمه‌ای
+    - ایندکس trigram روی متن نرمال‌شده برای جستجوی شماره خط با LIKE
+    """
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # دیتابیسی که با create_all ساخته شده جدول و ایندکس tsvector را از قبل دارد
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('iso_file_contents'):
+        op.create_table(
+            'iso_file_contents',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('iso_file_id', sa.Integer(),
+                      sa.ForeignKey('iso_file_index.id', ondelete='CASCADE'),
+                      nullable=False, unique=True),
+            sa.Column('content_text', sa.Text()),
+            sa.Column('normalized_text', sa.Text()),
+            sa.Column('source_mtime', sa.DateTime()),
+            sa.Column('extracted_at', sa.DateTime(), server_default=sa.func.now()),
+            sa.Column('error', sa.String()),
+            sa.Column(
+                'search_vector',
+                postgresql.TSVECTOR(),
+                sa.Computed("to_tsvector('simple', coalesce(content_text, ''))", persisted=True)
+            ),
+        )
+
+        op.create_index('ix_iso_content_search_vector', 'iso_file_contents',
+                        ['search_vector'], postgresql_using='gin')
+
+    # ایندکس trigram را create_all نمی‌سازد
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_iso_content_normalized_trgm ON iso_file_contents "
+        "USING gin (normalized_text gin_trgm_ops)"
+    )
+
+    print("✅ جدول iso_file_contents با ایندکس‌های GIN ایجاد شد")
+
+
+def downgrade() -> None:
+    """
+    حذف تغییرات در صورت نیاز به بازگشت
+    """
+    op.execute("DROP INDEX IF EXISTS ix_iso_content_normalized_trgm")
+    op.drop_index('ix_iso_content_search_vector', table_name='iso_file_contents')
+    op.drop_table('iso_file_contents')
+
+    print("⚠️ جدول iso_file_contents حذف شد")
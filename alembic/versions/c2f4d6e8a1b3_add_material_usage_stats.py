@@ -0,0 +1,72 @@
+"""add_material_usage_stats
+
+Revision ID: c2f4d6e8a1b3
+Revises: b5e7a1c3d9f2
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2f4d6e8a1b3'
+down_revision: Union[str, None] = 'b5e7a1c3d9f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    ایجاد جدول material_usage_stats (شمارنده روزانه انتخاب آیتم‌ها)
+    و پر کردن آن از 30 روز اخیر material_search_history
+    """
+    # دیتابیسی که با create_all ساخته شده جدول را از قبل دارد و برنامه شمارنده‌ها را
+    # از همان زمان پر کرده است؛ پر کردن دوباره از تاریخچه شمارش را دو برابر می‌کند
+    inspector = sa.inspect(op.get_bind())
+    if inspector.has_table('material_usage_stats'):
+        print("ℹ️ جدول material_usage_stats از قبل وجود دارد")
+        return
+
+    op.create_table(
+        'material_usage_stats',
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.String(100), nullable=False),
+        sa.Column('item_code', sa.String(100), nullable=False),
+        sa.Column('bucket_date', sa.Date(), nullable=False),
+        sa.Column('usage_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('project_id', 'user_id', 'item_code', 'bucket_date'),
+    )
+    op.create_index('idx_usage_stats_bucket', 'material_usage_stats', ['bucket_date'])
+
+    # سه سطح: (پروژه، کاربر)، (پروژه، همه)، (همه، کاربر)
+    levels = [
+        ("COALESCE(project_id, 0)", "user_id"),
+        ("COALESCE(project_id, 0)", "'*'"),
+        ("0", "user_id"),
+    ]
+    for project_expr, user_expr in levels:
+        op.execute(f"""
+            INSERT INTO material_usage_stats (project_id, user_id, item_code, bucket_date, usage_count)
+            SELECT {project_expr}, {user_expr}, selected_item_code, timestamp::date, COUNT(*)
+            FROM material_search_history
+            WHERE selected_item_code IS NOT NULL
+              AND timestamp >= CURRENT_DATE - INTERVAL '30 days'
+            GROUP BY 1, 2, 3, 4
+            ON CONFLICT (project_id, user_id, item_code, bucket_date)
+            DO UPDATE SET usage_count = material_usage_stats.usage_count + EXCLUDED.usage_count
+        """)
+
+    print("✅ جدول material_usage_stats ایجاد و از تاریخچه 30 روز اخیر پر شد")
+
+
+def downgrade() -> None:
+    """
+    حذف تغییرات در صورت نیاز به بازگشت
+    """
+    op.drop_index('idx_usage_stats_bucket', table_name='material_usage_stats')
+    op.drop_table('material_usage_stats')
+
+    print("⚠️ جدول material_usage_stats حذف شد")
@@ -0,0 +1,40 @@
+"""add_reservation_expiry_index
+
+Revision ID: c7e9b1d3f5a8
+Revises: b5d7f9a1c3e6
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e9b1d3f5a8'
+down_revision: Union[str, None] = 'b5d7f9a1c3e6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    ایندکس (status, expiry_date) برای پیدا کردن دسته‌ای رزروهای فعال منقضی‌شده
+    """
+    op.create_index(
+        'ix_reservation_status_expiry', 'material_reservations',
+        ['status', 'expiry_date'],
+        if_not_exists=True  # دیتابیس ساخته‌شده با create_all ایندکس را از قبل دارد
+    )
+
+    print("✅ ایندکس ix_reservation_status_expiry ایجاد شد")
+
+
+def downgrade() -> None:
+    """
+    حذف تغییرات در صورت نیاز به بازگشت
+    """
+    op.drop_index('ix_reservation_status_expiry', table_name='material_reservations')
+
+    print("⚠️ ایندکس ix_reservation_status_expiry حذف شد")
@@ -0,0 +1,75 @@
+"""add_id_sequences
+
+Revision ID: d8b3f5a7c9e1
+Revises: c2f4d6e8a1b3
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8b3f5a7c9e1'
+down_revision: Union[str, None] = 'c2f4d6e8a1b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    ایجاد sequenceهای تولید شناسه
+    - spool_id_seq: ادامه از بزرگ‌ترین شناسه عددی موجود (SNNN)
+    - sequence شماره رزرو ماه جاری: ادامه از بزرگ‌ترین شماره همان ماه
+      (ماه‌های بعد هنگام اولین رزرو ساخته می‌شوند)
+    """
+    op.execute("CREATE SEQUENCE IF NOT EXISTS spool_id_seq")
+    # sequence ممکن است از قبل با create_all ساخته و استفاده شده باشد؛ فقط رو به جلو
+    op.execute("""
+        SELECT setval('spool_id_seq', existing.max_no)
+        FROM (
+            SELECT MAX(CAST(substring(spool_id FROM 2) AS INTEGER)) AS max_no
+            FROM spools WHERE spool_id ~ '^S[0-9]+$'
+        ) existing
+        WHERE existing.max_no >= (SELECT last_value FROM spool_id_seq)
+    """)
+
+    op.execute("""
+        DO $$
+        DECLARE
+            period text := to_char(now(), 'YYYYMM');
+            last_no integer;
+        BEGIN
+            SELECT COALESCE(MAX(CAST(substring(reservation_no FROM '[0-9]+$') AS INTEGER)), 0)
+              INTO last_no
+              FROM material_reservations
+             WHERE reservation_no LIKE 'RES-' || period || '-%';
+            EXECUTE format('CREATE SEQUENCE IF NOT EXISTS %I START WITH %s',
+                           'reservation_no_seq_' || period, last_no + 1);
+        END $$;
+    """)
+
+    print("✅ sequenceهای شناسه اسپول و شماره رزرو ایجاد شدند")
+
+
+def downgrade() -> None:
+    """
+    حذف تغییرات در صورت نیاز به بازگشت
+    """
+    op.execute("""
+        DO $$
+        DECLARE
+            seq record;
+        BEGIN
+            FOR seq IN SELECT sequencename FROM pg_sequences
+                        WHERE sequencename LIKE 'reservation\\_no\\_seq\\_%'
+            LOOP
+                EXECUTE format('DROP SEQUENCE IF EXISTS %I', seq.sequencename);
+            END LOOP;
+        END $$;
+    """)
+    op.execute("DROP SEQUENCE IF EXISTS spool_id_seq")
+
+    print("⚠️ sequenceهای شناسه اسپول و شماره رزرو حذف شدند")
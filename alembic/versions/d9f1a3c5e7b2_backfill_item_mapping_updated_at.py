@@ -0,0 +1,40 @@
+"""backfill_item_mapping_updated_at
+
+Revision ID: d9f1a3c5e7b2
+Revises: c7e9b1d3f5a8
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9f1a3c5e7b2'
+down_revision: Union[str, None] = 'c7e9b1d3f5a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    پر کردن updated_at خالی قوانین تطبیق (از created_at یا زمان فعلی UTC)
+    همگام‌سازی افزایشی کش قوانین با updated_at >= watermark ردیف‌های NULL را نمی‌بیند
+    """
+    op.execute("""
+        UPDATE item_mappings
+        SET updated_at = COALESCE(created_at, timezone('utc', now()))
+        WHERE updated_at IS NULL
+    """)
+
+    print("✅ updated_at خالی item_mappings پر شد")
+
+
+def downgrade() -> None:
+    """
+    حذف تغییرات در صورت نیاز به بازگشت
+    (مقادیر پرشده قابل تشخیص نیستند و باقی می‌مانند)
+    """
+    print("⚠️ بازگشت backfill updated_at نیازی به تغییر داده ندارد")
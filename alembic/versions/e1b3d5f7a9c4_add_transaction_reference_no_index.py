@@ -0,0 +1,40 @@
+"""add_transaction_reference_no_index
+
+Revision ID: e1b3d5f7a9c4
+Revises: d9f1a3c5e7b2
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1b3d5f7a9c4'
+down_revision: Union[str, None] = 'd9f1a3c5e7b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    ایندکس (reference_type, reference_no) برای رد کردن رسید تکراری در ورود گروهی
+    """
+    op.create_index(
+        'ix_transaction_reference_no', 'inventory_transactions',
+        ['reference_type', 'reference_no'],
+        if_not_exists=True  # دیتابیس ساخته‌شده با create_all ایندکس را از قبل دارد
+    )
+
+    print("✅ ایندکس ix_transaction_reference_no ایجاد شد")
+
+
+def downgrade() -> None:
+    """
+    حذف تغییرات در صورت نیاز به بازگشت
+    """
+    op.drop_index('ix_transaction_reference_no', table_name='inventory_transactions')
+
+    print("⚠️ ایندکس ix_transaction_reference_no حذف شد")
@@ -0,0 +1,60 @@
+"""add_transaction_warehouse_date_index
+
+Revision ID: e4a6c8b0d2f5
+Revises: d8b3f5a7c9e1
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a6c8b0d2f5'
+down_revision: Union[str, None] = 'd8b3f5a7c9e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    ایندکس (warehouse_id, transaction_date) برای بازپخش دفتر تراکنش‌ها
+    از نزدیک‌ترین نقطه بازبینی در ارزش‌گذاری تاریخی، و ستون kind در
+    warehouse_stock_snapshots برای جدا کردن نقاط بازبینی از snapshotهای وضعیت
+    """
+    op.create_index(
+        'ix_transaction_warehouse_date', 'inventory_transactions',
+        ['warehouse_id', 'transaction_date']
+    )
+
+    # دیتابیسی که با create_all ساخته شده ستون را از قبل دارد
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name'] for column in inspector.get_columns('warehouse_stock_snapshots')}
+    if 'kind' not in columns:
+        op.add_column('warehouse_stock_snapshots',
+            sa.Column('kind', sa.String(length=20), nullable=False, server_default='STATE')
+        )
+    # نقاط بازبینی قبلی با created_by = 'LEDGER_CHECKPOINT' علامت‌گذاری شده بودند
+    op.execute(
+        "UPDATE warehouse_stock_snapshots SET kind = 'LEDGER_CHECKPOINT' "
+        "WHERE created_by = 'LEDGER_CHECKPOINT'"
+    )
+    op.create_index(
+        'ix_snapshot_warehouse_kind_date', 'warehouse_stock_snapshots',
+        ['warehouse_id', 'kind', 'snapshot_date'], if_not_exists=True
+    )
+
+    print("✅ ایندکس ix_transaction_warehouse_date و ستون kind در warehouse_stock_snapshots ایجاد شد")
+
+
+def downgrade() -> None:
+    """
+    حذف تغییرات در صورت نیاز به بازگشت
+    """
+    op.drop_index('ix_snapshot_warehouse_kind_date', table_name='warehouse_stock_snapshots')
+    op.drop_column('warehouse_stock_snapshots', 'kind')
+    op.drop_index('ix_transaction_warehouse_date', table_name='inventory_transactions')
+
+    print("⚠️ ایندکس ix_transaction_warehouse_date و ستون kind از warehouse_stock_snapshots حذف شد")
@@ -0,0 +1,87 @@
+"""add_low_stock_flag
+
+Revision ID: f2b4d6a8c0e3
+Revises: e4a6c8b0d2f5
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b4d6a8c0e3'
+down_revision: Union[str, None] = 'e4a6c8b0d2f5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    پرچم موجودی کم روی inventory_items:
+    - ستون محاسبه‌شده is_low_stock و ایندکس جزئی روی ردیف‌های پرچم‌دار
+    - trigger که فقط هنگام تغییر پرچم (ورود به/خروج از حالت موجودی کم)
+      روی کانال low_stock اعلان NOTIFY می‌فرستد
+    """
+    # دیتابیسی که با create_all ساخته شده ستون و ایندکس را از قبل دارد (trigger را نه)
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name'] for column in inspector.get_columns('inventory_items')}
+    if 'is_low_stock' not in columns:
+        op.add_column(
+            'inventory_items',
+            sa.Column(
+                'is_low_stock', sa.Boolean(),
+                sa.Computed('available_qty <= min_stock_level', persisted=True)
+            )
+        )
+    op.create_index(
+        'ix_inventory_items_low_stock', 'inventory_items',
+        ['warehouse_id', 'material_code'],
+        postgresql_where=sa.text('is_low_stock'),
+        if_not_exists=True
+    )
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_low_stock_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' AND NEW.is_low_stock IS NOT DISTINCT FROM OLD.is_low_stock THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP = 'INSERT' AND NEW.is_low_stock IS NOT TRUE THEN
+                RETURN NULL;
+            END IF;
+            PERFORM pg_notify('low_stock', json_build_object(
+                'id', NEW.id,
+                'warehouse_id', NEW.warehouse_id,
+                'material_code', NEW.material_code,
+                'available_qty', NEW.available_qty,
+                'min_stock_level', NEW.min_stock_level,
+                'is_low_stock', COALESCE(NEW.is_low_stock, false)
+            )::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("DROP TRIGGER IF EXISTS trg_inventory_items_low_stock ON inventory_items")
+    op.execute("""
+        CREATE TRIGGER trg_inventory_items_low_stock
+        AFTER INSERT OR UPDATE OF physical_qty, reserved_qty, available_qty, min_stock_level
+        ON inventory_items
+        FOR EACH ROW EXECUTE FUNCTION notify_low_stock_change()
+    """)
+
+    print("✅ پرچم موجودی کم، ایندکس جزئی و trigger اعلان ایجاد شد")
+
+
+def downgrade() -> None:
+    """
+    حذف تغییرات در صورت نیاز به بازگشت
+    """
+    op.execute("DROP TRIGGER IF EXISTS trg_inventory_items_low_stock ON inventory_items")
+    op.execute("DROP FUNCTION IF EXISTS notify_low_stock_change()")
+    op.drop_index('ix_inventory_items_low_stock', table_name='inventory_items')
+    op.drop_column('inventory_items', 'is_low_stock')
+
+    print("⚠️ پرچم موجودی کم و trigger اعلان حذف شد")
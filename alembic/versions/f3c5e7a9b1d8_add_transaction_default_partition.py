@@ -0,0 +1,62 @@
+"""add_transaction_default_partition
+
+Revision ID: f3c5e7a9b1d8
+Revises: e1b3d5f7a9c4
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3c5e7a9b1d8'
+down_revision: Union[str, None] = 'e1b3d5f7a9c4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    پارتیشن DEFAULT برای inventory_transactions
+    تراکنش ماهی که پارتیشنش هنوز ساخته نشده به جای خطای درج در DEFAULT می‌ماند و
+    WarehouseService.ensure_transaction_partitions آن را به پارتیشن ماه منتقل می‌کند.
+    """
+    partitioned = op.get_bind().execute(sa.text("""
+        SELECT 1 FROM pg_partitioned_table p
+        JOIN pg_class c ON c.oid = p.partrelid
+        WHERE c.relname = 'inventory_transactions' AND c.relnamespace = 'public'::regnamespace
+    """)).scalar()
+    if not partitioned:
+        print("ℹ️ جدول inventory_transactions پارتیشن‌بندی نشده است؛ پارتیشن DEFAULT لازم نیست")
+        return
+
+    op.execute(
+        "CREATE TABLE IF NOT EXISTS inventory_transactions_default "
+        "PARTITION OF inventory_transactions DEFAULT"
+    )
+
+    print("✅ پارتیشن inventory_transactions_default ایجاد شد")
+
+
+def downgrade() -> None:
+    """
+    حذف تغییرات در صورت نیاز به بازگشت
+    (اگر ردیفی در DEFAULT مانده باشد ابتدا باید با ensure_transaction_partitions منتقل شود)
+    """
+    op.execute("""
+        DO $$
+        BEGIN
+            IF to_regclass('inventory_transactions_default') IS NOT NULL THEN
+                IF EXISTS (SELECT 1 FROM inventory_transactions_default) THEN
+                    RAISE EXCEPTION 'inventory_transactions_default خالی نیست';
+                END IF;
+                DROP TABLE inventory_transactions_default;
+            END IF;
+        END
+        $$
+    """)
+
+    print("⚠️ پارتیشن inventory_transactions_default حذف شد")
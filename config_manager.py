@@ -23,4 +23,31 @@ DB_PASSWORD = config.get('PostgreSQL', 'password', fallback='').strip()
 ISO_PATH = config.get('Paths', 'iso_drawing_path', fallback=r'\\fs\Piping\Piping\ISO').strip()
 DASHBOARD_PASSWORD = config.get('Security', 'dashboard_password', fallback='default_password').strip()
 
+# --- تنظیمات پایش مسیر ISO ---
+ISO_SCAN_MODE = config.get('ISOScanner', 'mode', fallback='watchdog').strip().lower()
+ISO_POLL_INTERVAL_WORK = config.getint('ISOScanner', 'poll_interval_work_sec', fallback=120)
+ISO_POLL_INTERVAL_IDLE = config.getint('ISOScanner', 'poll_interval_idle_sec', fallback=900)
+ISO_WORK_HOURS_START = config.getint('ISOScanner', 'work_hours_start', fallback=7)
+ISO_WORK_HOURS_END = config.getint('ISOScanner', 'work_hours_end', fallback=19)
+ISO_SCAN_BATCH_SIZE = config.getint('ISOScanner', 'batch_size', fallback=5000)
+ISO_CONTENT_INDEXING = config.getboolean('ISOScanner', 'content_indexing', fallback=False)
+ISO_CONTENT_WORKERS = config.getint('ISOScanner', 'content_workers', fallback=0) or None
+
+# --- تنظیمات تطبیق آیتم‌ها ---
+MATCHING_INDEX_DIR = (
+    config.get('Matching', 'index_dir', fallback='').strip()
+    or os.path.join(os.path.expanduser('~'), '.miv_tracker', 'matching')
+)
+MATCHING_SEMANTIC_MODEL = config.get('Matching', 'semantic_model_path', fallback='').strip()
+MATCHING_SEMANTIC_BATCH_SIZE = config.getint('Matching', 'semantic_batch_size', fallback=64)
+MATCHING_STAGES = tuple(
+    stage.strip().upper()
+    for stage in config.get('Matching', 'stages', fallback='RULE_BASED, SYNONYM, TFIDF, SEMANTIC, FUZZY').split(',')
+    if stage.strip()
+)
+MATCHING_STAGE_BUDGET_MS = config.getint('Matching', 'stage_budget_ms', fallback=150)
+MATCHING_PARALLEL_STAGES = config.getboolean('Matching', 'parallel_stages', fallback=True)
+MATCHING_HISTORY_FLUSH_EVERY = config.getint('Matching', 'history_flush_every', fallback=200)
+MATCHING_HISTORY_FLUSH_SECONDS = config.getfloat('Matching', 'history_flush_seconds', fallback=2.0)
+
 
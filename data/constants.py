@@ -13,3 +13,14 @@ SPOOL_TYPE_MAPPING = {
     "PIPE": ("PIPE", "PIP"),
     # در صورت اضافه شدن انواع جدید، اینجا اضافه کنید
 }
+
+# کارهای پس‌زمینه‌ای که فقط یک کلاینت (رهبر) باید اجرا کند
+# کلید: نام کار (ورودی قفل advisory)، مقدار: عنوان قابل نمایش
+BACKGROUND_JOBS = {
+    "iso_indexing": "ایندکس فایل‌های ISO",
+    "warehouse_snapshot": "Snapshot انبار",
+    "reservation_expiry": "انقضای رزروها",
+}
+
+# فضای نام قفل‌های advisory این برنامه (کلید اول در pg_try_advisory_lock(int, int))
+JOB_LOCK_NAMESPACE = 7401
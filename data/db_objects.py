@@ -0,0 +1,92 @@
+# file: data/db_objects.py
+"""
+نصب idempotent اشیای دیتابیسی که Base.metadata.create_all نمی‌سازد
+(extension، ایندکس‌های غیر ORM، trigger و ...).
+برنامه پیش از اجرای migrationها create_all را صدا می‌زند؛ دیتابیسی که فقط
+با create_all ساخته شده باید همین اشیا را داشته باشد. اجرای دوباره بی‌اثر است
+و هر مورد در تراکنش جداگانه نصب می‌شود تا خطای یکی (مثلاً نبود دسترسی
+CREATE EXTENSION) بقیه را متوقف نکند.
+"""
+
+import logging
+from typing import Callable, List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from data.id_sequences import reseed_spool_sequence
+
+
+def ensure_iso_content_trgm_index(conn: Connection) -> None:
+    """ایندکس trigram متن نرمال‌شده ISO برای جستجوی شماره خط با LIKE"""
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_iso_content_normalized_trgm ON iso_file_contents "
+        "USING gin (normalized_text gin_trgm_ops)"
+    ))
+
+
+def seed_spool_id_sequence(conn: Connection) -> None:
+    """
+    spool_id_seq ساخته‌شده با create_all از 1 شروع می‌شود؛
+    ادامه از بزرگ‌ترین شناسه اسپول موجود (فقط رو به جلو)
+    """
+    reseed_spool_sequence(conn)
+
+
+def ensure_low_stock_trigger(conn: Connection) -> None:
+    """
+    trigger اعلان NOTIFY موجودی کم روی inventory_items (هم‌ارز migration f2b4d6a8c0e3).
+    فقط اگر trigger وجود نداشته باشد ساخته می‌شود تا هر شروع برنامه قفل جدول نگیرد.
+    """
+    exists = conn.execute(text("""
+        SELECT 1 FROM pg_trigger
+        WHERE tgname = 'trg_inventory_items_low_stock'
+          AND tgrelid = to_regclass('inventory_items')
+    """)).scalar()
+    if exists:
+        return
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION notify_low_stock_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' AND NEW.is_low_stock IS NOT DISTINCT FROM OLD.is_low_stock THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP = 'INSERT' AND NEW.is_low_stock IS NOT TRUE THEN
+                RETURN NULL;
+            END IF;
+            PERFORM pg_notify('low_stock', json_build_object(
+                'id', NEW.id,
+                'warehouse_id', NEW.warehouse_id,
+                'material_code', NEW.material_code,
+                'available_qty', NEW.available_qty,
+                'min_stock_level', NEW.min_stock_level,
+                'is_low_stock', COALESCE(NEW.is_low_stock, false)
+            )::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER trg_inventory_items_low_stock
+        AFTER INSERT OR UPDATE OF physical_qty, reserved_qty, available_qty, min_stock_level
+        ON inventory_items
+        FOR EACH ROW EXECUTE FUNCTION notify_low_stock_change()
+    """))
+
+
+INSTALLERS: List[Callable[[Connection], None]] = [
+    ensure_iso_content_trgm_index,
+    seed_spool_id_sequence,
+    ensure_low_stock_trigger,
+]
+
+
+def install_database_objects(engine: Engine) -> None:
+    """اجرای همه نصب‌کننده‌ها؛ خطاها فقط لاگ می‌شوند"""
+    for installer in INSTALLERS:
+        try:
+            with engine.begin() as conn:
+                installer(conn)
+        except Exception as e:
+            logging.error(f"خطا در نصب اشیای دیتابیس ({installer.__name__}): {e}")
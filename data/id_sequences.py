@@ -0,0 +1,112 @@
+# file: data/id_sequences.py
+"""
+تخصیص شماره‌های یکتا با sequenceهای PostgreSQL
+- شماره رزرو: RES-YYYYMM-NNNNN با یک sequence جداگانه برای هر ماه
+- شناسه اسپول: SNNN با sequence سراسری spool_id_seq
+nextval داخل همان تراکنش درج فراخوانی می‌شود؛ دو تراکنش هم‌زمان هرگز شماره
+یکسان نمی‌گیرند (شماره‌های تراکنش‌های rollback شده فقط فاصله ایجاد می‌کنند)
+"""
+
+import logging
+import threading
+from datetime import datetime
+from typing import List, Optional, Union
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+SPOOL_ID_SEQUENCE = "spool_id_seq"
+RESERVATION_SEQUENCE_PREFIX = "reservation_no_seq_"
+
+_known_sequences = set()
+_known_lock = threading.Lock()
+
+
+def reservation_period(now: Optional[datetime] = None) -> str:
+    """دوره شماره رزرو (YYYYMM)"""
+    return (now or datetime.now()).strftime('%Y%m')
+
+
+def reservation_sequence_name(period: str) -> str:
+    return f"{RESERVATION_SEQUENCE_PREFIX}{period}"
+
+
+def format_reservation_no(period: str, number: int) -> str:
+    return f"RES-{period}-{number:05d}"
+
+
+def format_spool_id(number: int) -> str:
+    return f"S{number:03d}"
+
+
+def next_values(session: Session, sequence_name: str, count: int = 1) -> List[int]:
+    """گرفتن count مقدار از sequence در یک رفت‌وبرگشت (به ترتیب صعودی)"""
+    if count <= 0:
+        return []
+    rows = session.execute(
+        text("SELECT nextval(CAST(:name AS regclass)) FROM generate_series(1, :count)"),
+        {'name': sequence_name, 'count': count}
+    ).fetchall()
+    return sorted(row[0] for row in rows)
+
+
+def ensure_reservation_sequence(session: Session, period: str) -> str:
+    """
+    ساخت sequence ماه در صورت نبود؛ مقدار شروع بعد از بزرگ‌ترین شماره موجود همان ماه است.
+    ساخت در اتصال و تراکنش جداگانه انجام می‌شود تا تراکنش درج را درگیر DDL نکند.
+    """
+    name = reservation_sequence_name(period)
+    with _known_lock:
+        if name in _known_sequences:
+            return name
+
+    engine = session.get_bind()
+    with engine.connect() as conn:
+        exists = conn.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar()
+        if not exists:
+            last_no = conn.execute(text("""
+                SELECT COALESCE(MAX(CAST(substring(reservation_no FROM '[0-9]+$') AS INTEGER)), 0)
+                FROM material_reservations
+                WHERE reservation_no LIKE :pattern
+            """), {'pattern': f"RES-{period}-%"}).scalar()
+            try:
+                conn.execute(text(f'CREATE SEQUENCE IF NOT EXISTS "{name}" START WITH {int(last_no) + 1}'))
+                conn.commit()
+            except DBAPIError as e:
+                # کلاینت دیگری هم‌زمان همین sequence را ساخته است
+                conn.rollback()
+                logging.info(f"sequence {name} هم‌زمان ساخته شد: {e.orig}")
+
+    with _known_lock:
+        _known_sequences.add(name)
+    return name
+
+
+def allocate_reservation_nos(session: Session, count: int = 1, now: Optional[datetime] = None) -> List[str]:
+    """تخصیص count شماره رزرو ماه جاری داخل تراکنش جاری"""
+    period = reservation_period(now)
+    name = ensure_reservation_sequence(session, period)
+    return [format_reservation_no(period, n) for n in next_values(session, name, count)]
+
+
+def allocate_spool_ids(session: Session, count: int = 1) -> List[str]:
+    """تخصیص count شناسه اسپول جدید"""
+    return [format_spool_id(n) for n in next_values(session, SPOOL_ID_SEQUENCE, count)]
+
+
+def reseed_spool_sequence(session: Union[Session, Connection]) -> None:
+    """
+    جلو بردن spool_id_seq تا بعد از بزرگ‌ترین شناسه عددی موجود (SNNN)؛
+    برای وقتی که شناسه‌ها خارج از sequence (import دستی/CSV) درج شده‌اند.
+    sequence هرگز به عقب برنمی‌گردد.
+    """
+    session.execute(text(f"""
+        SELECT setval(CAST(:name AS regclass), existing.max_no)
+        FROM (
+            SELECT MAX(CAST(substring(spool_id FROM 2) AS INTEGER)) AS max_no
+            FROM spools WHERE spool_id ~ '^S[0-9]+$'
+        ) existing
+        WHERE existing.max_no >= (SELECT last_value FROM {SPOOL_ID_SEQUENCE})
+    """), {'name': SPOOL_ID_SEQUENCE})
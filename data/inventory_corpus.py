@@ -0,0 +1,155 @@
+# file: data/inventory_corpus.py
+"""
+corpus فشرده و درون‌حافظه‌ای موجودی انبار برای امتیازدهی برداری
+- فقط ستون‌های لازم برای تطبیق (کد، شرح، سایز) به صورت حروف بزرگ نگه داشته می‌شوند
+- کلمات شرح از پیش مرتب می‌شوند تا مقایسه ساده ratio مستقل از ترتیب کلمات باشد
+  (معادل token_sort_ratio بدون هزینه مرتب‌سازی در هر جستجو)
+- به‌روزرسانی افزایشی بر اساس updated_at؛ در صورت حذف ردیف‌ها بارگذاری کامل
+- برای هر انبار یک برش (slice) جداگانه ساخته و کش می‌شود
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, NamedTuple
+
+import numpy as np
+from sqlalchemy import func
+
+from models import InventoryItem, Warehouse
+
+
+def sort_tokens(text: Optional[str]) -> str:
+    """حروف بزرگ و مرتب‌سازی کلمات: 'LR ELBOW 90' -> '90 ELBOW LR'"""
+    return " ".join(sorted((text or "").upper().split()))
+
+
+class CorpusSlice(NamedTuple):
+    """برش corpus برای یک انبار (یا کل انبارها)"""
+    ids: np.ndarray          # شناسه InventoryItem
+    codes: List[str]         # material_code با حروف بزرگ
+    descriptions: List[str]  # description با حروف بزرگ و کلمات مرتب‌شده
+    sizes: np.ndarray        # size با حروف بزرگ (dtype=object برای مقایسه برداری)
+    code_positions: Dict[str, List[int]]  # material_code -> موقعیت ردیف‌ها (تطبیق دقیق بدون اسکن)
+
+
+class InventoryCorpus:
+    """نگهداری corpus موجودی و به‌روزرسانی افزایشی آن"""
+
+    def __init__(self, session_factory, refresh_seconds: int = 60):
+        """
+        Args:
+            session_factory: سازنده Session دیتابیس
+            refresh_seconds: حداقل فاصله بین دو بررسی تغییرات در دیتابیس
+        """
+        self.session_factory = session_factory
+        self.refresh_seconds = refresh_seconds
+
+        # ردیف‌ها: {item_id: (warehouse_id, code, description, size)}
+        self._rows: Dict[int, tuple] = {}
+        self._warehouse_ids: Dict[str, int] = {}
+        self._slices: Dict[Optional[int], CorpusSlice] = {}
+        self._max_updated_at: Optional[datetime] = None
+        self._last_check = 0.0
+        self._version = 0
+        self._lock = threading.RLock()
+
+    @property
+    def version(self) -> int:
+        """شماره نسخه corpus؛ با هر تغییر داده افزایش می‌یابد"""
+        return self._version
+
+    def get_slice(self, warehouse_id: Optional[int] = None) -> CorpusSlice:
+        """برش corpus برای یک انبار (None = همه انبارها)"""
+        with self._lock:
+            self._refresh_if_stale()
+            cached = self._slices.get(warehouse_id)
+            if cached is not None:
+                return cached
+
+            ids, codes, descriptions, sizes = [], [], [], []
+            code_positions = defaultdict(list)
+            for item_id, (wh_id, code, description, size) in self._rows.items():
+                if warehouse_id is not None and wh_id != warehouse_id:
+                    continue
+                code_positions[code].append(len(ids))
+                ids.append(item_id)
+                codes.append(code)
+                descriptions.append(description)
+                sizes.append(size)
+
+            corpus_slice = CorpusSlice(
+                ids=np.asarray(ids, dtype=np.int64),
+                codes=codes,
+                descriptions=descriptions,
+                sizes=np.asarray(sizes, dtype=object),
+                code_positions=dict(code_positions),
+            )
+            self._slices[warehouse_id] = corpus_slice
+            return corpus_slice
+
+    def resolve_warehouse_id(self, warehouse_code: Optional[str]) -> Optional[int]:
+        """تبدیل کد انبار به شناسه بدون کوئری جداگانه"""
+        if not warehouse_code:
+            return None
+        with self._lock:
+            self._refresh_if_stale()
+            return self._warehouse_ids.get(warehouse_code)
+
+    def invalidate(self) -> None:
+        """اجبار به بررسی تغییرات در فراخوانی بعدی"""
+        with self._lock:
+            self._last_check = 0.0
+
+    # ================== بارگذاری ==================
+
+    def _refresh_if_stale(self) -> None:
+        now = time.monotonic()
+        if self._version and now - self._last_check < self.refresh_seconds:
+            return
+        self._last_check = now
+
+        session = self.session_factory()
+        try:
+            self._warehouse_ids = dict(session.query(Warehouse.code, Warehouse.id).all())
+
+            db_count = session.query(func.count(InventoryItem.id)).scalar() or 0
+            query = session.query(
+                InventoryItem.id, InventoryItem.warehouse_id, InventoryItem.material_code,
+                InventoryItem.description, InventoryItem.size, InventoryItem.updated_at
+            )
+            incremental = self._max_updated_at is not None and db_count >= len(self._rows)
+            if incremental:
+                query = query.filter(InventoryItem.updated_at > self._max_updated_at)
+            else:
+                self._rows = {}
+
+            changed = 0
+            for item_id, wh_id, code, description, size, updated_at in query.yield_per(5000):
+                self._rows[item_id] = (
+                    wh_id,
+                    (code or "").upper(),
+                    sort_tokens(description),
+                    (size or "").upper(),
+                )
+                if updated_at and (self._max_updated_at is None or updated_at > self._max_updated_at):
+                    self._max_updated_at = updated_at
+                changed += 1
+
+            # ردیف‌های بدون updated_at یا حذف‌شده فقط با بارگذاری کامل دیده می‌شوند
+            if incremental and len(self._rows) != db_count:
+                self._max_updated_at = None
+                self._last_check = 0.0
+                self._refresh_if_stale()
+                return
+
+            if changed or not incremental:
+                self._slices = {}
+                self._version += 1
+                logging.info(f"corpus موجودی به‌روز شد: {changed} ردیف تغییر، {len(self._rows)} ردیف کل")
+        except Exception as e:
+            logging.error(f"خطا در بارگذاری corpus موجودی: {e}")
+        finally:
+            session.close()
@@ -0,0 +1,50 @@
+# file: data/iso_content_extractor.py
+"""
+استخراج متن صفحه اول PDFهای ISO (جدول عنوان) برای جستجوی محتوایی
+- از کتابخانه pure-Python به نام pypdf استفاده می‌شود (وابستگی اختیاری)
+- توابع این ماژول در پروسه‌های ProcessPoolExecutor اجرا می‌شوند؛ بنابراین
+  باید در سطح ماژول تعریف شده و فقط داده ساده (قابل pickle) برگردانند
+"""
+
+import os
+import time
+import logging
+from typing import Optional, Tuple
+
+try:
+    from pypdf import PdfReader
+    PDF_SUPPORT = True
+except ImportError:
+    PdfReader = None
+    PDF_SUPPORT = False
+
+# سقف طول متن ذخیره‌شده؛ جدول عنوان معمولاً چند صد کاراکتر است
+MAX_CONTENT_CHARS = 20000
+
+
+def extract_first_page_text(file_path: str) -> Tuple[str, Optional[str], Optional[str], int, float]:
+    """
+    استخراج متن صفحه اول یک فایل PDF.
+    :return: (file_path, text, error, file_size, elapsed_seconds)
+    """
+    started = time.perf_counter()
+    try:
+        file_size = os.path.getsize(file_path)
+    except OSError:
+        file_size = 0
+
+    if not PDF_SUPPORT:
+        return file_path, None, "pypdf نصب نیست", file_size, 0.0
+
+    # pypdf برای فایل‌های ناقص هشدارهای زیادی لاگ می‌کند
+    logging.getLogger("pypdf").setLevel(logging.ERROR)
+    try:
+        reader = PdfReader(file_path, strict=False)
+        if reader.is_encrypted:
+            reader.decrypt("")
+        if not reader.pages:
+            return file_path, "", None, file_size, time.perf_counter() - started
+        text = reader.pages[0].extract_text() or ""
+        return file_path, text[:MAX_CONTENT_CHARS], None, file_size, time.perf_counter() - started
+    except Exception as e:
+        return file_path, None, str(e)[:500], file_size, time.perf_counter() - started
@@ -0,0 +1,169 @@
+# file: data/iso_polling_scanner.py
+"""
+اسکنر دوره‌ای مسیر ISO (حالت polling)
+روی مسیرهای شبکه (SMB) رویدادهای watchdog گم یا دیر می‌شوند؛ در این حالت
+مسیر به صورت دوره‌ای با os.scandir پیمایش شده و فقط با مقایسه stat
+(mtime و size) با ایندکس دیتابیس همگام می‌شود.
+اسکن در یک پروسه جداگانه اجرا می‌شود تا با event loop رابط Qt رقابت نکند.
+"""
+
+import os
+import time
+import logging
+import multiprocessing
+from datetime import datetime
+from typing import Callable, Dict, Optional, Set, Tuple, Iterable
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+SUPPORTED_EXTENSIONS = (".pdf", ".dwg")
+
+
+def scan_iso_tree(
+    base_dir: str,
+    extensions: Iterable[str] = SUPPORTED_EXTENSIONS,
+    should_stop: Optional[Callable[[], bool]] = None
+) -> Tuple[Dict[str, Tuple[float, int]], Set[str]]:
+    """
+    پیمایش بازگشتی مسیر و برگرداندن ({file_path: (mtime, size)}, پوشه‌های ناخوانا).
+    os.scandir اطلاعات stat را از همان پاسخ لیست پوشه برمی‌گرداند و
+    روی SMB به ازای هر فایل درخواست جداگانه نمی‌فرستد.
+    پوشه‌هایی که خواندنشان خطا داد برگردانده می‌شوند تا فایل‌های زیر آن‌ها
+    به اشتباه حذف‌شده تلقی نشوند (مثلاً قطع لحظه‌ای SMB).
+    با should_stop پیمایش بین پوشه‌ها متوقف می‌شود (نتیجه ناقص است و نباید همگام شود).
+    """
+    extensions = tuple(ext.lower() for ext in extensions)
+    stats = {}
+    failed_dirs = set()
+    stack = [base_dir]
+    while stack:
+        if should_stop and should_stop():
+            break
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.name.lower().endswith(extensions):
+                            st = entry.stat()
+                            stats[entry.path] = (st.st_mtime, st.st_size)
+                    except OSError:
+                        continue
+        except OSError as e:
+            logging.warning(f"خطا در خواندن پوشه {current}: {e}")
+            failed_dirs.add(current)
+    return stats, failed_dirs
+
+
+class IsoPollingScanner(multiprocessing.Process):
+    """پروسه اسکن دوره‌ای مسیر ISO و همگام‌سازی دسته‌ای با ایندکس"""
+
+    def __init__(
+        self,
+        db_url: str,
+        base_dir: str,
+        status_queue: multiprocessing.Queue,
+        interval_work: int = 120,
+        interval_idle: int = 900,
+        work_hours: Tuple[int, int] = (7, 19),
+        batch_size: int = 2000,
+        content_indexing: bool = False,
+        content_workers: int = None
+    ):
+        """
+        Args:
+            db_url: آدرس کامل اتصال دیتابیس (پروسه فرزند engine خودش را می‌سازد)
+            base_dir: مسیر ریشه فایل‌های ISO
+            status_queue: صف ارسال پیام وضعیت به رابط کاربری (level, message)
+            interval_work: فاصله اسکن در ساعات کاری (ثانیه)
+            interval_idle: فاصله اسکن خارج از ساعات کاری (ثانیه)
+            work_hours: (ساعت شروع، ساعت پایان) بازه کاری
+            batch_size: تعداد ردیف در هر دسته نوشتن
+            content_indexing: استخراج متن PDFهای جدید/تغییرکرده پس از هر همگام‌سازی
+            content_workers: تعداد workerهای استخراج متن (پروسه daemon است؛ استخراج در ترد انجام می‌شود)
+        """
+        super().__init__(daemon=True)
+        self.db_url = db_url
+        self.base_dir = base_dir
+        self.status_queue = status_queue
+        self.interval_work = interval_work
+        self.interval_idle = interval_idle
+        self.work_hours = work_hours
+        self.batch_size = batch_size
+        self.content_indexing = content_indexing
+        self.content_workers = content_workers
+        self.stop_event = multiprocessing.Event()
+
+    def stop(self, timeout: float = 5) -> None:
+        """درخواست توقف و انتظار برای پایان پروسه"""
+        self.stop_event.set()
+        self.join(timeout=timeout)
+        if self.is_alive():
+            self.terminate()
+
+    def current_interval(self, now: datetime = None) -> int:
+        """فاصله اسکن بعدی؛ در ساعات کاری (روزهای غیر جمعه) سریع‌تر"""
+        now = now or datetime.now()
+        start, end = self.work_hours
+        is_workday = now.weekday() != 4  # جمعه
+        if is_workday and start <= now.hour < end:
+            return self.interval_work
+        return self.interval_idle
+
+    def _emit(self, level: str, message: str) -> None:
+        try:
+            self.status_queue.put_nowait((level, message))
+        except Exception:
+            pass
+
+    def run(self) -> None:
+        # import داخل پروسه فرزند؛ روی ویندوز (spawn) ماژول‌ها دوباره بارگذاری می‌شوند
+        from data.iso_service import ISOService
+
+        engine = create_engine(self.db_url, pool_size=1, max_overflow=0)
+        iso_service = ISOService(sessionmaker(bind=engine))
+
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            try:
+                if not os.path.exists(self.base_dir):
+                    self._emit("error", f"خطا: مسیر ISO در دسترس نیست: {self.base_dir}")
+                else:
+                    disk_stats, failed_dirs = scan_iso_tree(self.base_dir)
+                    result = iso_service.reconcile_iso_index(
+                        disk_stats, batch_size=self.batch_size, failed_dirs=failed_dirs
+                    )
+                    if failed_dirs:
+                        self._emit(
+                            "warning",
+                            f"{len(failed_dirs)} پوشه ISO خوانده نشد؛ رکوردهای زیر آن‌ها حذف نشدند"
+                        )
+                    elapsed = time.monotonic() - started
+                    self._emit(
+                        "success",
+                        f"همگام‌سازی ISO کامل شد: {len(disk_stats)} فایل، "
+                        f"+{result['added']} ~{result['updated']} -{result['deleted']} "
+                        f"({elapsed:.1f} ثانیه)"
+                    )
+                    # ایندکس محتوایی بعد از ایندکس نام فایل تا آن را معطل نکند
+                    if self.content_indexing:
+                        content = iso_service.index_iso_contents(
+                            max_workers=self.content_workers,
+                            should_stop=self.stop_event.is_set
+                        )
+                        if content['total']:
+                            self._emit(
+                                "info",
+                                f"متن {content['extracted']} فایل PDF استخراج شد "
+                                f"({content['files_per_sec']} فایل/ثانیه، {content['failed']} خطا)"
+                            )
+            except Exception as e:
+                logging.error(f"خطا در اسکن دوره‌ای ISO: {e}")
+                self._emit("error", f"خطا در اسکن دوره‌ای ISO: {e}")
+
+            self.stop_event.wait(self.current_interval())
+
+        engine.dispose()
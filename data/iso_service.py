@@ -1,14 +1,39 @@
 # file: data/iso_service.py
 import os
+import re
 import glob
+import time
 import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional, Callable, List
+from collections import defaultdict
+from typing import Optional, Callable, Iterable, List, Dict, Tuple, Any, NamedTuple
 
+from sqlalchemy import union, or_, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 
 from data.db_session import DBSessionManager
-from models import IsoFileIndex
+from data.iso_content_extractor import extract_first_page_text, PDF_SUPPORT
+from data.iso_polling_scanner import scan_iso_tree
+from models import IsoFileIndex, IsoFileContent, LineIsoFile, MTOItem, MIVRecord
+
+
+class IsoSearchResult(NamedTuple):
+    """ردیف سبک نتیجه جستجوی ISO برای نمایش در رابط کاربری"""
+    file_name: str
+    file_path: str
+    last_modified: Optional[datetime]
+    revision: Optional[str] = None
+    match_type: Optional[str] = None
+
+
+# مدت اعتبار cache خطوط برای رویدادهای تک‌فایل watchdog (ثانیه)
+LINE_LOOKUP_TTL = 60
+
+# الگوی ویرایش در نام فایل: REV-A، Rev.0، R1
+_REVISION_PATTERN = re.compile(r'(?:REV|(?<=[^A-Z0-9])R)[\s._-]*([A-Z]|\d{1,2})(?![A-Z0-9])')
 
 
 class ISOService:
@@ -22,6 +47,7 @@ class ISOService:
         session_getter: Callable[[], Session] = DBSessionManager.get_session
     ):
         self._session_getter = session_getter
+        self._line_lookup_cache: Optional[Tuple[float, Dict[str, List[Tuple[int, str, str, str]]]]] = None
 
     # ------------------------------------------------------------------
     # find_iso_files
@@ -42,8 +68,9 @@ class ISOService:
     # ------------------------------------------------------------------
     def upsert_iso_index_entry(self, file_path: str, session: Optional[Session] = None) -> None:
         """
-        اضافه یا به‌روزرسانی رکورد اندیس ISO در دیتابیس.
-        اگر رکورد موجود با همان مسیر باشد، اطلاعات آن به‌روزرسانی می‌شود.
+        اضافه یا به‌روزرسانی رکورد اندیس ISO در دیتابیس (رویدادهای watchdog).
+        اگر رکورد موجود با همان مسیر باشد، اطلاعات آن به‌روزرسانی و نگاشت
+        خطوط آن (line_iso_files) دوباره ساخته می‌شود.
         """
         own_session = False
         if session is None:
@@ -51,26 +78,10 @@ class ISOService:
             own_session = True
 
         try:
-            filename = os.path.basename(file_path)
-            prefix_key = self._extract_prefix_key(filename)
-            last_modified = datetime.fromtimestamp(os.path.getmtime(file_path))
-
-            existing = (
-                session.query(IsoFileIndex)
-                .filter(IsoFileIndex.file_path == file_path)
-                .first()
-            )
-
-            if existing:
-                existing.prefix_key = prefix_key
-                existing.last_modified = last_modified
-            else:
-                new_entry = IsoFileIndex(
-                    file_path=file_path,
-                    prefix_key=prefix_key,
-                    last_modified=last_modified
-                )
-                session.add(new_entry)
+            st = os.stat(file_path)
+            row = self._build_index_row(file_path, datetime.fromtimestamp(st.st_mtime), st.st_size)
+            # همان مسیر درج گروهی: normalized_name، file_size و نگاشت خطوط در یک تراکنش
+            self._upsert_index_rows(session, [row], self._get_cached_line_lookup(session))
 
             if own_session:
                 session.commit()
@@ -119,12 +130,18 @@ class ISOService:
     # ------------------------------------------------------------------
     # rebuild_iso_index_from_scratch
     # ------------------------------------------------------------------
-    def rebuild_iso_index_from_scratch(self, base_directory: str, pattern: str = "*.pdf") -> None:
+    def rebuild_iso_index_from_scratch(
+        self,
+        base_directory: str,
+        batch_size: int = 5000,
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> int:
         """
         بازسازی کامل اندیس ISO:
         1. پاک کردن همه رکوردها
-        2. پیدا کردن تمام فایل‌ها در مسیر
-        3. افزودن هر مسیر فایل به دیتابیس
+        2. پیمایش بازگشتی مسیر (PDF و DWG)
+        3. درج گروهی رکوردها (INSERT ... ON CONFLICT)
+        :return: تعداد فایل‌های ایندکس شده
         """
         session = self._session_getter()
         try:
@@ -133,21 +150,563 @@ class ISOService:
             session.commit()
 
             # مرحله 2: جستجوی فایل‌ها
-            files = self.find_iso_files(base_directory, pattern=pattern)
+            disk_stats, failed_dirs = scan_iso_tree(base_directory)
+            if failed_dirs:
+                logging.warning(f"{len(failed_dirs)} پوشه در بازسازی ایندکس ISO خوانده نشد")
 
             # مرحله 3: درج مجدد
-            for f in files:
-                self.upsert_iso_index_entry(f, session=session)
+            rows = [
+                self._build_index_row(path, datetime.fromtimestamp(mtime), size)
+                for path, (mtime, size) in disk_stats.items()
+            ]
+            self._apply_index_changes(session, rows, [], batch_size, progress_callback)
+            return len(rows)
+
+        except Exception as e:
+            session.rollback()
+            logging.error(f"خطا در rebuild_iso_index_from_scratch: {e}")
+            raise
+        finally:
+            session.close()
+
+    # ------------------------------------------------------------------
+    # index_iso_directory
+    # ------------------------------------------------------------------
+    def index_iso_directory(
+        self,
+        base_directory: str,
+        batch_size: int = 5000,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        should_stop: Optional[Callable[[], bool]] = None
+    ) -> Dict[str, int]:
+        """
+        ایندکس‌سازی اولیه (افزایشی) یک مسیر: یک پیمایش دیسک، یک SELECT از ایندکس
+        و نوشتن گروهی فقط فایل‌های جدید/تغییرکرده/حذف‌شده.
+        نگاشت خطوط فقط برای همین فایل‌ها ساخته می‌شود؛ بازسازی کامل نگاشت (مثلاً بعد از
+        ورود خطوط جدید MTO) عملیات نگهداری جداگانه rebuild_line_iso_mapping است.
+        :param should_stop: تابعی که با برگرداندن True کار را بین دسته‌ها متوقف می‌کند
+                            (نتیجه با 'cancelled': True برمی‌گردد)
+        """
+        disk_stats, failed_dirs = scan_iso_tree(base_directory, should_stop=should_stop)
+        if should_stop and should_stop():
+            # اسکن ناقص نباید به حذف رکوردها منجر شود
+            return {'added': 0, 'updated': 0, 'deleted': 0, 'total': 0, 'line_mappings': 0, 'cancelled': True}
+        result = self.reconcile_iso_index(
+            disk_stats, batch_size, progress_callback, failed_dirs, should_stop=should_stop
+        )
+        result['total'] = len(disk_stats)
+        return result
+
+    # ------------------------------------------------------------------
+    # reconcile_iso_index
+    # ------------------------------------------------------------------
+    def reconcile_iso_index(
+        self,
+        disk_stats: Dict[str, Tuple[float, int]],
+        batch_size: int = 2000,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        failed_dirs: Iterable[str] = (),
+        should_stop: Optional[Callable[[], bool]] = None
+    ) -> Dict[str, int]:
+        """
+        همگام‌سازی ایندکس با وضعیت دیسک بر اساس مقایسه stat (mtime و size).
+        :param disk_stats: {file_path: (mtime, size)} حاصل از اسکن مسیر
+        :param progress_callback: تابع (پردازش‌شده، کل) که بعد از هر دسته فراخوانی می‌شود
+        :param failed_dirs: پوشه‌هایی که اسکن نتوانست بخواند؛ رکوردهای زیر آن‌ها حذف نمی‌شوند
+        :param should_stop: توقف بین دسته‌های نوشتن (دسته‌های commit شده باقی می‌مانند)
+        :return: تعداد رکوردهای اضافه، به‌روز و حذف شده، 'line_mappings' (نگاشت‌های
+                 ساخته‌شده برای فایل‌های اضافه/به‌روز شده) و 'cancelled'
+        """
+        session = self._session_getter()
+        try:
+            db_records = session.query(
+                IsoFileIndex.file_path,
+                IsoFileIndex.last_modified,
+                IsoFileIndex.file_size
+            ).all()
+            db_map = {path: (last_mod, size) for path, last_mod, size in db_records}
+
+            rows_to_upsert = []
+            added = updated = 0
+            for file_path, (mtime, size) in disk_stats.items():
+                last_modified = datetime.fromtimestamp(mtime)
+                existing = db_map.pop(file_path, None)
+                if existing is None:
+                    added += 1
+                elif existing == (last_modified, size):
+                    continue
+                else:
+                    updated += 1
+                rows_to_upsert.append(self._build_index_row(file_path, last_modified, size))
+
+            # فایل‌های زیر پوشه‌های ناخوانا ممکن است هنوز وجود داشته باشند
+            skipped_prefixes = tuple(d.rstrip('\\/') + os.sep for d in failed_dirs)
+            paths_to_delete = [
+                path for path in db_map
+                if not (skipped_prefixes and path.startswith(skipped_prefixes))
+            ]
+            completed, line_mappings = self._apply_index_changes(
+                session, rows_to_upsert, paths_to_delete, batch_size, progress_callback, should_stop
+            )
+
+            return {
+                'added': added, 'updated': updated, 'deleted': len(paths_to_delete),
+                'line_mappings': line_mappings, 'cancelled': not completed
+            }
+
+        except Exception as e:
+            session.rollback()
+            logging.error(f"خطا در reconcile_iso_index: {e}")
+            raise
+        finally:
+            session.close()
+
+    def _build_index_row(self, file_path: str, last_modified: datetime, file_size: Optional[int]) -> Dict[str, Any]:
+        """ساخت دیکشنری یک رکورد ایندکس برای درج گروهی"""
+        filename = os.path.basename(file_path)
+        return {
+            'file_path': file_path,
+            'normalized_name': self._normalize_line_key(filename),
+            'prefix_key': self._extract_prefix_key(filename),
+            'last_modified': last_modified,
+            'file_size': file_size,
+        }
+
+    def _apply_index_changes(
+        self,
+        session: Session,
+        rows_to_upsert: List[Dict[str, Any]],
+        paths_to_delete: List[str],
+        batch_size: int,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        should_stop: Optional[Callable[[], bool]] = None
+    ) -> Tuple[bool, int]:
+        """
+        اعمال تغییرات ایندکس به صورت دسته‌ای (INSERT ... ON CONFLICT و DELETE ... IN)
+        :return: (False اگر با should_stop پیش از پایان متوقف شد، تعداد نگاشت‌های خط ساخته‌شده)
+        """
+        total = len(rows_to_upsert) + len(paths_to_delete)
+        done = 0
+        line_mappings = 0
+        line_lookup = self._load_line_lookup(session) if rows_to_upsert else {}
+
+        for i in range(0, len(paths_to_delete), batch_size):
+            if should_stop and should_stop():
+                return False, line_mappings
+            session.query(IsoFileIndex).filter(
+                IsoFileIndex.file_path.in_(paths_to_delete[i:i + batch_size])
+            ).delete(synchronize_session=False)
+            session.commit()
+            done += len(paths_to_delete[i:i + batch_size])
+            if progress_callback:
+                progress_callback(done, total)
+
+        for i in range(0, len(rows_to_upsert), batch_size):
+            if should_stop and should_stop():
+                return False, line_mappings
+            line_mappings += self._upsert_index_rows(session, rows_to_upsert[i:i + batch_size], line_lookup)
+            session.commit()
+            done += len(rows_to_upsert[i:i + batch_size])
+            if progress_callback:
+                progress_callback(done, total)
+        return True, line_mappings
+
+    def _upsert_index_rows(
+        self,
+        session: Session,
+        rows: List[Dict[str, Any]],
+        line_lookup: Dict[str, List[Tuple[int, str, str, str]]]
+    ) -> int:
+        """
+        درج/به‌روزرسانی یک دسته رکورد ایندکس و نگاشت خطوط آن‌ها (بدون commit)
+        :return: تعداد ردیف‌های نگاشت درج‌شده
+        """
+        stmt = pg_insert(IsoFileIndex).values(rows)
+        stmt = stmt.on_conflict_do_update(
+                index_elements=[IsoFileIndex.file_path],
+                set_={
+                    'normalized_name': stmt.excluded.normalized_name,
+                    'prefix_key': stmt.excluded.prefix_key,
+                    'last_modified': stmt.excluded.last_modified,
+                    'file_size': stmt.excluded.file_size,
+                }
+            ).returning(
+                IsoFileIndex.id, IsoFileIndex.file_path,
+                IsoFileIndex.normalized_name, IsoFileIndex.last_modified
+            )
+        indexed = session.execute(stmt).all()
+        # نگاشت خطوط در همان تراکنش دسته (رکوردهای line_iso_files حذف‌شده با CASCADE پاک می‌شوند)
+        return self._map_files_to_lines(session, indexed, line_lookup)
+
+    # ------------------------------------------------------------------
+    # line_iso_files: نگاشت خط ↔ فایل ISO
+    # ------------------------------------------------------------------
+    def get_iso_files_for_line(self, project_id: int, line_no: str) -> List[IsoSearchResult]:
+        """
+        فایل‌های ISO یک خط از نگاشت پیش‌محاسبه‌شده (یک کوئری ایندکس‌شده)،
+        آخرین ویرایش در ابتدا.
+        """
+        session = self._session_getter()
+        try:
+            rows = (
+                session.query(
+                    LineIsoFile.file_path, LineIsoFile.last_modified,
+                    LineIsoFile.revision, LineIsoFile.match_type
+                )
+                .filter(LineIsoFile.project_id == project_id, LineIsoFile.line_no == line_no)
+                .order_by(LineIsoFile.revision_rank.desc(), LineIsoFile.last_modified.desc())
+                .all()
+            )
+            return [
+                IsoSearchResult(os.path.basename(path), path, last_mod, revision, match_type)
+                for path, last_mod, revision, match_type in rows
+            ]
+        except Exception as e:
+            logging.error(f"خطا در get_iso_files_for_line({project_id}, {line_no}): {e}")
+            return []
+        finally:
+            session.close()
+
+    def search_iso_index(self, pattern: str, limit: int = 200) -> List[IsoSearchResult]:
+        """جستجوی مستقیم در ایندکس بر اساس بخشی از نام نرمال‌شده فایل"""
+        norm = self._normalize_line_key(pattern)
+        if not norm:
+            return []
+        session = self._session_getter()
+        try:
+            rows = (
+                session.query(IsoFileIndex.file_path, IsoFileIndex.last_modified)
+                .filter(IsoFileIndex.normalized_name.like(f"%{norm}%"))
+                .order_by(IsoFileIndex.last_modified.desc())
+                .limit(limit)
+                .all()
+            )
+            return [
+                IsoSearchResult(os.path.basename(path), path, last_mod, self._extract_revision(os.path.basename(path))[0])
+                for path, last_mod in rows
+            ]
+        except Exception as e:
+            logging.error(f"خطا در search_iso_index: {e}")
+            return []
+        finally:
+            session.close()
+
+    def rebuild_line_iso_mapping(self, batch_size: int = 5000) -> int:
+        """
+        بازسازی کامل نگاشت خط ↔ فایل (عملیات نگهداری، مثلاً بعد از ورود خطوط جدید MTO).
+        همه فایل‌های ایندکس در یک تراکنش دوباره نگاشت می‌شوند؛ در ایندکس افزایشی اجرا نمی‌شود.
+        :return: تعداد ردیف‌های نگاشت ایجاد شده
+        """
+        session = self._session_getter()
+        try:
+            line_lookup = self._load_line_lookup(session)
+            session.query(LineIsoFile).delete(synchronize_session=False)
+
+            created = 0
+            last_id = 0
+            while True:
+                batch = (
+                    session.query(
+                        IsoFileIndex.id, IsoFileIndex.file_path,
+                        IsoFileIndex.normalized_name, IsoFileIndex.last_modified
+                    )
+                    .filter(IsoFileIndex.id > last_id)
+                    .order_by(IsoFileIndex.id)
+                    .limit(batch_size)
+                    .all()
+                )
+                if not batch:
+                    break
+                created += self._map_files_to_lines(session, batch, line_lookup)
+                last_id = batch[-1][0]
 
             session.commit()
+            return created
+        except Exception as e:
+            session.rollback()
+            logging.error(f"خطا در rebuild_line_iso_mapping: {e}")
+            raise
+        finally:
+            session.close()
+
+    def _get_cached_line_lookup(self, session: Session) -> Dict[str, List[Tuple[int, str, str, str]]]:
+        """lookup خطوط با cache کوتاه‌مدت تا رگبار رویدادهای تک‌فایل هر بار همه خطوط را نخواند"""
+        now = time.monotonic()
+        if self._line_lookup_cache is None or now - self._line_lookup_cache[0] > LINE_LOOKUP_TTL:
+            self._line_lookup_cache = (now, self._load_line_lookup(session))
+        return self._line_lookup_cache[1]
+
+    def _load_line_lookup(self, session: Session) -> Dict[str, List[Tuple[int, str, str, str]]]:
+        """
+        تمام خطوط پروژه‌ها (MTO و MIV) گروه‌بندی‌شده بر اساس 6 رقم شماره خط:
+        {'210001': [(project_id, line_no, normalized_key, prefix_key), ...]}
+        """
+        lines_query = union(
+            session.query(MTOItem.project_id, MTOItem.line_no).distinct().statement,
+            session.query(MIVRecord.project_id, MIVRecord.line_no).distinct().statement,
+        )
+        lookup = defaultdict(list)
+        for project_id, line_no in session.execute(lines_query):
+            norm = self._normalize_line_key(line_no)
+            m = re.search(r'\d{6}', norm)
+            if not m:
+                continue
+            lookup[m.group(0)].append((project_id, line_no, norm, self._extract_prefix_key(line_no)))
+        return lookup
+
+    def _map_files_to_lines(
+        self,
+        session: Session,
+        indexed_rows,
+        line_lookup: Dict[str, List[Tuple[int, str, str, str]]]
+    ) -> int:
+        """
+        تعیین خطوط هر فایل ایندکس‌شده و جایگزینی ردیف‌های line_iso_files آن‌ها.
+        :param indexed_rows: (id, file_path, normalized_name, last_modified)
+        :return: تعداد ردیف‌های درج‌شده
+        """
+        if not indexed_rows:
+            return 0
+
+        file_ids = [row[0] for row in indexed_rows]
+        session.query(LineIsoFile).filter(
+            LineIsoFile.iso_file_id.in_(file_ids)
+        ).delete(synchronize_session=False)
+
+        mappings = []
+        for file_id, file_path, normalized_name, last_modified in indexed_rows:
+            if not normalized_name or not line_lookup:
+                continue
+            # همه پنجره‌های 6 رقمی نام فایل (مستقل از جداکننده‌ها)
+            digit_keys = {
+                normalized_name[i:i + 6]
+                for i in range(len(normalized_name) - 5)
+                if normalized_name[i:i + 6].isdigit()
+            }
+            revision, revision_rank = self._extract_revision(os.path.basename(file_path))
+            seen = set()
+            for key in digit_keys:
+                for project_id, line_no, line_norm, line_prefix in line_lookup.get(key, ()):
+                    if (project_id, line_no) in seen:
+                        continue
+                    seen.add((project_id, line_no))
+                    if line_norm in normalized_name:
+                        match_type = 'FULL_KEY'
+                    elif line_prefix in normalized_name:
+                        match_type = 'PREFIX'
+                    else:
+                        match_type = 'DIGITS'
+                    mappings.append({
+                        'project_id': project_id,
+                        'line_no': line_no,
+                        'iso_file_id': file_id,
+                        'file_path': file_path,
+                        'revision': revision,
+                        'revision_rank': revision_rank,
+                        'match_type': match_type,
+                        'last_modified': last_modified,
+                    })
+
+        if mappings:
+            session.execute(pg_insert(LineIsoFile).values(mappings).on_conflict_do_nothing(
+                constraint='uq_line_iso_file'
+            ))
+        return len(mappings)
+
+    @staticmethod
+    def _extract_revision(filename: str) -> Tuple[Optional[str], int]:
+        """
+        استخراج ویرایش از نام فایل و رتبه مرتب‌سازی آن.
+        ویرایش‌های حرفی (A، B، ...) قبل از ویرایش‌های عددی (0، 1، ...) صادر می‌شوند.
+        """
+        name_no_ext = os.path.splitext(filename or "")[0].upper()
+        matches = _REVISION_PATTERN.findall(name_no_ext)
+        if not matches:
+            return None, 0
+        revision = matches[-1]
+        if revision.isdigit():
+            return revision, 100 + int(revision)
+        return revision, ord(revision) - ord('A') + 1
+
+    # ------------------------------------------------------------------
+    # iso_file_contents: جستجو در متن جدول عنوان PDFها
+    # ------------------------------------------------------------------
+    def index_iso_contents(
+        self,
+        max_workers: Optional[int] = None,
+        batch_size: int = 200,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        should_stop: Optional[Callable[[], bool]] = None
+    ) -> Dict[str, Any]:
+        """
+        استخراج افزایشی متن صفحه اول PDFها در یک Process Pool
+        (داخل پروسه daemon مانند IsoPollingScanner در یک Thread Pool؛ نگاه کنید به _content_executor).
+        فقط فایل‌هایی پردازش می‌شوند که متن ندارند یا mtime آن‌ها تغییر کرده است.
+        این متد مستقل از ایندکس نام فایل است و باید بعد از آن (در ترد/پروسه جدا) اجرا شود.
+
+        :param max_workers: تعداد پروسه‌ها (پیش‌فرض: تعداد هسته‌ها)
+        :param batch_size: تعداد فایل در هر دسته نوشتن در دیتابیس
+        :param should_stop: تابعی که با برگرداندن True پردازش را متوقف می‌کند
+        :return: {'total', 'extracted', 'failed', 'elapsed', 'files_per_sec', 'mb_per_sec'}
+        """
+        result = {'total': 0, 'extracted': 0, 'failed': 0, 'elapsed': 0.0,
+                  'files_per_sec': 0.0, 'mb_per_sec': 0.0}
+        if not PDF_SUPPORT:
+            logging.warning("pypdf نصب نیست؛ ایندکس محتوایی ISO غیرفعال است")
+            return result
+
+        session = self._session_getter()
+        try:
+            pending = (
+                session.query(IsoFileIndex.id, IsoFileIndex.file_path, IsoFileIndex.last_modified)
+                .outerjoin(IsoFileContent, IsoFileContent.iso_file_id == IsoFileIndex.id)
+                .filter(func.lower(IsoFileIndex.file_path).like('%.pdf'))
+                .filter(or_(
+                    IsoFileContent.id.is_(None),
+                    IsoFileContent.source_mtime.is_distinct_from(IsoFileIndex.last_modified)
+                ))
+                .all()
+            )
+        finally:
+            session.close()
+
+        total = len(pending)
+        result['total'] = total
+        if not total:
+            return result
+
+        meta = {path: (file_id, last_mod) for file_id, path, last_mod in pending}
+        started = time.perf_counter()
+        total_bytes = 0
+        buffer = []
+        done = 0
+
+        with self._content_executor(max_workers) as executor:
+            for path, text, error, file_size, _ in executor.map(
+                extract_first_page_text, list(meta), chunksize=8
+            ):
+                file_id, last_mod = meta[path]
+                total_bytes += file_size
+                if error:
+                    result['failed'] += 1
+                else:
+                    result['extracted'] += 1
+                buffer.append({
+                    'iso_file_id': file_id,
+                    'content_text': text,
+                    'normalized_text': self._normalize_line_key(text) if text else None,
+                    'source_mtime': last_mod,
+                    'extracted_at': datetime.now(),
+                    'error': error,
+                })
+                done += 1
+
+                if len(buffer) >= batch_size:
+                    self._write_content_rows(buffer)
+                    buffer = []
+                    if progress_callback:
+                        progress_callback(done, total)
+                    if should_stop and should_stop():
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        break
+
+        if buffer:
+            self._write_content_rows(buffer)
+            if progress_callback:
+                progress_callback(done, total)
+
+        elapsed = time.perf_counter() - started
+        result['elapsed'] = round(elapsed, 2)
+        if elapsed > 0:
+            result['files_per_sec'] = round(done / elapsed, 1)
+            result['mb_per_sec'] = round(total_bytes / (1024 * 1024) / elapsed, 2)
+        logging.info(
+            f"ایندکس محتوایی ISO: {done}/{total} فایل در {elapsed:.1f} ثانیه "
+            f"({result['files_per_sec']} فایل/ثانیه، {result['mb_per_sec']} MB/s، "
+            f"{result['failed']} خطا)"
+        )
+        return result
 
+    @staticmethod
+    def _content_executor(max_workers: Optional[int]) -> Executor:
+        """
+        پروسه daemon اجازه ساخت پروسه فرزند ندارد (AssertionError در ProcessPoolExecutor)؛
+        در آن حالت استخراج در Thread Pool انجام می‌شود.
+        """
+        if multiprocessing.current_process().daemon:
+            return ThreadPoolExecutor(max_workers=max_workers)
+        return ProcessPoolExecutor(max_workers=max_workers)
+
+    def _write_content_rows(self, rows: List[Dict[str, Any]]) -> None:
+        """درج یا به‌روزرسانی گروهی متن‌های استخراج‌شده"""
+        session = self._session_getter()
+        try:
+            stmt = pg_insert(IsoFileContent).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[IsoFileContent.iso_file_id],
+                set_={
+                    'content_text': stmt.excluded.content_text,
+                    'normalized_text': stmt.excluded.normalized_text,
+                    'source_mtime': stmt.excluded.source_mtime,
+                    'extracted_at': stmt.excluded.extracted_at,
+                    'error': stmt.excluded.error,
+                }
+            )
+            session.execute(stmt)
+            session.commit()
         except Exception as e:
             session.rollback()
-            logging.error(f"خطا در rebuild_iso_index_from_scratch: {e}")
+            logging.error(f"خطا در ذخیره متن فایل‌های ISO: {e}")
             raise
         finally:
             session.close()
 
+    def search_iso_contents(self, query: str, limit: int = 200) -> List[IsoSearchResult]:
+        """
+        جستجوی شماره خط (یا هر عبارت) در متن جدول عنوان PDFها.
+        شماره خط نرمال‌شده با ایندکس trigram و عبارت متنی با tsvector تطبیق داده می‌شود.
+        """
+        norm = self._normalize_line_key(query)
+        if not norm:
+            return []
+        session = self._session_getter()
+        try:
+            rows = (
+                session.query(IsoFileIndex.file_path, IsoFileIndex.last_modified)
+                .join(IsoFileContent, IsoFileContent.iso_file_id == IsoFileIndex.id)
+                .filter(or_(
+                    IsoFileContent.normalized_text.like(f"%{norm}%"),
+                    IsoFileContent.search_vector.op('@@')(func.plainto_tsquery('simple', query))
+                ))
+                .order_by(IsoFileIndex.last_modified.desc())
+                .limit(limit)
+                .all()
+            )
+            return [
+                IsoSearchResult(
+                    os.path.basename(path), path, last_mod,
+                    self._extract_revision(os.path.basename(path))[0], 'CONTENT'
+                )
+                for path, last_mod in rows
+            ]
+        except Exception as e:
+            logging.error(f"خطا در search_iso_contents: {e}")
+            return []
+        finally:
+            session.close()
+
+    # ------------------------------------------------------------------
+    # _normalize_line_key
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _normalize_line_key(text: str) -> str:
+        """
+        حذف کاراکترهای غیر مجاز و بزرگ کردن حروف (مشابه CSVService._normalize_line_key)
+        """
+        if not text:
+            return ""
+        return re.sub(r'[^A-Z0-9]+', '', text.upper())
+
     # ------------------------------------------------------------------
     # _extract_prefix_key
     # ------------------------------------------------------------------
@@ -161,6 +720,7 @@ class ISOService:
             return ""
         name_no_ext = os.path.splitext(filename)[0]
         # حذف فاصله‌ها و کاراکترهای خاص، تبدیل به حروف بزرگ
-        cleaned = "".join(ch for ch in name_no_ext.upper() if ch.isalnum())
-        # پیشوند پیش‌فرض 6 کاراکتر
-        return cleaned[:6]
+        cleaned = ISOService._normalize_line_key(name_no_ext)
+        # پیشوند تا انتهای اولین گروه 6 رقمی (مانند نسخه مونولیت)
+        m = re.search(r'(\d{6})', cleaned)
+        return cleaned[:m.end(1)] if m else cleaned
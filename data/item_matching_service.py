@@ -6,35 +6,135 @@
 - یادگیری از انتخاب‌های کاربر
 """
 
+import os
 import re
 import logging
-from typing import List, Dict, Any, Optional, Tuple
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from typing import List, Dict, Any, Optional, Tuple, Callable
 from datetime import datetime, timedelta
 from collections import defaultdict
 from difflib import SequenceMatcher
 
-from sqlalchemy import func, or_, and_, desc
-from sqlalchemy.orm import Session
+from sqlalchemy import func, or_, and_, desc, literal_column, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, joinedload
 
+from data.search_history_writer import SearchHistoryWriter
+from data.synonym_graph import SynonymGraph
 from models import (
-    ItemMapping, MaterialSearchHistory, MaterialSynonym,
-    InventoryItem, Warehouse, MTOItem
+    ItemMapping, MaterialSearchHistory, MaterialSynonym, MaterialUsageStat,
+    InventoryItem, Warehouse, MTOItem, MTOConsumption
 )
 
+try:
+    import numpy as np
+    from rapidfuzz import fuzz, process
+    from data.inventory_corpus import InventoryCorpus, sort_tokens
+    RAPIDFUZZ_SUPPORT = True
+except ImportError:
+    RAPIDFUZZ_SUPPORT = False
+
+try:
+    from data.tfidf_index import TfidfItemIndex
+    TFIDF_SUPPORT = True
+except ImportError:
+    TFIDF_SUPPORT = False
+
+try:
+    from data.semantic_index import SemanticItemIndex
+    SEMANTIC_INDEX_SUPPORT = True
+except ImportError:
+    SEMANTIC_INDEX_SUPPORT = False
+
+# حداقل امتیاز شباهت در تطبیق فازی
+FUZZY_MIN_CONFIDENCE = 0.5
+# حداقل شباهت کسینوسی در تطبیق TF-IDF
+TFIDF_MIN_SCORE = 0.35
+# حداقل شباهت کسینوسی embedding در تطبیق معنایی
+SEMANTIC_MIN_SCORE = 0.6
+# ترتیب پیش‌فرض مراحل pipeline تطبیق (پس از تطبیق دقیق)
+DEFAULT_MATCHING_STAGES = ('RULE_BASED', 'SYNONYM', 'TFIDF', 'SEMANTIC', 'FUZZY')
+# تعداد آیتم MTO در هر گذر ماتریسی تطبیق گروهی
+BULK_MATCH_CHUNK = 64
+
 
 class ItemMatchingService:
     """سرویس تطبیق هوشمند آیتم‌ها"""
 
-    def __init__(self, session_factory, activity_logger=None):
+    def __init__(
+            self,
+            session_factory,
+            activity_logger=None,
+            index_dir: str = None,
+            semantic_model_path: str = None,
+            semantic_batch_size: int = 64,
+            stage_budget_ms: int = 150,
+            parallel_stages: bool = True,
+            enabled_stages: Tuple[str, ...] = DEFAULT_MATCHING_STAGES,
+            history_flush_every: int = 200,
+            history_flush_seconds: float = 2.0
+    ):
         self.session_factory = session_factory
         self.log_activity = activity_logger
 
-        # کش قوانین تطبیق
+        # تنظیمات pipeline تطبیق
+        self.stage_budget_ms = stage_budget_ms
+        self.parallel_stages = parallel_stages
+        self.enabled_stages = set(enabled_stages)
+        self._stage_executor = ThreadPoolExecutor(
+            max_workers=len(DEFAULT_MATCHING_STAGES), thread_name_prefix="ItemMatchStage"
+        ) if parallel_stages else None
+
+        # شمارنده‌های روزانه استفاده (material_usage_stats): پنجره رتبه‌بندی و
+        # آخرین پاکسازی bucketهای قدیمی
+        self._usage_window_days = 30
+        self._usage_purged_on = None
+
+        # نوشتن تاریخچه جستجو خارج از مسیر جستجو (دسته‌ای، در ترد پس‌زمینه)
+        self._history_writer = SearchHistoryWriter(
+            session_factory,
+            flush_every=history_flush_every,
+            flush_seconds=history_flush_seconds
+        )
+
+        # کش قوانین تطبیق: {mapping_id: dict} به همراه ایندکس‌های دیکشنری
+        # بر اساس source_code نرمال‌شده و (source_code, source_size)
         self._mapping_cache = {}
-        self._synonym_cache = {}
+        self._mappings_by_source = {}
+        self._mappings_by_source_size = {}
+        self._mapping_max_updated_at = None
+        self._mapping_last_check = None
+        self._mapping_cache_stale = False
+        self._mapping_check_seconds = 60
+        self._mapping_refreshing = False
+        self._synonym_refreshing = False
+        self._cache_lock = threading.RLock()
+
+        # گراف مترادف‌ها (کلاس‌های هم‌ارزی با بستار تعدی)
+        self._synonym_graph = SynonymGraph()
         self._last_cache_update = None
         self._cache_ttl_minutes = 30
 
+        # corpus درون‌حافظه‌ای موجودی برای امتیازدهی برداری فازی
+        self._corpus = InventoryCorpus(session_factory) if RAPIDFUZZ_SUPPORT else None
+
+        # ایندکس TF-IDF شرح آیتم‌ها (روی دیسک، با mmap)
+        self._tfidf_index = None
+        if TFIDF_SUPPORT and index_dir:
+            self._tfidf_index = TfidfItemIndex(session_factory, os.path.join(index_dir, 'tfidf'))
+
+        # ایندکس معنایی اختیاری (فقط در صورت وجود مدل محلی)
+        self._semantic_index = None
+        if SEMANTIC_INDEX_SUPPORT and index_dir and semantic_model_path:
+            self._semantic_index = SemanticItemIndex(
+                session_factory, os.path.join(index_dir, 'semantic'),
+                semantic_model_path, batch_size=semantic_batch_size
+            )
+            if not self._semantic_index.available:
+                logging.warning(f"مدل معنایی در {semantic_model_path} یافت نشد؛ مرحله معنایی غیرفعال است")
+
     # ================== تطبیق اصلی ==================
 
     def find_matching_items(
@@ -53,63 +153,338 @@ class ItemMatchingService:
         Returns:
             لیست آیتم‌های منطبق به همراه امتیاز تطابق
         """
+        return self.find_matching_items_staged(
+            search_query, size, spec, warehouse_code, project_id, user_id, limit
+        )['items']
+
+    def find_matching_items_staged(
+            self,
+            search_query: str,
+            size: str = None,
+            spec: str = None,
+            warehouse_code: str = None,
+            project_id: int = None,
+            user_id: str = None,
+            limit: int = 10,
+            stage_budget_ms: int = None
+    ) -> Dict[str, Any]:
+        """
+        جستجوی هوشمند به صورت pipeline مرحله‌ای
+        - تطبیق دقیق اول اجرا می‌شود؛ اگر نتایج آن limit را پر کند بقیه مراحل اجرا نمی‌شوند
+        - مراحل مستقل (قانون، مترادف، TF-IDF، معنایی، فازی) هم‌زمان اجرا می‌شوند
+        - هر مرحله بودجه زمانی دارد؛ مرحله‌ای که به موقع تمام نشود کنار گذاشته
+          شده و نتیجه جزئی برگردانده می‌شود
+
+        Returns:
+            {'items': [...], 'timings': {stage: ms}, 'partial': bool,
+             'timed_out': [stages], 'skipped': [stages]}
+        """
+        budget = (stage_budget_ms or self.stage_budget_ms) / 1000.0
+        started = time.perf_counter()
+        timings, timed_out, skipped = {}, [], []
+
         session = self.session_factory()
         try:
-            results = []
+            # کش قوانین و گراف مترادف خارج از نشست‌های بودجه‌دار مراحل به‌روز می‌شوند
+            self._warm_caches(session)
 
             # 1. تطبیق دقیق (Exact Match)
-            exact_matches = self._find_exact_matches(
+            stage_started = time.perf_counter()
+            results = self._find_exact_matches(
                 session, search_query, size, spec, warehouse_code
             )
-            for item in exact_matches:
+            for item in results:
                 item['match_type'] = 'EXACT'
                 item['confidence'] = 1.0
-                results.append(item)
-
-            # 2. تطبیق بر اساس قوانین ذخیره شده
-            if len(results) < limit:
-                rule_matches = self._find_rule_based_matches(
-                    session, search_query, size, spec, warehouse_code
+            timings['EXACT'] = self._elapsed_ms(stage_started)
+
+            # 2. مراحل مستقل به ترتیب اولویت ادغام
+            stages = self._get_enabled_stages()
+            if len(results) >= limit:
+                skipped = [name for name, _ in stages]
+            elif self.parallel_stages and self._stage_executor is not None:
+                results = self._run_stages_parallel(
+                    stages, results, search_query, size, spec, warehouse_code,
+                    limit, budget, timings, timed_out, skipped
                 )
-                for item in rule_matches:
-                    if not self._is_duplicate(results, item):
-                        item['match_type'] = 'RULE_BASED'
-                        results.append(item)
-
-            # 3. تطبیق بر اساس مترادف‌ها
-            if len(results) < limit:
-                synonym_matches = self._find_synonym_matches(
-                    session, search_query, size, spec, warehouse_code
-                )
-                for item in synonym_matches:
-                    if not self._is_duplicate(results, item):
-                        item['match_type'] = 'SYNONYM'
-                        results.append(item)
-
-            # 4. تطبیق فازی (Fuzzy Match)
-            if len(results) < limit:
-                fuzzy_matches = self._find_fuzzy_matches(
-                    session, search_query, size, spec, warehouse_code,
-                    limit - len(results)
+            else:
+                results = self._run_stages_sequential(
+                    session, stages, results, search_query, size, spec, warehouse_code,
+                    limit, budget, timings, timed_out, skipped
                 )
-                for item in fuzzy_matches:
-                    if not self._is_duplicate(results, item):
-                        item['match_type'] = 'FUZZY'
-                        results.append(item)
 
-            # 5. رتبه‌بندی بر اساس تاریخچه استفاده
+            # 3. رتبه‌بندی بر اساس تاریخچه استفاده
+            stage_started = time.perf_counter()
             results = self._rank_by_usage_history(
                 session, results, project_id, user_id
             )
+            timings['USAGE_RANK'] = self._elapsed_ms(stage_started)
 
-            # ثبت جستجو
+            # ثبت جستجو (در صف؛ بدون commit در مسیر جستجو)
             if user_id:
                 self._log_search(
-                    session, search_query, size, spec,
+                    search_query, size, spec,
                     warehouse_code, project_id, user_id
                 )
 
-            return results[:limit]
+            timings['TOTAL'] = self._elapsed_ms(started)
+            return {
+                'items': results[:limit],
+                'timings': timings,
+                'partial': bool(timed_out),
+                'timed_out': timed_out,
+                'skipped': skipped,
+            }
+
+        finally:
+            session.close()
+
+    def _get_enabled_stages(self) -> List[Tuple[str, Any]]:
+        """
+        مراحل فعال به ترتیب اولویت: (نام، تابع مرحله)
+        امضای تابع مرحله: (session, query, size, spec, warehouse_code, limit, should_stop)
+        """
+        stages = [
+            ('RULE_BASED', lambda s, q, sz, sp, wh, n, stop: self._find_rule_based_matches(s, q, sz, sp, wh, stop)),
+            ('SYNONYM', lambda s, q, sz, sp, wh, n, stop: self._find_synonym_matches(s, q, sz, sp, wh, stop)),
+        ]
+        if self._tfidf_index:
+            stages.append(('TFIDF', self._find_tfidf_matches))
+        if self._semantic_index and self._semantic_index.available:
+            stages.append(('SEMANTIC', self._find_semantic_matches))
+        stages.append(('FUZZY', self._find_fuzzy_matches))
+        return [stage for stage in stages if stage[0] in self.enabled_stages]
+
+    def _run_stage(self, stage_func, search_query, size, spec, warehouse_code, limit,
+                   deadline: float, should_stop: Callable[[], bool]):
+        """
+        اجرای یک مرحله با Session مستقل (برای اجرا در ترد جدا)
+        مرحله‌ای که کنار گذاشته شده (پایان بودجه یا کافی بودن نتایج) با should_stop
+        بین گام‌هایش متوقف می‌شود و کوئری در حال اجرای آن با statement_timeout لغو می‌شود.
+        """
+        if should_stop():
+            return [], 0.0
+        session = self.session_factory()
+        try:
+            stage_started = time.perf_counter()
+            if session.get_bind().dialect.name == 'postgresql':
+                remaining_ms = max(int((deadline - stage_started) * 1000), 1)
+                session.execute(text(f"SET LOCAL statement_timeout = {remaining_ms}"))
+            items = stage_func(session, search_query, size, spec, warehouse_code, limit, should_stop)
+            if not items and should_stop():
+                # نتیجه خالی به خاطر توقف زودهنگام است، نه نبود تطبیق
+                raise FuturesTimeout()
+            return items, self._elapsed_ms(stage_started)
+        finally:
+            session.close()
+
+    def _run_stages_parallel(
+            self, stages, results, search_query, size, spec, warehouse_code,
+            limit, budget, timings, timed_out, skipped
+    ) -> List[Dict[str, Any]]:
+        """اجرای هم‌زمان مراحل و ادغام به ترتیب اولویت با رعایت بودجه زمانی"""
+        remaining = limit - len(results)
+        deadline = time.perf_counter() + budget
+        abandoned = threading.Event()
+
+        def should_stop() -> bool:
+            return abandoned.is_set() or time.perf_counter() >= deadline
+
+        futures = [
+            (name, self._stage_executor.submit(
+                self._run_stage, func, search_query, size, spec, warehouse_code, remaining,
+                deadline, should_stop
+            ))
+            for name, func in stages
+        ]
+
+        try:
+            return self._collect_stage_results(
+                futures, results, limit, deadline, timings, timed_out, skipped
+            )
+        finally:
+            # مراحلی که هنوز در حال اجرا هستند نتیجه‌شان دیگر خوانده نمی‌شود
+            abandoned.set()
+
+    def _collect_stage_results(
+            self, futures, results, limit, deadline, timings, timed_out, skipped
+    ) -> List[Dict[str, Any]]:
+        """انتظار برای نتیجه مراحل به ترتیب اولویت تا deadline و ادغام آن‌ها"""
+        for index, (name, future) in enumerate(futures):
+            if len(results) >= limit:
+                # نتایج مراحل با اولویت بالاتر کافی است؛ مراحل باقی‌مانده لغو می‌شوند
+                for rest_name, rest_future in futures[index:]:
+                    rest_future.cancel()
+                    skipped.append(rest_name)
+                break
+            try:
+                items, elapsed = future.result(timeout=max(deadline - time.perf_counter(), 0))
+            except FuturesTimeout:
+                future.cancel()
+                timed_out.append(name)
+                continue
+            except Exception as e:
+                logging.error(f"خطا در مرحله تطبیق {name}: {e}")
+                continue
+            timings[name] = elapsed
+            self._merge_stage_results(results, items, name)
+        return results
+
+    def _run_stages_sequential(
+            self, session, stages, results, search_query, size, spec, warehouse_code,
+            limit, budget, timings, timed_out, skipped
+    ) -> List[Dict[str, Any]]:
+        """اجرای ترتیبی مراحل؛ پس از پایان بودجه کل، مراحل باقی‌مانده اجرا نمی‌شوند"""
+        deadline = time.perf_counter() + budget
+
+        def should_stop() -> bool:
+            return time.perf_counter() >= deadline
+
+        for index, (name, func) in enumerate(stages):
+            if len(results) >= limit:
+                skipped.extend(rest_name for rest_name, _ in stages[index:])
+                break
+            if time.perf_counter() >= deadline:
+                timed_out.extend(rest_name for rest_name, _ in stages[index:])
+                break
+            stage_started = time.perf_counter()
+            try:
+                items = func(session, search_query, size, spec, warehouse_code, limit - len(results), should_stop)
+            except Exception as e:
+                logging.error(f"خطا در مرحله تطبیق {name}: {e}")
+                session.rollback()
+                continue
+            if not items and should_stop():
+                timed_out.append(name)
+                continue
+            timings[name] = self._elapsed_ms(stage_started)
+            self._merge_stage_results(results, items, name)
+        return results
+
+    def _merge_stage_results(self, results: List[Dict], items: List[Dict], match_type: str) -> None:
+        for item in items:
+            if not self._is_duplicate(results, item):
+                item['match_type'] = match_type
+                results.append(item)
+
+    @staticmethod
+    def _elapsed_ms(started: float) -> float:
+        return round((time.perf_counter() - started) * 1000, 1)
+
+    def match_mto_items_bulk(
+            self,
+            project_id: int,
+            line_no: str,
+            warehouse_code: str = None,
+            top_k: int = 5
+    ) -> List[Dict[str, Any]]:
+        """
+        تطبیق یکجای همه آیتم‌های MTO یک خط با موجودی انبار (برای صفحه کیت کردن خط)
+        corpus موجودی یک بار بارگذاری شده و همه آیتم‌ها در یک گذر برداری
+        (ماتریس امتیاز آیتم‌ها × موجودی) امتیازدهی می‌شوند.
+
+        Returns:
+            برای هر آیتم MTO: {'mto_item_id', 'item_code', 'description',
+            'quantity', 'unit', 'suggestions': [آیتم‌های انبار با confidence و match_type]}
+        """
+        session = self.session_factory()
+        try:
+            mto_items = session.query(MTOItem).filter(
+                MTOItem.project_id == project_id,
+                MTOItem.line_no == line_no
+            ).order_by(MTOItem.id).all()
+            if not mto_items:
+                return []
+            self._warm_caches(session)
+
+            results = [{
+                'mto_item_id': mto.id,
+                'item_code': mto.item_code,
+                'description': mto.description,
+                'quantity': mto.quantity,
+                'unit': mto.unit,
+                'suggestions': []
+            } for mto in mto_items]
+
+            # بدون rapidfuzz: مسیر کند تک‌به‌تک
+            if not RAPIDFUZZ_SUPPORT:
+                for entry, mto in zip(results, mto_items):
+                    entry['suggestions'] = self.find_matching_items(
+                        mto.item_code or mto.material_code or mto.description or "",
+                        warehouse_code=warehouse_code, project_id=project_id, limit=top_k
+                    )
+                return results
+
+            corpus = self._corpus.get_slice(self._resolve_warehouse_id(session, warehouse_code))
+            if not len(corpus.ids):
+                return results
+
+            codes = [(mto.item_code or mto.material_code or "").upper() for mto in mto_items]
+            descriptions = [sort_tokens(mto.description) for mto in mto_items]
+
+            # امتیاز پایه فازی: یک فراخوانی cdist برای هر دسته از آیتم‌ها
+            # (دسته‌بندی فقط برای محدود کردن حافظه ماتریس آیتم‌ها × موجودی است)
+            picked, match_types = [], []
+            k = min(top_k, len(corpus.ids))
+            for start in range(0, len(mto_items), BULK_MATCH_CHUNK):
+                chunk_codes = codes[start:start + BULK_MATCH_CHUNK]
+                code_scores = process.cdist(
+                    chunk_codes, corpus.codes, scorer=fuzz.ratio, dtype=np.uint8,
+                    workers=-1, score_cutoff=FUZZY_MIN_CONFIDENCE * 100
+                )
+                desc_scores = process.cdist(
+                    descriptions[start:start + BULK_MATCH_CHUNK], corpus.descriptions,
+                    scorer=fuzz.ratio, dtype=np.uint8,
+                    workers=-1, score_cutoff=FUZZY_MIN_CONFIDENCE * 100 / 0.8
+                )
+                confidence = np.maximum(
+                    code_scores.astype(np.float32) / 100.0,
+                    desc_scores.astype(np.float32) * (0.8 / 100.0)
+                )
+
+                # تطبیق دقیق و قوانین روی همان ماتریس اعمال می‌شوند
+                for row, code in enumerate(chunk_codes):
+                    types = {}
+                    if not code:
+                        match_types.append(types)
+                        continue
+                    for pos in corpus.code_positions.get(code, ()):
+                        confidence[row, pos] = 1.0
+                        types[pos] = 'EXACT'
+                    for mapping in self._lookup_mappings(code):
+                        for pos in corpus.code_positions.get(mapping['target_code'], ()):
+                            if pos not in types:
+                                confidence[row, pos] = max(confidence[row, pos], mapping['confidence'])
+                                types[pos] = 'RULE_BASED'
+                    match_types.append(types)
+
+                top = np.argpartition(-confidence, k - 1, axis=1)[:, :k]
+                for row in range(len(chunk_codes)):
+                    positions = [
+                        (int(p), float(confidence[row, p])) for p in top[row]
+                        if confidence[row, p] >= FUZZY_MIN_CONFIDENCE
+                    ]
+                    positions.sort(key=lambda x: x[1], reverse=True)
+                    picked.append(positions)
+
+            # همه آیتم‌های پیشنهادی با یک کوئری
+            candidate_ids = {int(corpus.ids[p]) for positions in picked for p, _ in positions}
+            items_by_id = {
+                item.id: item for item in session.query(InventoryItem).options(
+                    joinedload(InventoryItem.warehouse)
+                ).filter(InventoryItem.id.in_(candidate_ids)).all()
+            } if candidate_ids else {}
+
+            for row, positions in enumerate(picked):
+                for pos, score in positions:
+                    item = items_by_id.get(int(corpus.ids[pos]))
+                    if item is None:
+                        continue
+                    suggestion = self._item_to_dict(item, score)
+                    suggestion['match_type'] = match_types[row].get(pos, 'FUZZY')
+                    results[row]['suggestions'].append(suggestion)
+
+            return results
 
         finally:
             session.close()
@@ -147,91 +522,200 @@ class ItemMatchingService:
     def _find_rule_based_matches(
             self, session: Session,
             search_query: str, size: str, spec: str,
-            warehouse_code: str
+            warehouse_code: str, should_stop: Callable[[], bool] = None
     ) -> List[Dict[str, Any]]:
         """تطبیق بر اساس قوانین ذخیره شده"""
 
-        # بارگذاری قوانین از کش یا دیتابیس
-        mappings = self._get_cached_mappings(session)
+        # قوانین منطبق با یک جستجوی دیکشنری (قوانین سایز-محور اول)
+        rules = self._lookup_mappings(search_query, size)
+        if not rules or (should_stop and should_stop()):
+            return []
 
-        # جستجوی قوانین منطبق
-        matching_items = []
-        search_upper = search_query.upper()
-
-        for mapping in mappings:
-            if mapping['source_code'].upper() == search_upper:
-                # پیدا کردن آیتم هدف در انبار
-                query = session.query(InventoryItem).filter(
-                    func.upper(InventoryItem.material_code) ==
-                    func.upper(mapping['target_code'])
-                )
+        # همه کدهای هدف با یک کوئری IN
+        target_codes = {rule['target_code'] for rule in rules}
+        query = session.query(InventoryItem).options(
+            joinedload(InventoryItem.warehouse)
+        ).filter(func.upper(InventoryItem.material_code).in_(target_codes))
 
-                if warehouse_code:
-                    warehouse = session.query(Warehouse).filter_by(
-                        code=warehouse_code
-                    ).first()
-                    if warehouse:
-                        query = query.filter_by(warehouse_id=warehouse.id)
+        warehouse_id = self._resolve_warehouse_id(session, warehouse_code)
+        if warehouse_id is not None:
+            query = query.filter(InventoryItem.warehouse_id == warehouse_id)
 
-                if size and mapping.get('target_size'):
-                    query = query.filter_by(size=mapping['target_size'])
+        items_by_code = defaultdict(list)
+        for item in query.all():
+            items_by_code[(item.material_code or "").upper()].append(item)
 
-                items = query.all()
-                for item in items:
-                    matching_items.append(
-                        self._item_to_dict(item, mapping['confidence'])
-                    )
+        matching_items = []
+        seen_ids = set()
+        for rule in rules:
+            for item in items_by_code.get(rule['target_code'], ()):
+                if size and rule.get('target_size') and item.size != rule['target_size']:
+                    continue
+                if item.id in seen_ids:
+                    continue
+                seen_ids.add(item.id)
+                matching_items.append(self._item_to_dict(item, rule['confidence']))
 
         return matching_items
 
     def _find_synonym_matches(
             self, session: Session,
             search_query: str, size: str, spec: str,
-            warehouse_code: str
+            warehouse_code: str, should_stop: Callable[[], bool] = None
     ) -> List[Dict[str, Any]]:
-        """تطبیق بر اساس مترادف‌ها"""
+        """
+        تطبیق بر اساس مترادف‌ها
+        کدهای هم‌ارز از گراف درون‌حافظه‌ای گرفته شده و با یک کوئری IN در موجودی پیدا می‌شوند.
+        """
+        expanded = self._synonym_graph.expand_query(search_query)
+        if not expanded or (should_stop and should_stop()):
+            return []
 
-        # یافتن مترادف‌ها
-        synonyms = session.query(MaterialSynonym).filter(
-            or_(
-                func.upper(MaterialSynonym.synonym_code) == func.upper(search_query),
-                func.upper(MaterialSynonym.synonym_description).contains(func.upper(search_query))
-            ),
-            MaterialSynonym.is_verified == True
-        ).all()
+        query = session.query(InventoryItem).options(
+            joinedload(InventoryItem.warehouse)
+        ).filter(func.upper(InventoryItem.material_code).in_(list(expanded)))
 
-        matching_items = []
-        for syn in synonyms:
-            # جستجوی آیتم اصلی در انبار
-            query = session.query(InventoryItem).filter(
-                func.upper(InventoryItem.material_code) ==
-                func.upper(syn.primary_code)
-            )
+        warehouse_id = self._resolve_warehouse_id(session, warehouse_code)
+        if warehouse_id is not None:
+            query = query.filter(InventoryItem.warehouse_id == warehouse_id)
 
-            if warehouse_code:
-                warehouse = session.query(Warehouse).filter_by(
-                    code=warehouse_code
-                ).first()
-                if warehouse:
-                    query = query.filter_by(warehouse_id=warehouse.id)
+        if size:
+            query = query.filter_by(size=size)
 
-            if size:
-                query = query.filter_by(size=size)
+        matching_items = [
+            self._item_to_dict(item, expanded.get((item.material_code or "").upper(), 0.5))
+            for item in query.all()
+        ]
+        matching_items.sort(key=lambda x: x['confidence'], reverse=True)
+        return matching_items
 
-            items = query.all()
-            for item in items:
-                matching_items.append(
-                    self._item_to_dict(item, syn.confidence_score)
-                )
+    def _refresh_synonym_graph(self, session: Session) -> None:
+        """ساخت کامل گراف مترادف‌ها در اولین استفاده و پس از پایان TTL کش"""
+        graph = self._synonym_graph
+        with self._cache_lock:
+            if self._synonym_refreshing or (
+                    graph.is_built and time.time() - graph.built_at < self._cache_ttl_minutes * 60):
+                return
+            self._synonym_refreshing = True
+        try:
+            rows = session.query(
+                MaterialSynonym.primary_code, MaterialSynonym.synonym_code,
+                MaterialSynonym.synonym_description, MaterialSynonym.confidence_score
+            ).filter(MaterialSynonym.is_verified == True).all()
+            graph.build(rows)
+        finally:
+            with self._cache_lock:
+                self._synonym_refreshing = False
 
-        return matching_items
+    def _find_tfidf_matches(
+            self, session: Session,
+            search_query: str, size: str, spec: str,
+            warehouse_code: str, limit: int, should_stop: Callable[[], bool] = None
+    ) -> List[Dict[str, Any]]:
+        """تطبیق top-k با شباهت کسینوسی روی ایندکس TF-IDF شرح آیتم‌ها"""
+        warehouse_id = self._resolve_warehouse_id(session, warehouse_code)
+
+        # با فیلتر سایز، نامزد بیشتری لازم است
+        top_k = limit * 5 if size else limit
+        scored = self._tfidf_index.query(
+            search_query, top_k=top_k, warehouse_id=warehouse_id, min_score=TFIDF_MIN_SCORE
+        )
+        if should_stop and should_stop():
+            return []
+        return self._load_scored_items(session, scored, size, limit)
+
+    def _find_semantic_matches(
+            self, session: Session,
+            search_query: str, size: str, spec: str,
+            warehouse_code: str, limit: int, should_stop: Callable[[], bool] = None
+    ) -> List[Dict[str, Any]]:
+        """تطبیق top-k با شباهت کسینوسی embedding شرح آیتم‌ها"""
+        warehouse_id = self._resolve_warehouse_id(session, warehouse_code)
+        top_k = limit * 5 if size else limit
+        scored = self._semantic_index.query(
+            search_query, top_k=top_k, warehouse_id=warehouse_id, min_score=SEMANTIC_MIN_SCORE
+        )
+        if should_stop and should_stop():
+            return []
+        return self._load_scored_items(session, scored, size, limit)
+
+    def _load_scored_items(
+            self, session: Session,
+            scored: List[Tuple[int, float]], size: str, limit: int
+    ) -> List[Dict[str, Any]]:
+        """بارگذاری آیتم‌های امتیازدار ایندکس‌ها با یک کوئری IN و حفظ ترتیب امتیاز"""
+        if not scored:
+            return []
+
+        scores = dict(scored)
+        query = session.query(InventoryItem).options(
+            joinedload(InventoryItem.warehouse)
+        ).filter(InventoryItem.id.in_(list(scores)))
+        if size:
+            query = query.filter(func.upper(InventoryItem.size) == func.upper(size))
+
+        items = sorted(query.all(), key=lambda item: scores[item.id], reverse=True)
+        return [self._item_to_dict(item, scores[item.id]) for item in items[:limit]]
 
     def _find_fuzzy_matches(
             self, session: Session,
             search_query: str, size: str, spec: str,
-            warehouse_code: str, limit: int
+            warehouse_code: str, limit: int, should_stop: Callable[[], bool] = None
     ) -> List[Dict[str, Any]]:
-        """تطبیق فازی برای موارد نزدیک"""
+        """
+        تطبیق فازی برای موارد نزدیک
+        کل corpus انبار با rapidfuzz.process.cdist (چندهسته‌ای) امتیازدهی می‌شود؛
+        بنابراین موارد نزدیکی که شامل عبارت جستجو نیستند هم پیدا می‌شوند.
+        """
+        if not RAPIDFUZZ_SUPPORT:
+            return self._find_fuzzy_matches_difflib(
+                session, search_query, size, spec, warehouse_code, limit, should_stop
+            )
+
+        warehouse_id = self._resolve_warehouse_id(session, warehouse_code)
+        corpus = self._corpus.get_slice(warehouse_id)
+        if not len(corpus.ids) or not search_query:
+            return []
+
+        # score_cutoff امتیازهای زیر حداقل را صفر می‌کند و محاسبه آن‌ها را زودتر رها می‌کند
+        code_scores = process.cdist(
+            [search_query.upper()], corpus.codes, scorer=fuzz.ratio, dtype=np.uint8,
+            workers=-1, score_cutoff=FUZZY_MIN_CONFIDENCE * 100
+        )[0]
+        if should_stop and should_stop():
+            return []
+        desc_scores = process.cdist(
+            [sort_tokens(search_query)], corpus.descriptions, scorer=fuzz.ratio, dtype=np.uint8,
+            workers=-1, score_cutoff=FUZZY_MIN_CONFIDENCE * 100 / 0.8
+        )[0]
+
+        # امتیاز نهایی: مانند قبل، شباهت شرح با وزن 0.8
+        confidence = np.maximum(code_scores / 100.0, desc_scores / 100.0 * 0.8)
+        if size:
+            confidence[corpus.sizes != size.upper()] = 0.0
+
+        candidates = np.flatnonzero(confidence >= FUZZY_MIN_CONFIDENCE)
+        if not len(candidates) or (should_stop and should_stop()):
+            return []
+        if len(candidates) > limit:
+            top = np.argpartition(-confidence[candidates], limit - 1)[:limit]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-confidence[candidates], kind='stable')]
+
+        scores = {int(corpus.ids[i]): float(confidence[i]) for i in candidates}
+        items = session.query(InventoryItem).options(
+            joinedload(InventoryItem.warehouse)
+        ).filter(InventoryItem.id.in_(list(scores))).all()
+        items.sort(key=lambda item: scores[item.id], reverse=True)
+
+        return [self._item_to_dict(item, scores[item.id]) for item in items]
+
+    def _find_fuzzy_matches_difflib(
+            self, session: Session,
+            search_query: str, size: str, spec: str,
+            warehouse_code: str, limit: int, should_stop: Callable[[], bool] = None
+    ) -> List[Dict[str, Any]]:
+        """تطبیق فازی با difflib (در صورت نبود rapidfuzz)"""
 
         query = session.query(InventoryItem)
 
@@ -260,6 +744,8 @@ class ItemMatchingService:
         # محاسبه امتیاز شباهت
         scored_items = []
         for item in items:
+            if should_stop and should_stop():
+                return []
             # محاسبه شباهت با کد
             code_similarity = SequenceMatcher(
                 None,
@@ -278,7 +764,7 @@ class ItemMatchingService:
             # امتیاز نهایی
             confidence = max(code_similarity, desc_similarity * 0.8)
 
-            if confidence >= 0.5:  # حداقل امتیاز شباهت
+            if confidence >= FUZZY_MIN_CONFIDENCE:  # حداقل امتیاز شباهت
                 scored_items.append({
                     'item': item,
                     'confidence': confidence
@@ -306,32 +792,8 @@ class ItemMatchingService:
         if not items or not (project_id or user_id):
             return items
 
-        # شمارش استفاده‌های قبلی
-        usage_counts = defaultdict(int)
-
-        # جستجوی تاریخچه
-        history_query = session.query(
-            MaterialSearchHistory.selected_item_code,
-            func.count(MaterialSearchHistory.id).label('usage_count')
-        )
-
-        if project_id:
-            history_query = history_query.filter_by(project_id=project_id)
-        if user_id:
-            history_query = history_query.filter_by(user_id=user_id)
-
-        # فقط 30 روز اخیر
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        history_query = history_query.filter(
-            MaterialSearchHistory.timestamp >= thirty_days_ago
-        )
-
-        history = history_query.group_by(
-            MaterialSearchHistory.selected_item_code
-        ).all()
-
-        for record in history:
-            usage_counts[record.selected_item_code] = record.usage_count
+        codes = {item.get('material_code') for item in items if item.get('material_code')}
+        usage_counts = self._get_usage_counts(session, project_id, user_id, codes)
 
         # اضافه کردن امتیاز استفاده
         for item in items:
@@ -349,6 +811,88 @@ class ItemMatchingService:
 
         return items
 
+    @staticmethod
+    def _usage_stat_key(project_id: Optional[int], user_id: Optional[str]) -> Tuple[int, str]:
+        """کلید شمارنده: (0 = همه پروژه‌ها، '*' = همه کاربران)"""
+        return (
+            project_id or MaterialUsageStat.ALL_PROJECTS,
+            user_id or MaterialUsageStat.ALL_USERS,
+        )
+
+    def _get_usage_counts(
+            self, session: Session,
+            project_id: int, user_id: str,
+            item_codes
+    ) -> Dict[str, int]:
+        """
+        شمارش استفاده پنجره اخیر فقط برای کدهای نامزد؛
+        جستجوی مستقیم روی کلید اصلی material_usage_stats (بدون اسکن تاریخچه)
+        """
+        if not item_codes:
+            return {}
+
+        stat_project, stat_user = self._usage_stat_key(project_id, user_id)
+        since = datetime.utcnow().date() - timedelta(days=self._usage_window_days)
+
+        rows = session.query(
+            MaterialUsageStat.item_code,
+            func.sum(MaterialUsageStat.usage_count)
+        ).filter(
+            MaterialUsageStat.project_id == stat_project,
+            MaterialUsageStat.user_id == stat_user,
+            MaterialUsageStat.item_code.in_(list(item_codes)),
+            MaterialUsageStat.bucket_date >= since
+        ).group_by(MaterialUsageStat.item_code).all()
+
+        return {code: int(count) for code, count in rows}
+
+    def _increment_usage_stats(
+            self, session: Session,
+            item_code: str, project_id: Optional[int], user_id: Optional[str]
+    ) -> None:
+        """
+        افزایش شمارنده امروز در سه سطح (پروژه+کاربر، پروژه، کاربر) در همان تراکنش
+        ثبت انتخاب؛ یک upsert چندردیفی
+        """
+        today = datetime.utcnow().date()
+        keys = {
+            self._usage_stat_key(project_id, user_id),
+            self._usage_stat_key(project_id, None),
+            self._usage_stat_key(None, user_id),
+        }
+        # سطح (همه پروژه‌ها، همه کاربران) استفاده نمی‌شود
+        keys.discard(self._usage_stat_key(None, None))
+        if not keys:
+            return
+
+        stmt = pg_insert(MaterialUsageStat).values([
+            {
+                'project_id': stat_project,
+                'user_id': stat_user,
+                'item_code': item_code,
+                'bucket_date': today,
+                'usage_count': 1,
+            }
+            for stat_project, stat_user in sorted(keys)
+        ])
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=['project_id', 'user_id', 'item_code', 'bucket_date'],
+            set_={'usage_count': MaterialUsageStat.usage_count + stmt.excluded.usage_count}
+        ))
+
+    def _purge_old_usage_stats(self, session: Session) -> None:
+        """حذف bucketهای خارج از پنجره؛ حداکثر یک بار در روز"""
+        today = datetime.utcnow().date()
+        if self._usage_purged_on == today:
+            return
+        cutoff = today - timedelta(days=self._usage_window_days)
+        deleted = session.query(MaterialUsageStat).filter(
+            MaterialUsageStat.bucket_date < cutoff
+        ).delete(synchronize_session=False)
+        self._usage_purged_on = today
+        if deleted:
+            logging.info(f"{deleted} شمارنده استفاده قدیمی‌تر از {cutoff} حذف شد")
+
         # ================== ثبت و یادگیری ==================
 
     def record_user_selection(
@@ -363,16 +907,6 @@ class ItemMatchingService:
 
         session = self.session_factory()
         try:
-            # ثبت در تاریخچه جستجو
-            history = MaterialSearchHistory(
-                search_term=search_query,
-                selected_item_code=selected_item_code,
-                user_id=user_id,
-                project_id=project_id,
-                user_feedback='SELECTED'
-            )
-            session.add(history)
-
             # به‌روزرسانی یا ایجاد قانون تطبیق
             mapping = session.query(ItemMapping).filter_by(
                 source_code=search_query,
@@ -398,11 +932,24 @@ class ItemMatchingService:
                 )
                 session.add(mapping)
 
+            # شمارنده‌های رتبه‌بندی در همان تراکنش
+            self._increment_usage_stats(session, selected_item_code, project_id, user_id)
+            self._purge_old_usage_stats(session)
+
             session.commit()
 
             # پاک کردن کش
             self._clear_cache()
 
+            # ثبت در تاریخچه جستجو (در صف نوشتن دسته‌ای)
+            self._history_writer.submit(
+                search_term=search_query,
+                selected_item_code=selected_item_code,
+                user_id=user_id,
+                project_id=project_id,
+                user_feedback='SELECTED'
+            )
+
             if self.log_activity:
                 self.log_activity(
                     user=user_id,
@@ -452,8 +999,11 @@ class ItemMatchingService:
             session.add(synonym)
             session.commit()
 
-            # پاک کردن کش
-            self._clear_cache()
+            # به‌روزرسانی گراف مترادف (مترادف‌های تأییدنشده در تطبیق شرکت نمی‌کنند)
+            if auto_verify and self._synonym_graph.is_built:
+                self._synonym_graph.add_edge(
+                    primary_code, synonym_code, synonym_description, synonym.confidence_score
+                )
 
             if self.log_activity:
                 self.log_activity(
@@ -517,6 +1067,153 @@ class ItemMatchingService:
         finally:
             session.close()
 
+    def mine_mappings_from_consumption(
+            self,
+            project_id: int = None,
+            min_occurrences: int = 1,
+            min_confidence: float = 0.3,
+            batch_size: int = 1000
+    ) -> Dict[str, Any]:
+        """
+        استخراج دسته‌ای قوانین تطبیق از کل تاریخچه مصرف (MTOConsumption با inventory_item_id).
+        - همه جفت‌های (کد MTO، کد انبار) با یک کوئری تجمیعی شمرده می‌شوند
+        - اطمینان = سهم جفت از مصارف آن کد MTO × ضریب پشتیبانی (n / (n + 2))، حداکثر 0.95
+        - درج/به‌روزرسانی چندردیفی با ON CONFLICT روی uq_source_target_mapping؛
+          اجرای مجدد تکراری نمی‌شمارد و اطمینان قوانین موجود را کاهش نمی‌دهد
+        - کش قوانین فقط یک بار در پایان باطل می‌شود
+        :return: {'pairs', 'created', 'updated', 'skipped', 'seconds', 'mappings_per_sec'}
+        """
+        started = time.perf_counter()
+        # updated_at مثل بقیه جاها UTC بدون timezone است (کش با همین مقدار مقایسه می‌کند)؛
+        # یک مقدار برای کل اجرا تا همه ردیف‌های این استخراج یک زمان داشته باشند
+        mined_at = datetime.utcnow()
+        source_code = func.upper(func.trim(func.coalesce(
+            func.nullif(MTOItem.item_code, ''), MTOItem.material_code
+        )))
+        target_code = func.upper(func.trim(InventoryItem.material_code))
+        pair_count = func.count(MTOConsumption.id)
+
+        session = self.session_factory()
+        created = updated = skipped = pairs = 0
+        try:
+            query = session.query(
+                source_code.label('source_code'),
+                target_code.label('target_code'),
+                pair_count.label('pair_count'),
+                func.sum(pair_count).over(partition_by=source_code).label('source_total'),
+                func.max(MTOConsumption.timestamp).label('last_used'),
+                func.max(MTOItem.description).label('source_description'),
+                func.max(InventoryItem.description).label('target_description')
+            ).join(
+                MTOItem, MTOItem.id == MTOConsumption.mto_item_id
+            ).join(
+                InventoryItem, InventoryItem.id == MTOConsumption.inventory_item_id
+            ).filter(
+                MTOConsumption.inventory_item_id.isnot(None),
+                source_code.isnot(None), source_code != ''
+            )
+            if project_id:
+                query = query.filter(MTOItem.project_id == project_id)
+            query = query.group_by(source_code, target_code).having(pair_count >= min_occurrences)
+
+            batch = []
+            for row in query.yield_per(batch_size):
+                pairs += 1
+                share = row.pair_count / float(row.source_total or row.pair_count)
+                confidence = round(min(share * row.pair_count / (row.pair_count + 2.0), 0.95), 4)
+                if confidence < min_confidence:
+                    skipped += 1
+                    continue
+                batch.append({
+                    'source_code': row.source_code,
+                    'source_description': row.source_description,
+                    'source_size': '',
+                    'target_code': row.target_code,
+                    'target_description': row.target_description,
+                    'target_size': '',
+                    'mapping_type': 'AUTO_LEARNED',
+                    'confidence_score': confidence,
+                    'usage_count': int(row.pair_count),
+                    'last_used': row.last_used,
+                    'created_by': 'consumption_mining',
+                    'is_active': True,
+                    'created_at': mined_at,
+                    'updated_at': mined_at,
+                })
+                if len(batch) >= batch_size:
+                    inserted, changed = self._upsert_mined_mappings(session, batch, mined_at)
+                    created, updated = created + inserted, updated + changed
+                    batch = []
+            if batch:
+                inserted, changed = self._upsert_mined_mappings(session, batch, mined_at)
+                created, updated = created + inserted, updated + changed
+
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logging.error(f"Error mining mappings from consumption: {e}")
+            raise
+        finally:
+            session.close()
+
+        # باطل کردن یک‌باره کش: بارگذاری کامل در استفاده بعدی
+        with self._cache_lock:
+            self._last_cache_update = None
+            self._mapping_cache_stale = True
+
+        seconds = time.perf_counter() - started
+        result = {
+            'pairs': pairs,
+            'created': created,
+            'updated': updated,
+            'skipped': skipped,
+            'seconds': round(seconds, 2),
+            'mappings_per_sec': round((created + updated) / seconds, 1) if seconds else 0.0,
+        }
+        logging.info(
+            f"استخراج قوانین از تاریخچه مصرف: {pairs} جفت، {created} جدید، {updated} به‌روز، "
+            f"{skipped} رد شده ({result['mappings_per_sec']} قانون/ثانیه)"
+        )
+        if self.log_activity:
+            self.log_activity(
+                user="system",
+                action="MAPPINGS_MINED",
+                details=f"Mined {created} new and {updated} updated mappings from {pairs} consumption pairs"
+            )
+        return result
+
+    @staticmethod
+    def _upsert_mined_mappings(
+            session: Session, rows: List[Dict[str, Any]], updated_at: datetime
+    ) -> Tuple[int, int]:
+        """
+        upsert چندردیفی قوانین استخراج‌شده.
+        ردیف موجود فقط وقتی به‌روز می‌شود که شمارش یا اطمینان بیشتری داشته باشد
+        (updated_at بی‌دلیل تغییر نمی‌کند تا همگام‌سازی افزایشی کش سبک بماند).
+        :param updated_at: زمان UTC اجرای استخراج (هم‌مبنا با datetime.utcnow مدل)
+        :return: (تعداد درج‌شده، تعداد به‌روزشده)
+        """
+        stmt = pg_insert(ItemMapping).values(rows)
+        excluded = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            constraint='uq_source_target_mapping',
+            set_={
+                'usage_count': func.greatest(ItemMapping.usage_count, excluded.usage_count),
+                'confidence_score': func.greatest(ItemMapping.confidence_score, excluded.confidence_score),
+                'last_used': func.greatest(ItemMapping.last_used, excluded.last_used),
+                'updated_at': updated_at,
+            },
+            where=or_(
+                ItemMapping.usage_count.is_(None),
+                ItemMapping.usage_count < excluded.usage_count,
+                ItemMapping.confidence_score < excluded.confidence_score
+            )
+        ).returning(literal_column('(xmax = 0)'))
+        # xmax = 0 یعنی ردیف تازه درج شده است
+        flags = [bool(row[0]) for row in session.execute(stmt)]
+        inserted = sum(flags)
+        return inserted, len(flags) - inserted
+
         # ================== متدهای کمکی ==================
 
     def _item_to_dict(self, item: InventoryItem, confidence: float) -> Dict[str, Any]:
@@ -535,6 +1232,27 @@ class ItemMatchingService:
             'confidence': confidence
         }
 
+    def _resolve_warehouse_id(self, session: Session, warehouse_code: str) -> Optional[int]:
+        """شناسه انبار از روی کد (از corpus در صورت وجود، در غیر این صورت از دیتابیس)"""
+        if not warehouse_code:
+            return None
+        if self._corpus is not None:
+            return self._corpus.resolve_warehouse_id(warehouse_code)
+        warehouse = session.query(Warehouse).filter_by(code=warehouse_code).first()
+        return warehouse.id if warehouse else None
+
+    def rebuild_semantic_index(self) -> Dict[str, int]:
+        """embed آیتم‌های جدید/تغییرکرده در ایندکس معنایی"""
+        if not self._semantic_index:
+            return {'embedded': 0, 'deleted': 0, 'total': 0}
+        return self._semantic_index.refresh()
+
+    def rebuild_description_index(self, force_refit: bool = False) -> Dict[str, int]:
+        """همگام‌سازی (یا ساخت کامل) ایندکس TF-IDF شرح آیتم‌ها"""
+        if not self._tfidf_index:
+            return {'changed': 0, 'deleted': 0, 'total': 0, 'refit': 0}
+        return self._tfidf_index.refresh(force_refit=force_refit)
+
     def _is_duplicate(self, results: List[Dict], item: Dict) -> bool:
         """بررسی تکراری بودن آیتم در نتایج"""
         for existing in results:
@@ -544,65 +1262,185 @@ class ItemMatchingService:
                 return True
         return False
 
-    def _get_cached_mappings(self, session: Session) -> List[Dict]:
-        """دریافت قوانین تطبیق از کش یا دیتابیس"""
+    @staticmethod
+    def _normalize_code(code: Optional[str]) -> str:
+        """کلید نرمال‌شده کد/سایز برای ایندکس‌های دیکشنری"""
+        return (code or "").strip().upper()
 
-        # بررسی کش
-        now = datetime.utcnow()
-        if (self._last_cache_update and
-                (now - self._last_cache_update).total_seconds() < self._cache_ttl_minutes * 60):
+    def _warm_caches(self, session: Session) -> None:
+        """
+        به‌روزرسانی کش قوانین و گراف مترادف پیش از اجرای مراحل تطبیق.
+        مراحل فقط وضعیت درون‌حافظه‌ای را می‌خوانند تا بارگذاری کش در نشست
+        با statement_timeout مرحله لغو نشود؛ در صورت خطا کش قبلی استفاده می‌شود.
+        """
+        try:
+            self._refresh_mapping_cache(session)
+            self._refresh_synonym_graph(session)
+        except Exception as e:
+            session.rollback()
+            logging.error(f"خطا در به‌روزرسانی کش تطبیق: {e}")
+
+    def _lookup_mappings(self, source_code: str, size: str = None) -> List[Dict]:
+        """
+        قوانین فعال یک کد منبع (O(1)) از کش درون‌حافظه‌ای؛ با سایز، قوانین همان
+        سایز در ابتدا می‌آیند. هر لیست از قبل بر اساس confidence نزولی مرتب است.
+        """
+        source = self._normalize_code(source_code)
+        with self._cache_lock:
+            general = self._mappings_by_source.get(source, [])
+            if not size:
+                return list(general)
+            specific = self._mappings_by_source_size.get((source, self._normalize_code(size)), [])
+        specific_ids = {rule['id'] for rule in specific}
+        return list(specific) + [rule for rule in general if rule['id'] not in specific_ids]
+
+    def _get_cached_mappings(self, session: Session) -> List[Dict]:
+        """دریافت همه قوانین تطبیق فعال از کش"""
+        self._refresh_mapping_cache(session)
+        with self._cache_lock:
             return list(self._mapping_cache.values())
 
-        # بارگذاری از دیتابیس
-        mappings = session.query(ItemMapping).filter_by(
-            is_active=True
-        ).order_by(
-            desc(ItemMapping.confidence_score)
-        ).all()
+    def _refresh_mapping_cache(self, session: Session) -> None:
+        """
+        همگام‌سازی کش قوانین:
+        - بارگذاری کامل در اولین استفاده و پس از پایان TTL (برای دیدن حذف‌های فیزیکی)
+        - در غیر این صورت فقط قوانین با updated_at جدیدتر (هر دقیقه یا پس از تغییر محلی)
+        کوئری بدون نگه داشتن _cache_lock اجرا می‌شود؛ خواننده‌ها تا پایان آن کش
+        قبلی را می‌بینند و فقط یک ترد هم‌زمان کش را به‌روز می‌کند.
+        """
+        now = datetime.utcnow()
+        with self._cache_lock:
+            if self._mapping_refreshing:
+                return
+            # بدون watermark (مثلاً همه updated_atها NULL) فیلتر افزایشی معنا ندارد
+            full_reload = (
+                self._last_cache_update is None or
+                self._mapping_max_updated_at is None or
+                (now - self._last_cache_update).total_seconds() >= self._cache_ttl_minutes * 60
+            )
+            if not full_reload and not self._mapping_cache_stale and self._mapping_last_check and \
+                    (now - self._mapping_last_check).total_seconds() < self._mapping_check_seconds:
+                return
+            watermark = self._mapping_max_updated_at
+            # باطل شدن کش در حین کوئری دوباره stale را روشن می‌کند
+            self._mapping_cache_stale = False
+            self._mapping_refreshing = True
 
-        # به‌روزرسانی کش
-        self._mapping_cache = {}
-        for mapping in mappings:
-            key = f"{mapping.source_code}_{mapping.target_code}"
-            self._mapping_cache[key] = {
-                'source_code': mapping.source_code,
-                'target_code': mapping.target_code,
-                'target_size': mapping.target_size,
-                'confidence': mapping.confidence_score,
-                'mapping_type': mapping.mapping_type
+        try:
+            query = session.query(
+                ItemMapping.id, ItemMapping.source_code, ItemMapping.source_size,
+                ItemMapping.target_code, ItemMapping.target_size, ItemMapping.confidence_score,
+                ItemMapping.mapping_type, ItemMapping.is_active, ItemMapping.updated_at
+            )
+            if full_reload:
+                query = query.filter(ItemMapping.is_active == True)
+            else:
+                # >= : ردیف‌های هم‌زمان با آخرین مقدار دوباره خوانده می‌شوند (اعمال مجدد بی‌خطر است)
+                query = query.filter(ItemMapping.updated_at >= watermark)
+            rows = query.all()
+        except Exception:
+            with self._cache_lock:
+                self._mapping_cache_stale = True
+                self._mapping_refreshing = False
+            raise
+
+        with self._cache_lock:
+            try:
+                self._apply_mapping_rows(rows, full_reload)
+                if full_reload and not self._mapping_cache_stale:
+                    self._last_cache_update = now
+                self._mapping_last_check = now
+            finally:
+                self._mapping_refreshing = False
+
+    def _apply_mapping_rows(self, rows, full_reload: bool) -> None:
+        """اعمال ردیف‌های خوانده‌شده روی کش (زیر _cache_lock)"""
+        if full_reload:
+            self._mapping_cache = {}
+            self._mapping_max_updated_at = None
+
+        touched_sources = set()
+        for row in rows:
+            old = self._mapping_cache.pop(row.id, None)
+            if old:
+                touched_sources.add(old['source_key'])
+            if row.updated_at and (self._mapping_max_updated_at is None or
+                                   row.updated_at > self._mapping_max_updated_at):
+                self._mapping_max_updated_at = row.updated_at
+            if not row.is_active:
+                continue
+            rule = {
+                'id': row.id,
+                'source_code': row.source_code,
+                'source_key': self._normalize_code(row.source_code),
+                'source_size': self._normalize_code(row.source_size),
+                'target_code': self._normalize_code(row.target_code),
+                'target_size': row.target_size,
+                'confidence': row.confidence_score,
+                'mapping_type': row.mapping_type
             }
-
-        self._last_cache_update = now
-        return list(self._mapping_cache.values())
+            self._mapping_cache[row.id] = rule
+            touched_sources.add(rule['source_key'])
+
+        if full_reload:
+            self._mappings_by_source = {}
+            self._mappings_by_source_size = {}
+            touched_sources = {rule['source_key'] for rule in self._mapping_cache.values()}
+        self._rebuild_mapping_buckets(touched_sources)
+
+    def _rebuild_mapping_buckets(self, source_keys) -> None:
+        """بازسازی ایندکس‌های دیکشنری فقط برای کدهای منبع تغییرکرده"""
+        if not source_keys:
+            return
+        grouped = defaultdict(list)
+        for rule in self._mapping_cache.values():
+            if rule['source_key'] in source_keys:
+                grouped[rule['source_key']].append(rule)
+
+        for key in source_keys:
+            self._mappings_by_source.pop(key, None)
+        for size_key in [k for k in self._mappings_by_source_size if k[0] in source_keys]:
+            del self._mappings_by_source_size[size_key]
+
+        for key, rules in grouped.items():
+            rules.sort(key=lambda r: r['confidence'] or 0, reverse=True)
+            self._mappings_by_source[key] = rules
+            by_size = defaultdict(list)
+            for rule in rules:
+                if rule['source_size']:
+                    by_size[(key, rule['source_size'])].append(rule)
+            self._mappings_by_source_size.update(by_size)
 
     def _clear_cache(self):
-        """پاک کردن کش"""
-        self._mapping_cache = {}
-        self._synonym_cache = {}
-        self._last_cache_update = None
+        """
+        علامت‌گذاری کش پس از تغییر محلی؛ قوانین در استفاده بعدی به صورت
+        افزایشی (بر اساس updated_at) همگام می‌شوند
+        """
+        with self._cache_lock:
+            self._mapping_cache_stale = True
 
     def _log_search(
-            self, session: Session,
+            self,
             search_query: str, size: str, spec: str,
             warehouse_code: str, project_id: int, user_id: str
     ):
-        """ثبت جستجو در تاریخچه"""
-        try:
-            history = MaterialSearchHistory(
-                search_term=search_query,
-                search_filters={
-                    'size': size,
-                    'spec': spec,
-                    'warehouse_code': warehouse_code
-                },
-                project_id=project_id,
-                user_id=user_id
-            )
+        """ثبت جستجو در تاریخچه (در صف writer؛ نوشتن دسته‌ای در پس‌زمینه)"""
+        self._history_writer.submit(
+            search_term=search_query,
+            search_filters={
+                'size': size,
+                'spec': spec,
+                'warehouse_code': warehouse_code
+            },
+            project_id=project_id,
+            user_id=user_id
+        )
 
-            session.add(history)
-            session.commit()
-        except Exception as e:
-            logging.error(f"Error logging search: {e}")
+    def close(self) -> None:
+        """نوشتن باقی‌مانده تاریخچه و توقف تردهای پس‌زمینه هنگام بستن برنامه"""
+        self._history_writer.close()
+        if self._stage_executor is not None:
+            self._stage_executor.shutdown(wait=False)
 
         # ================== گزارشات و آنالیز ==================
 
@@ -642,7 +1480,11 @@ class ItemMatchingService:
                 'active_mappings': active_mappings,
                 'total_synonyms': total_synonyms,
                 'verified_synonyms': verified_synonyms,
-                'cache_size': len(self._mapping_cache)
+                'cache_size': len(self._mapping_cache),
+                'description_index': self._tfidf_index.get_stats() if self._tfidf_index else None,
+                'synonym_graph': self._synonym_graph.get_stats(),
+                'semantic_index': self._semantic_index.get_stats() if self._semantic_index else None,
+                'history_writer': self._history_writer.get_stats()
             }
 
         finally:
@@ -0,0 +1,202 @@
+# file: data/job_leader_service.py
+"""
+سرویس انتخاب رهبر (Leader Election) برای کارهای پس‌زمینه
+- هر کار پس‌زمینه (ایندکس ISO، Snapshot انبار، انقضای رزروها و ...) یک نام دارد
+- فقط یک پروسه در کل شبکه قفل advisory آن نام را در PostgreSQL نگه می‌دارد
+- قفل به اتصال (Session) دیتابیس گره خورده است؛ با قطع اتصال رهبر، قفل آزاد
+  شده و کلاینت دیگری در heartbeat بعدی رهبری را به دست می‌گیرد
+"""
+
+import os
+import socket
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Callable
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine, Connection
+from sqlalchemy.pool import NullPool
+
+from data.constants import BACKGROUND_JOBS, JOB_LOCK_NAMESPACE
+
+
+class JobLeaderService:
+    """مدیریت رهبری کارهای پس‌زمینه با pg_try_advisory_lock"""
+
+    def __init__(self, engine: Engine, activity_logger=None, client_name: Optional[str] = None):
+        """
+        Args:
+            engine: engine اصلی برنامه (فقط URL آن استفاده می‌شود)
+            activity_logger: تابع لاگ فعالیت‌ها (اختیاری)
+            client_name: نام قابل نمایش این کلاینت در نمای مدیریت
+        """
+        self.activity_logger = activity_logger
+        self.client_name = client_name or f"{socket.gethostname()}:{os.getpid()}"
+
+        # برای هر کار یک اتصال اختصاصی نگه داشته می‌شود؛ NullPool تضمین می‌کند
+        # که بستن اتصال واقعاً socket را ببندد و قفل به Pool برنگردد
+        self._lock_engine = create_engine(
+            engine.url,
+            poolclass=NullPool,
+            isolation_level="AUTOCOMMIT",
+            connect_args={
+                "application_name": f"MIV-Leader {self.client_name}"[:63],
+                # تشخیص سریع‌تر اتصال مرده سمت سرور تا قفل زودتر آزاد شود
+                "keepalives": 1,
+                "keepalives_idle": 30,
+                "keepalives_interval": 10,
+                "keepalives_count": 3,
+            },
+        )
+        self._held: Dict[str, Connection] = {}
+        self._acquired_at: Dict[str, datetime] = {}
+        self._lock = threading.RLock()
+
+    def _log_activity(self, action: str, details: str = ""):
+        """ثبت لاگ فعالیت"""
+        if self.activity_logger:
+            try:
+                self.activity_logger(user=self.client_name, action=action, details=details)
+            except Exception as e:
+                logging.error(f"خطا در ثبت لاگ رهبری: {e}")
+
+    # ================== گرفتن و آزاد کردن رهبری ==================
+
+    def try_acquire(self, job_name: str) -> bool:
+        """
+        تلاش برای گرفتن رهبری یک کار (غیرمسدودکننده).
+        اگر این پروسه از قبل رهبر باشد، سلامت اتصال بررسی می‌شود.
+        """
+        with self._lock:
+            if job_name in self._held:
+                if self._is_connection_alive(self._held[job_name]):
+                    return True
+                # اتصال قبلی قطع شده؛ قفل در سمت سرور آزاد شده است
+                self._drop_connection(job_name)
+
+            conn = None
+            try:
+                conn = self._lock_engine.connect()
+                acquired = conn.execute(
+                    text("SELECT pg_try_advisory_lock(:ns, hashtext(:job))"),
+                    {"ns": JOB_LOCK_NAMESPACE, "job": job_name}
+                ).scalar()
+            except Exception as e:
+                logging.error(f"خطا در گرفتن قفل رهبری {job_name}: {e}")
+                if conn is not None:
+                    conn.close()
+                return False
+
+            if not acquired:
+                conn.close()
+                return False
+
+            self._held[job_name] = conn
+            self._acquired_at[job_name] = datetime.now()
+            self._log_activity("JOB_LEADER_ACQUIRED", f"رهبری کار {job_name} گرفته شد")
+            return True
+
+    def release(self, job_name: str) -> None:
+        """آزاد کردن رهبری یک کار"""
+        with self._lock:
+            conn = self._held.get(job_name)
+            if conn is None:
+                return
+            try:
+                conn.execute(
+                    text("SELECT pg_advisory_unlock(:ns, hashtext(:job))"),
+                    {"ns": JOB_LOCK_NAMESPACE, "job": job_name}
+                )
+            except Exception as e:
+                logging.warning(f"خطا در آزادسازی قفل {job_name}: {e}")
+            finally:
+                self._drop_connection(job_name)
+            self._log_activity("JOB_LEADER_RELEASED", f"رهبری کار {job_name} آزاد شد")
+
+    def release_all(self) -> None:
+        """آزاد کردن همه قفل‌ها (هنگام بستن برنامه)"""
+        with self._lock:
+            for job_name in list(self._held):
+                self.release(job_name)
+
+    def is_leader(self, job_name: str) -> bool:
+        """آیا این پروسه رهبر کار مشخص‌شده است؟"""
+        with self._lock:
+            return job_name in self._held
+
+    def ensure_leadership(self, job_names: Optional[List[str]] = None) -> Dict[str, bool]:
+        """
+        Heartbeat: برای هر کار، اگر رهبر نیستیم تلاش می‌کنیم رهبر شویم و
+        اگر هستیم سلامت اتصال را بررسی می‌کنیم. به صورت دوره‌ای فراخوانی شود.
+        """
+        names = job_names or list(BACKGROUND_JOBS)
+        return {name: self.try_acquire(name) for name in names}
+
+    def run_if_leader(self, job_name: str, func: Callable, *args, **kwargs) -> Any:
+        """اجرای تابع فقط در صورتی که این پروسه رهبر کار باشد"""
+        if not self.try_acquire(job_name):
+            return None
+        return func(*args, **kwargs)
+
+    # ================== نمای مدیریت ==================
+
+    def get_leadership_status(self) -> List[Dict[str, Any]]:
+        """
+        وضعیت رهبری همه کارهای ثبت‌شده برای نمای مدیریت.
+        دارنده قفل از pg_locks و pg_stat_activity خوانده می‌شود.
+        """
+        status = []
+        try:
+            with self._lock_engine.connect() as conn:
+                for job_name, label in BACKGROUND_JOBS.items():
+                    row = conn.execute(
+                        text("""
+                            SELECT a.pid, a.application_name, a.client_addr::text AS client_addr,
+                                   a.usename, a.backend_start
+                            FROM pg_locks l
+                            JOIN pg_stat_activity a ON a.pid = l.pid
+                            WHERE l.locktype = 'advisory'
+                              AND l.granted
+                              AND l.classid = :ns
+                              AND l.objid = hashtext(:job)::oid
+                              AND l.objsubid = 2
+                            LIMIT 1
+                        """),
+                        {"ns": JOB_LOCK_NAMESPACE, "job": job_name}
+                    ).mappings().first()
+
+                    status.append({
+                        'job_name': job_name,
+                        'label': label,
+                        'has_leader': row is not None,
+                        'is_local': self.is_leader(job_name),
+                        'acquired_at': self._acquired_at.get(job_name),
+                        'holder': (row['application_name'] or '').replace("MIV-Leader ", "") if row else None,
+                        'db_user': row['usename'] if row else None,
+                        'client_addr': row['client_addr'] if row else None,
+                        'pid': row['pid'] if row else None,
+                        'since': row['backend_start'] if row else None,
+                    })
+        except Exception as e:
+            logging.error(f"خطا در دریافت وضعیت رهبری: {e}")
+        return status
+
+    # ================== متدهای کمکی ==================
+
+    @staticmethod
+    def _is_connection_alive(conn: Connection) -> bool:
+        try:
+            conn.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            return False
+
+    def _drop_connection(self, job_name: str) -> None:
+        conn = self._held.pop(job_name, None)
+        self._acquired_at.pop(job_name, None)
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
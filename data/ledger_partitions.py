@@ -0,0 +1,189 @@
+# file: data/ledger_partitions.py
+"""
+نگهداری پارتیشن‌های ماهانه جدول inventory_transactions
+- هر ماه یک پارتیشن inventory_transactions_YYYYMM با بازه [اول ماه، اول ماه بعد)
+- پارتیشن ماه‌های آینده از پیش ساخته می‌شود؛ پارتیشن DEFAULT تراکنش ماهی را که
+  هنوز پارتیشن ندارد می‌پذیرد تا درج هرگز خطا ندهد و هنگام ساخت پارتیشن آن ماه
+  ردیف‌هایش از DEFAULT به پارتیشن جدید منتقل می‌شوند
+- پارتیشن‌های قدیمی از جدول جدا (DETACH) و به schema بایگانی منتقل می‌شوند؛
+  داده حذف نمی‌شود و با ATTACH دوباره قابل بازگشت است
+اگر جدول هنوز پارتیشن‌بندی نشده باشد (migration اجرا نشده) همه توابع کاری انجام نمی‌دهند.
+"""
+
+import logging
+import re
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import DBAPIError
+
+PARENT_TABLE = "inventory_transactions"
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+ARCHIVE_SCHEMA = "archive"
+
+_PARTITION_PATTERN = re.compile(rf"^{PARENT_TABLE}_(\d{{4}})(\d{{2}})$")
+
+
+def month_start(value) -> date:
+    """اول ماه تاریخ داده‌شده"""
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.replace(day=1)
+
+
+def add_months(value: date, months: int) -> date:
+    month_index = value.year * 12 + value.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_{month:%Y%m}"
+
+
+def is_partitioned(conn: Connection) -> bool:
+    return bool(conn.execute(text("""
+        SELECT 1 FROM pg_partitioned_table p
+        JOIN pg_class c ON c.oid = p.partrelid
+        WHERE c.relname = :table AND c.relnamespace = 'public'::regnamespace
+    """), {'table': PARENT_TABLE}).scalar())
+
+
+def list_partitions(conn: Connection) -> List[date]:
+    """ماه‌های پارتیشن‌های متصل به جدول (مرتب)"""
+    rows = conn.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits i
+        JOIN pg_class parent ON parent.oid = i.inhparent
+        JOIN pg_class child ON child.oid = i.inhrelid
+        WHERE parent.relname = :table AND parent.relnamespace = 'public'::regnamespace
+    """), {'table': PARENT_TABLE}).scalars()
+    months = []
+    for name in rows:
+        match = _PARTITION_PATTERN.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def ensure_default_partition(conn: Connection) -> None:
+    """پارتیشن DEFAULT برای تراکنش ماه‌هایی که پارتیشن ندارند"""
+    conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{DEFAULT_PARTITION}" PARTITION OF {PARENT_TABLE} DEFAULT'))
+
+
+def default_partition_months(conn: Connection) -> List[date]:
+    """ماه‌هایی که ردیفشان در پارتیشن DEFAULT مانده است"""
+    rows = conn.execute(text(f"""
+        SELECT DISTINCT date_trunc('month', transaction_date)::date FROM "{DEFAULT_PARTITION}"
+    """)).scalars()
+    return sorted(rows)
+
+
+def ensure_partitions(conn: Connection, until: date, since: Optional[date] = None) -> List[str]:
+    """
+    ساخت پارتیشن‌های ناموجود از since (پیش‌فرض: ماه جاری) تا ماه until و برای
+    هر ماهی که ردیفش در پارتیشن DEFAULT مانده است (به جز ماه‌های بایگانی‌شده).
+    :return: نام پارتیشن‌های ساخته‌شده
+    """
+    if not is_partitioned(conn):
+        return []
+    ensure_default_partition(conn)
+    existing = set(list_partitions(conn))
+    month = month_start(since or date.today())
+    last = month_start(until)
+
+    months = []
+    while month <= last:
+        months.append(month)
+        month = add_months(month, 1)
+    archive_cutoff = archived_before(conn)
+    months += [m for m in default_partition_months(conn) if archive_cutoff is None or m >= archive_cutoff]
+
+    created = []
+    for month in sorted(set(months) - existing):
+        name = partition_name(month)
+        try:
+            with conn.begin_nested():
+                _create_partition(conn, month)
+            created.append(name)
+        except DBAPIError as e:
+            # کلاینت دیگری هم‌زمان همین پارتیشن را ساخته است
+            logging.info(f"پارتیشن {name} ساخته نشد: {e.orig}")
+    return created
+
+
+def _create_partition(conn: Connection, month: date) -> None:
+    """
+    ساخت پارتیشن یک ماه. ردیف‌های آن ماه در DEFAULT مانع ساخت مستقیم می‌شوند؛
+    در آن صورت جدول جدا ساخته، ردیف‌ها منتقل و سپس ATTACH می‌شود.
+    """
+    name = partition_name(month)
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+    # درج هم‌زمان در DEFAULT تا پایان جابه‌جایی متوقف می‌ماند
+    conn.execute(text(f'LOCK TABLE "{DEFAULT_PARTITION}" IN SHARE ROW EXCLUSIVE MODE'))
+    has_rows = conn.execute(text(
+        f'SELECT 1 FROM "{DEFAULT_PARTITION}" '
+        f'WHERE transaction_date >= :start AND transaction_date < :end LIMIT 1'
+    ), {'start': start, 'end': end}).scalar()
+    if not has_rows:
+        conn.execute(text(
+            f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF {PARENT_TABLE} '
+            f"FOR VALUES FROM ('{start}') TO ('{end}')"
+        ))
+        return
+
+    conn.execute(text(
+        f'CREATE TABLE "{name}" (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+    ))
+    moved = conn.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM "{DEFAULT_PARTITION}"
+            WHERE transaction_date >= :start AND transaction_date < :end
+            RETURNING *
+        )
+        INSERT INTO "{name}" SELECT * FROM moved
+    """), {'start': start, 'end': end}).rowcount
+    conn.execute(text(
+        f'ALTER TABLE {PARENT_TABLE} ATTACH PARTITION "{name}" '
+        f"FOR VALUES FROM ('{start}') TO ('{end}')"
+    ))
+    logging.info(f"{moved} تراکنش از {DEFAULT_PARTITION} به پارتیشن {name} منتقل شد")
+
+
+def archive_partitions(conn: Connection, before: date, schema: str = ARCHIVE_SCHEMA) -> List[str]:
+    """
+    جدا کردن پارتیشن‌هایی که کل بازه آن‌ها قبل از before است و انتقال به schema بایگانی.
+    :return: نام پارتیشن‌های بایگانی‌شده
+    """
+    if not is_partitioned(conn):
+        return []
+    cutoff = month_start(before)
+    archived = []
+    for month in list_partitions(conn):
+        if add_months(month, 1) > cutoff:
+            break
+        name = partition_name(month)
+        conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema}"'))
+        conn.execute(text(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION "{name}"'))
+        conn.execute(text(f'ALTER TABLE "{name}" SET SCHEMA "{schema}"'))
+        archived.append(name)
+    return archived
+
+
+def archived_before(conn: Connection, schema: str = ARCHIVE_SCHEMA) -> Optional[date]:
+    """
+    مرز بایگانی: تراکنش‌های قبل از این تاریخ در جدول اصلی نیستند (None یعنی چیزی بایگانی نشده).
+    مرز از خود پارتیشن‌های منتقل‌شده به schema بایگانی خوانده می‌شود.
+    """
+    rows = conn.execute(text("""
+        SELECT c.relname FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = :schema AND c.relkind IN ('r', 'p')
+    """), {'schema': schema}).scalars()
+    months = []
+    for name in rows:
+        match = _PARTITION_PATTERN.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return add_months(max(months), 1) if months else None
@@ -0,0 +1,137 @@
+# file: data/low_stock_monitor.py
+"""
+دریافت رویدادهای موجودی کم از PostgreSQL (LISTEN low_stock)
+- trigger جدول inventory_items فقط هنگام ورود/خروج یک آیتم از حالت موجودی کم
+  اعلان می‌فرستد؛ این کلاس آن‌ها را روی یک اتصال جداگانه دریافت می‌کند
+- اتصال LISTEN همیشه باز است؛ از engine جداگانه بدون pool (NullPool) گرفته
+  می‌شود تا یکی از اتصال‌های pool مشترک برنامه را اشغال نکند
+- poll(timeout) تا رسیدن اعلان یا پایان timeout منتظر می‌ماند و برای اجرا در
+  ترد پس‌زمینه است؛ رویدادها به مشترکین (subscribe) هم تحویل داده می‌شوند
+- در صورت قطع اتصال، پس از RECONNECT_SECONDS در poll بعدی دوباره وصل می‌شود
+"""
+
+import json
+import logging
+import select
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+LOW_STOCK_CHANNEL = "low_stock"
+# فاصله تلاش دوباره برای اتصال پس از خطا
+RECONNECT_SECONDS = 10.0
+
+
+class LowStockMonitor:
+    """شنونده کانال low_stock روی یک اتصال autocommit"""
+
+    def __init__(self, engine, channel: str = LOW_STOCK_CHANNEL):
+        """
+        Args:
+            engine: engine دیتابیس برنامه (فقط URL آن برای اتصال LISTEN استفاده می‌شود)
+            channel: نام کانال NOTIFY
+        """
+        self.engine = engine
+        self.channel = channel
+        self._listen_engine = None
+        self._connection = None
+        self._retry_at = 0.0
+        self._subscribers: List[Callable[[Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        """ثبت تابعی که برای هر رویداد موجودی کم صدا زده می‌شود"""
+        with self._lock:
+            if callback not in self._subscribers:
+                self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def poll(self, timeout: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        خواندن اعلان‌های رسیده.
+        :param timeout: حداکثر انتظار برای اولین اعلان (ثانیه)؛ 0 = بدون انتظار
+        :return: [{'id', 'warehouse_id', 'material_code', 'available_qty',
+                   'min_stock_level', 'is_low_stock'}, ...]
+        """
+        with self._lock:
+            if time.monotonic() < self._retry_at:
+                connection = None
+            else:
+                try:
+                    connection = self._connect()
+                except Exception as e:
+                    self._on_error(e)
+                    connection = None
+        if connection is None:
+            time.sleep(timeout)
+            return []
+
+        try:
+            # انتظار روی سوکت اتصال بدون نگه داشتن قفل (close از ترد دیگر مسدود نمی‌شود)
+            if timeout > 0 and not connection.notifies:
+                select.select([connection], [], [], timeout)
+            with self._lock:
+                if self._connection is None or self._connection.dbapi_connection is not connection:
+                    return []  # اتصال در حین انتظار بسته شده است
+                connection.poll()
+                notifies = list(connection.notifies)
+                connection.notifies.clear()
+                subscribers = list(self._subscribers)
+        except Exception as e:
+            with self._lock:
+                self._on_error(e)
+            return []
+
+        events = []
+        for notify in notifies:
+            try:
+                events.append(json.loads(notify.payload))
+            except ValueError:
+                logging.warning(f"اعلان نامعتبر روی کانال {self.channel}: {notify.payload}")
+
+        for event in events:
+            for callback in subscribers:
+                try:
+                    callback(event)
+                except Exception as e:
+                    logging.error(f"خطا در پردازش رویداد موجودی کم: {e}")
+        return events
+
+    def close(self) -> None:
+        with self._lock:
+            self._disconnect()
+            if self._listen_engine is not None:
+                self._listen_engine.dispose()
+                self._listen_engine = None
+
+    def _on_error(self, error: Exception) -> None:
+        logging.warning(f"خطا در دریافت اعلان‌های موجودی کم: {error}")
+        self._disconnect()
+        self._retry_at = time.monotonic() + RECONNECT_SECONDS
+
+    def _connect(self):
+        if self._connection is None:
+            if self._listen_engine is None:
+                self._listen_engine = create_engine(self.engine.url, poolclass=NullPool)
+            connection = self._listen_engine.raw_connection()
+            dbapi_connection = connection.dbapi_connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+            self._connection = connection
+        return self._connection.dbapi_connection
+
+    def _disconnect(self) -> None:
+        if self._connection is not None:
+            try:
+                self._connection.invalidate()  # بستن واقعی اتصال (حالت LISTEN/autocommit دارد)
+            except Exception:
+                pass
+            self._connection = None
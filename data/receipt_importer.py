@@ -0,0 +1,108 @@
+# file: data/receipt_importer.py
+"""
+خواندن فایل رسید کالا (XLSX/CSV) با قالب warehouse.xlsx
+ستون‌ها: کد کالا، نام کالا، مشخصه فنی، واحد سنجش، کد انبار، نام انبار، مصرف، مانده
+- اعداد فارسی با ممیز "/" (مثل ۱۲۳/۹۰۰۰) به float تبدیل می‌شوند
+- ستون مقدار دریافتی "مقدار" یا "Quantity" است؛ ستون "مانده" (موجودی، نه مقدار دریافتی)
+  فقط با balance_as_quantity=True به جای مقدار خوانده می‌شود
+- سطرهای نامعتبر (از جمله مقدار صفر/منفی یا قیمت منفی) با شماره سطر گزارش می‌شوند
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+# نام ستون فایل -> فیلد خط رسید
+RECEIPT_COLUMN_ALIASES = {
+    'material_code': ('کد کالا', 'material_code', 'Material Code', 'Item Code'),
+    'description': ('نام کالا', 'description', 'Description'),
+    'specification': ('مشخصه فنی', 'specification', 'Specification'),
+    'unit': ('واحد سنجش', 'unit', 'Unit'),
+    'warehouse_code': ('کد انبار', 'warehouse_code', 'Warehouse Code'),
+    'warehouse_name': ('نام انبار', 'warehouse_name', 'Warehouse Name'),
+    'quantity': ('مقدار', 'quantity', 'Quantity', 'QTY'),
+    'unit_price': ('قیمت واحد', 'unit_price', 'Unit Price'),
+    'size': ('سایز', 'size', 'Size'),
+    'heat_no': ('شماره ذوب', 'heat_no', 'Heat No'),
+    'remarks': ('توضیحات', 'remarks', 'Remarks'),
+}
+REQUIRED_FIELDS = ('material_code', 'warehouse_code', 'quantity')
+# ستون مانده موجودی؛ فقط برای ورود موجودی اولیه به جای مقدار دریافتی
+BALANCE_COLUMN = 'مانده'
+
+_DIGITS = str.maketrans('۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩', '01234567890123456789')
+
+
+def parse_number(value: Any) -> Optional[float]:
+    """'۱۲۳/۹۰۰۰' -> 123.9 ؛ مقدار خالی -> None"""
+    if value is None:
+        return None
+    text = str(value).strip().translate(_DIGITS)
+    if not text or text.lower() == 'nan':
+        return None
+    text = text.replace('٫', '.').replace('/', '.').replace(',', '').replace('٬', '')
+    return float(text)
+
+
+def _clean(value: Any) -> Optional[str]:
+    text = str(value).strip() if value is not None else ''
+    return text or None
+
+
+def read_receipt_file(file_path: str, balance_as_quantity: bool = False) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    خواندن خطوط رسید از فایل.
+    :param balance_as_quantity: نبود ستون مقدار، ستون "مانده" مقدار ورودی باشد (موجودی اولیه)
+    :return: (خطوط معتبر، پیام‌های خطا)
+    """
+    if file_path.lower().endswith(('.xlsx', '.xls')):
+        df = pd.read_excel(file_path, dtype=str).fillna('')
+    else:
+        df = pd.read_csv(file_path, dtype=str, encoding='utf-8-sig').fillna('')
+    df.columns = [str(c).strip() for c in df.columns]
+
+    columns = {}
+    for field, aliases in RECEIPT_COLUMN_ALIASES.items():
+        if field == 'quantity' and balance_as_quantity:
+            aliases = aliases + (BALANCE_COLUMN,)
+        for alias in aliases:
+            if alias in df.columns:
+                columns[field] = alias
+                break
+
+    missing = [field for field in REQUIRED_FIELDS if field not in columns]
+    if missing:
+        return [], [f"ستون‌های لازم در فایل {os.path.basename(file_path)} یافت نشد: {', '.join(missing)}"]
+
+    lines, errors = [], []
+    records = df[list(columns.values())].to_dict('records')
+    for row_no, record in enumerate(records, start=2):  # سطر 1 سرستون است
+        line = {field: _clean(record[column]) for field, column in columns.items()}
+        if not any(line.values()):
+            continue  # سطر کاملاً خالی
+        try:
+            line['quantity'] = parse_number(line.get('quantity'))
+        except ValueError:
+            errors.append(f"سطر {row_no}: مقدار نامعتبر")
+            continue
+        try:
+            line['unit_price'] = parse_number(line.get('unit_price')) or 0.0
+        except ValueError:
+            errors.append(f"سطر {row_no}: قیمت واحد نامعتبر")
+            continue
+        if not line.get('material_code') or not line.get('warehouse_code'):
+            errors.append(f"سطر {row_no}: کد کالا یا کد انبار خالی است")
+            continue
+        if balance_as_quantity and not line['quantity']:
+            continue  # مانده صفر در موجودی اولیه یعنی کالایی برای ورود نیست
+        if not line['quantity'] or line['quantity'] <= 0:
+            errors.append(f"سطر {row_no}: مقدار باید بزرگ‌تر از صفر باشد")
+            continue
+        if line['unit_price'] < 0:
+            errors.append(f"سطر {row_no}: قیمت واحد نمی‌تواند منفی باشد")
+            continue
+        line['row_no'] = row_no
+        lines.append(line)
+
+    return lines, errors
@@ -0,0 +1,192 @@
+# file: data/search_history_writer.py
+"""
+نویسنده بافرشده تاریخچه جستجو (MaterialSearchHistory)
+- رویدادها در یک صف درون‌حافظه‌ای قرار می‌گیرند و مسیر جستجو منتظر commit نمی‌ماند
+- یک ترد پس‌زمینه هر N رویداد یا هر T ثانیه آن‌ها را با یک INSERT چندردیفی می‌نویسد
+- اگر صف پر باشد رویداد دور ریخته و شمارش می‌شود (تاریخچه نباید جستجو را کند کند)
+- هنگام بستن برنامه باقی‌مانده صف نوشته می‌شود
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from models import MaterialSearchHistory
+
+# ستون‌هایی که هر رویداد می‌تواند داشته باشد (INSERT چندردیفی کلیدهای یکسان می‌خواهد)
+HISTORY_FIELDS = (
+    'search_term', 'search_filters', 'search_context',
+    'selected_item_code', 'selected_item_description', 'selected_warehouse_id',
+    'user_id', 'project_id', 'timestamp', 'was_successful', 'user_feedback',
+)
+
+
+class SearchHistoryWriter:
+    """صف و ترد نوشتن دسته‌ای تاریخچه جستجو"""
+
+    def __init__(
+        self,
+        session_factory,
+        flush_every: int = 200,
+        flush_seconds: float = 2.0,
+        max_queue: int = 10000
+    ):
+        """
+        Args:
+            session_factory: سازنده Session دیتابیس
+            flush_every: نوشتن پس از جمع شدن این تعداد رویداد
+            flush_seconds: حداکثر فاصله زمانی بین دو نوشتن
+            max_queue: ظرفیت صف؛ رویدادهای اضافه دور ریخته می‌شوند
+        """
+        self.session_factory = session_factory
+        self.flush_every = max(1, flush_every)
+        self.flush_seconds = flush_seconds
+
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=max_queue)
+        self._flush_requested = threading.Event()
+        self._flushed = threading.Condition()
+        self._closed = False
+        self._lock = threading.Lock()
+
+        self._submitted = 0
+        self._written = 0
+        self._dropped = 0
+        self._failed = 0
+        self._flushes = 0
+        self._pending_flushes = 0
+
+        self._thread = threading.Thread(target=self._run, name="SearchHistoryWriter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def dropped(self) -> int:
+        """تعداد رویدادهای دور ریخته‌شده (صف پر یا writer بسته)"""
+        return self._dropped
+
+    def submit(self, **event) -> bool:
+        """
+        افزودن یک رویداد به صف بدون انتظار.
+        :return: False اگر رویداد دور ریخته شد
+        """
+        if self._closed:
+            with self._lock:
+                self._dropped += 1
+            return False
+        # زمان رویداد همان لحظه ثبت است، نه لحظه نوشتن
+        event.setdefault('timestamp', datetime.utcnow())
+        row = {field: event.get(field) for field in HISTORY_FIELDS}
+        if row['was_successful'] is None:
+            row['was_successful'] = True
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            return False
+        with self._lock:
+            self._submitted += 1
+        return True
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """نوشتن فوری رویدادهای صف و انتظار برای پایان آن"""
+        if not self._thread.is_alive():
+            return self._queue.empty()
+        with self._flushed:
+            target = self._flushes + 1
+            self._flush_requested.set()
+            return self._flushed.wait_for(lambda: self._flushes >= target, timeout=timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """توقف ترد پس از نوشتن باقی‌مانده صف"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._queue.put(None, timeout=timeout)  # نشانه پایان
+        except queue.Full:
+            pass
+        self._thread.join(timeout=timeout)
+        if self._dropped:
+            logging.warning(f"{self._dropped} رویداد تاریخچه جستجو نوشته نشد")
+
+    def get_stats(self) -> Dict[str, int]:
+        """آمار صف برای گزارش"""
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'submitted': self._submitted,
+                'written': self._written,
+                'dropped': self._dropped,
+                'failed': self._failed,
+                'flushes': self._flushes,
+            }
+
+    # ================== ترد نوشتن ==================
+
+    def _run(self) -> None:
+        batch: List[Dict[str, Any]] = []
+        deadline = time.monotonic() + self.flush_seconds
+        stopping = False
+
+        while not stopping:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                row = self._queue.get(timeout=min(timeout, 0.5))
+                if row is None:
+                    stopping = True
+                else:
+                    batch.append(row)
+            except queue.Empty:
+                pass
+
+            due = (
+                stopping or len(batch) >= self.flush_every
+                or time.monotonic() >= deadline or self._flush_requested.is_set()
+            )
+            if not due:
+                continue
+
+            # آنچه تا این لحظه در صف است هم در همین دسته نوشته می‌شود
+            while len(batch) < self.flush_every * 4:
+                try:
+                    row = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+
+            if batch:
+                self._write(batch)
+                batch = []
+            deadline = time.monotonic() + self.flush_seconds
+
+            if self._flush_requested.is_set() and not self._queue.empty() and not stopping:
+                continue
+            self._flush_requested.clear()
+            with self._flushed:
+                self._flushes += 1
+                self._flushed.notify_all()
+
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        session = self.session_factory()
+        try:
+            session.execute(insert(MaterialSearchHistory).values(rows))
+            session.commit()
+            with self._lock:
+                self._written += len(rows)
+        except Exception as e:
+            session.rollback()
+            with self._lock:
+                self._failed += len(rows)
+            logging.error(f"خطا در نوشتن {len(rows)} رویداد تاریخچه جستجو: {e}")
+        finally:
+            session.close()
@@ -0,0 +1,297 @@
+# file: data/semantic_index.py
+"""
+ایندکس معنایی (embedding) شرح آیتم‌های موجودی - اختیاری
+- embedding همه شرح‌ها به صورت دسته‌ای روی CPU با sentence-transformers ساخته می‌شود
+- ماتریس float16 روی دیسک ذخیره و هنگام جستجو با mmap باز می‌شود
+- جستجوی top-k کسینوسی با ضرب ماتریسی بلوکی (بدون بارگذاری کل ماتریس به float32)
+- به‌روزرسانی افزایشی: فقط ردیف‌هایی که hash متن آن‌ها تغییر کرده دوباره embed می‌شوند
+- اگر کتابخانه یا فایل‌های مدل موجود نباشد، ایندکس غیرفعال است و نتیجه خالی برمی‌گرداند
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+import time
+import importlib.util
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Any
+
+import numpy as np
+
+from models import InventoryItem
+
+POINTER_FILE = "current.json"
+# تعداد ردیف در هر بلوک ضرب ماتریسی (حافظه موقت float32 = بلوک × بعد)
+QUERY_BLOCK_ROWS = 32768
+
+SEMANTIC_SUPPORT = importlib.util.find_spec("sentence_transformers") is not None
+
+
+def _text_hash(text: str) -> int:
+    """hash پایدار 64 بیتی متن برای تشخیص تغییر"""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+def _build_text(material_code: Optional[str], description: Optional[str]) -> str:
+    return f"{description or ''} {material_code or ''}".strip()
+
+
+class SemanticItemIndex:
+    """ایندکس embedding شرح آیتم‌ها با ذخیره float16 و mmap"""
+
+    def __init__(
+        self,
+        session_factory,
+        index_dir: str,
+        model_path: Optional[str],
+        batch_size: int = 64,
+        refresh_seconds: int = 600
+    ):
+        """
+        Args:
+            session_factory: سازنده Session دیتابیس
+            index_dir: پوشه ذخیره ماتریس embedding
+            model_path: مسیر محلی مدل sentence-transformers (خالی = غیرفعال)
+            batch_size: اندازه دسته embedding روی CPU
+            refresh_seconds: حداقل فاصله بین دو بررسی تغییرات موجودی
+        """
+        self.session_factory = session_factory
+        self.index_dir = index_dir
+        self.model_path = model_path
+        self.batch_size = batch_size
+        self.refresh_seconds = refresh_seconds
+
+        self._model = None
+        self._model_failed = False
+        self._embeddings: Optional[np.ndarray] = None
+        self._ids: Optional[np.ndarray] = None
+        self._warehouse_ids: Optional[np.ndarray] = None
+        self._hashes: Optional[np.ndarray] = None
+        self._meta: Dict[str, Any] = {}
+
+        self._lock = threading.RLock()
+        self._model_lock = threading.Lock()
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._last_check = 0.0
+
+        if self.available:
+            self._load()
+
+    @property
+    def available(self) -> bool:
+        """آیا کتابخانه و فایل‌های مدل در دسترس هستند؟"""
+        return (
+            SEMANTIC_SUPPORT and not self._model_failed
+            and bool(self.model_path) and os.path.exists(self.model_path)
+        )
+
+    # ================== جستجو ==================
+
+    def query(
+        self,
+        text: str,
+        top_k: int = 10,
+        warehouse_id: Optional[int] = None,
+        min_score: float = 0.6
+    ) -> List[Tuple[int, float]]:
+        """
+        top-k آیتم‌های نزدیک از نظر معنایی.
+        :return: [(inventory_item_id, cosine_score), ...] به ترتیب نزولی
+        """
+        if not self.available or not text:
+            return []
+        self._schedule_refresh()
+
+        with self._lock:
+            embeddings, ids, warehouse_ids = self._embeddings, self._ids, self._warehouse_ids
+        if embeddings is None or not len(ids):
+            return []
+
+        model = self._get_model()
+        if model is None:
+            return []
+        query_vec = model.encode([text], normalize_embeddings=True, convert_to_numpy=True)[0].astype(np.float32)
+
+        # ضرب بلوکی: هر بلوک float16 از mmap خوانده و فقط همان بلوک به float32 تبدیل می‌شود
+        scores = np.empty(len(ids), dtype=np.float32)
+        for start in range(0, len(ids), QUERY_BLOCK_ROWS):
+            block = np.asarray(embeddings[start:start + QUERY_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query_vec
+
+        if warehouse_id is not None:
+            scores[warehouse_ids != warehouse_id] = -1.0
+
+        candidates = np.flatnonzero(scores >= min_score)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(int(ids[i]), float(scores[i])) for i in candidates]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """اطلاعات ایندکس برای گزارش"""
+        with self._lock:
+            return {
+                'available': self.available,
+                'rows': int(len(self._ids)) if self._ids is not None else 0,
+                'dimensions': int(self._embeddings.shape[1]) if self._embeddings is not None else 0,
+                'built_at': self._meta.get('built_at'),
+                'model': self._meta.get('model'),
+            }
+
+    # ================== ساخت و به‌روزرسانی ==================
+
+    def refresh(self) -> Dict[str, int]:
+        """
+        همگام‌سازی embeddingها با جدول موجودی (فقط ردیف‌های جدید/تغییرکرده embed می‌شوند).
+        :return: {'embedded', 'deleted', 'total'}
+        """
+        if not self.available:
+            return {'embedded': 0, 'deleted': 0, 'total': 0}
+        model = self._get_model()
+        if model is None:
+            return {'embedded': 0, 'deleted': 0, 'total': 0}
+
+        session = self.session_factory()
+        try:
+            rows = session.query(
+                InventoryItem.id, InventoryItem.warehouse_id,
+                InventoryItem.material_code, InventoryItem.description
+            ).order_by(InventoryItem.id).all()
+        finally:
+            session.close()
+
+        with self._lock:
+            old_embeddings, old_ids, old_hashes = self._embeddings, self._ids, self._hashes
+        old_position = {int(item_id): pos for pos, item_id in enumerate(old_ids)} if old_ids is not None else {}
+        same_model = self._meta.get('model') == os.path.basename(os.path.normpath(self.model_path))
+
+        texts = [_build_text(code, description) for _, _, code, description in rows]
+        hashes = np.asarray([_text_hash(t) for t in texts], dtype=np.int64)
+        ids = np.asarray([row[0] for row in rows], dtype=np.int64)
+        warehouse_ids = np.asarray([row[1] for row in rows], dtype=np.int64)
+
+        reuse = {}  # موقعیت جدید -> موقعیت قدیم
+        to_embed = []
+        for pos, item_id in enumerate(ids.tolist()):
+            old_pos = old_position.get(item_id)
+            if same_model and old_pos is not None and old_hashes[old_pos] == hashes[pos]:
+                reuse[pos] = old_pos
+            else:
+                to_embed.append(pos)
+        deleted = len(set(old_position) - set(ids.tolist()))
+
+        if not to_embed and not deleted and old_ids is not None and len(old_ids) == len(ids):
+            return {'embedded': 0, 'deleted': 0, 'total': len(ids)}
+
+        started = time.perf_counter()
+        dim = model.get_sentence_embedding_dimension()
+        version = f"v{int(time.time() * 1000)}"
+        target = os.path.join(self.index_dir, version)
+        os.makedirs(target, exist_ok=True)
+
+        # نوشتن مستقیم در فایل mmap جدید تا کل ماتریس در حافظه ساخته نشود
+        matrix = np.lib.format.open_memmap(
+            os.path.join(target, "embeddings.npy"), mode="w+", dtype=np.float16, shape=(len(ids), dim)
+        )
+        if reuse:
+            new_positions = np.fromiter(reuse.keys(), dtype=np.int64, count=len(reuse))
+            old_positions = np.fromiter(reuse.values(), dtype=np.int64, count=len(reuse))
+            for start in range(0, len(new_positions), QUERY_BLOCK_ROWS):
+                chunk = slice(start, start + QUERY_BLOCK_ROWS)
+                matrix[new_positions[chunk]] = old_embeddings[old_positions[chunk]]
+
+        for start in range(0, len(to_embed), self.batch_size * 16):
+            positions = to_embed[start:start + self.batch_size * 16]
+            vectors = model.encode(
+                [texts[p] for p in positions], batch_size=self.batch_size,
+                normalize_embeddings=True, convert_to_numpy=True, show_progress_bar=False
+            )
+            matrix[positions] = vectors.astype(np.float16)
+        matrix.flush()
+        del matrix
+
+        np.save(os.path.join(target, "ids.npy"), ids)
+        np.save(os.path.join(target, "warehouse_ids.npy"), warehouse_ids)
+        np.save(os.path.join(target, "hashes.npy"), hashes)
+
+        meta = {
+            'version': version,
+            'model': os.path.basename(os.path.normpath(self.model_path)),
+            'built_at': datetime.now().isoformat(),
+        }
+        self._write_pointer(meta)
+        self._load()
+        self._remove_old_versions(version)
+
+        logging.info(
+            f"ایندکس معنایی به‌روز شد: {len(to_embed)} embedding جدید، {deleted} حذف، "
+            f"{len(ids)} کل ({time.perf_counter() - started:.1f} ثانیه)"
+        )
+        return {'embedded': len(to_embed), 'deleted': deleted, 'total': len(ids)}
+
+    def _schedule_refresh(self) -> None:
+        """اجرای refresh در ترد پس‌زمینه در صورت گذشت زمان کافی"""
+        now = time.monotonic()
+        if self._embeddings is not None and now - self._last_check < self.refresh_seconds:
+            return
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return
+        self._last_check = now
+
+        def _run():
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"خطا در به‌روزرسانی ایندکس معنایی: {e}")
+
+        self._refresh_thread = threading.Thread(target=_run, name="SemanticIndexRefresh", daemon=True)
+        self._refresh_thread.start()
+
+    def _get_model(self):
+        """بارگذاری تنبل مدل روی CPU؛ در صورت خطا ایندکس غیرفعال می‌شود"""
+        if self._model is not None or self._model_failed:
+            return self._model
+        with self._model_lock:
+            if self._model is None and not self._model_failed:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model_path, device="cpu")
+                except Exception as e:
+                    self._model_failed = True
+                    logging.warning(f"مدل معنایی از {self.model_path} بارگذاری نشد؛ مرحله معنایی غیرفعال است: {e}")
+        return self._model
+
+    # ================== ذخیره و بارگذاری ==================
+
+    def _write_pointer(self, meta: Dict[str, Any]) -> None:
+        pointer_tmp = os.path.join(self.index_dir, POINTER_FILE + ".tmp")
+        with open(pointer_tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(pointer_tmp, os.path.join(self.index_dir, POINTER_FILE))
+
+    def _remove_old_versions(self, current: str) -> None:
+        for name in os.listdir(self.index_dir):
+            path = os.path.join(self.index_dir, name)
+            if name != current and name.startswith("v") and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _load(self) -> None:
+        """باز کردن آخرین نسخه embeddingها با mmap"""
+        pointer = os.path.join(self.index_dir, POINTER_FILE)
+        if not os.path.exists(pointer):
+            return
+        try:
+            with open(pointer, encoding="utf-8") as f:
+                meta = json.load(f)
+            source = os.path.join(self.index_dir, meta['version'])
+            with self._lock:
+                self._embeddings = np.load(os.path.join(source, "embeddings.npy"), mmap_mode='r')
+                self._ids = np.load(os.path.join(source, "ids.npy"), mmap_mode='r')
+                self._warehouse_ids = np.load(os.path.join(source, "warehouse_ids.npy"), mmap_mode='r')
+                self._hashes = np.load(os.path.join(source, "hashes.npy"), mmap_mode='r')
+                self._meta = meta
+        except Exception as e:
+            logging.error(f"خطا در بارگذاری ایندکس معنایی از {self.index_dir}: {e}")
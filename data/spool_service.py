@@ -11,6 +11,7 @@ from sqlalchemy import func, desc
 from sqlalchemy.orm import joinedload
 
 from data.db_session import DBSessionManager
+from data.id_sequences import allocate_spool_ids, reseed_spool_sequence
 from data.constants import SPOOL_TYPE_MAPPING
 from models import (
     Spool, SpoolItem, SpoolConsumption, MIVRecord,
@@ -241,6 +242,8 @@ class SpoolService:
     def create_spool(self, spool_data: dict, items_data: List[dict]) -> Tuple[bool, str]:
         session = self._session_getter()
         try:
+            if not spool_data.get("spool_id"):
+                spool_data = dict(spool_data, spool_id=self._allocate_spool_id(session))
             existing_spool = session.query(Spool.id).filter(Spool.spool_id == spool_data["spool_id"]).first()
             if existing_spool:
                 return False, f"اسپولی با شناسه '{spool_data['spool_id']}' از قبل وجود دارد."
@@ -281,21 +284,41 @@ class SpoolService:
             session.close()
 
     def generate_next_spool_id(self) -> str:
+        """
+        شناسه اسپول بعدی از sequence (nextval)؛ شناسه گرفته‌شده به همین فراخوانی
+        تعلق دارد و کلاینت دیگری آن را نمی‌گیرد (تداخل با شناسه‌های import دستی
+        در _allocate_spool_id رفع می‌شود).
+        """
         session = self._session_getter()
         try:
-            last_spool = session.query(Spool).order_by(Spool.id.desc()).first()
-            if not last_spool:
-                return "S001"
-            last_id = last_spool.spool_id
-            numeric_parts = re.findall(r'\d+', last_id)
-            next_num = int(numeric_parts[-1]) + 1 if numeric_parts else last_spool.id + 1
-            return f"S{next_num:03d}"
+            spool_id = self._allocate_spool_id(session)
+            session.commit()
+            return spool_id
         except Exception as e:
+            session.rollback()
             logging.error(f"Error generating next spool ID: {e}")
-            return f"S_ERR_{datetime.now().microsecond}"
+            raise
         finally:
             session.close()
 
+    @classmethod
+    def _allocate_spool_id(cls, session) -> str:
+        """
+        گرفتن یک شناسه از spool_id_seq؛ اگر شناسه با import دستی اشغال شده باشد
+        sequence یک بار از بزرگ‌ترین شناسه موجود ادامه داده شده و دوباره گرفته می‌شود
+        """
+        spool_id = allocate_spool_ids(session)[0]
+        if cls._spool_id_exists(session, spool_id):
+            reseed_spool_sequence(session)
+            spool_id = allocate_spool_ids(session)[0]
+            if cls._spool_id_exists(session, spool_id):
+                raise RuntimeError(f"شناسه {spool_id} پس از همگام‌سازی spool_id_seq هم تکراری است")
+        return spool_id
+
+    @staticmethod
+    def _spool_id_exists(session, spool_id: str) -> bool:
+        return session.query(Spool.id).filter(Spool.spool_id == spool_id).first() is not None
+
     def get_spool_by_id(self, spool_id: str):
         session = self._session_getter()
         try:
@@ -0,0 +1,146 @@
+# file: data/stock_snapshots.py
+"""
+کدگذاری snapshotهای موجودی انبار (WarehouseStockSnapshot.stock_details)
+- وضعیت هر snapshot دو آرایه است: شناسه آیتم‌ها (مرتب) و ماتریس مقادیر
+  با ستون‌های SNAPSHOT_COLUMNS
+- فقط هر چند snapshot یک بار وضعیت کامل (FULL) ذخیره می‌شود؛ بقیه فقط
+  تفاوت با snapshot قبلی (DELTA) را نگه می‌دارند تا حجم JSON کوچک بماند
+- ساخت تفاوت، اعمال آن و مقایسه دو snapshot با عملیات برداری numpy انجام می‌شود
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+SNAPSHOT_COLUMNS = ('physical_qty', 'reserved_qty', 'available_qty', 'unit_price')
+SNAPSHOT_FULL = 'FULL'
+SNAPSHOT_DELTA = 'DELTA'
+# اختلاف کمتر از این مقدار تغییر حساب نمی‌شود (خطای ممیز شناور)
+EPSILON = 1e-9
+
+
+def empty_state() -> Tuple[np.ndarray, np.ndarray]:
+    return np.empty(0, dtype=np.int64), np.empty((0, len(SNAPSHOT_COLUMNS)), dtype=np.float64)
+
+
+def state_from_rows(rows) -> Tuple[np.ndarray, np.ndarray]:
+    """ساخت وضعیت از ردیف‌های (id, physical, reserved, available, unit_price)"""
+    if not rows:
+        return empty_state()
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    values = np.asarray([row[1:] for row in rows], dtype=np.float64)
+    np.nan_to_num(values, copy=False)
+    order = np.argsort(ids, kind='stable')
+    return ids[order], values[order]
+
+
+def encode_full(ids: np.ndarray, values: np.ndarray) -> Dict[str, Any]:
+    return {
+        'kind': SNAPSHOT_FULL,
+        'columns': list(SNAPSHOT_COLUMNS),
+        'ids': ids.tolist(),
+        'values': values.tolist(),
+        'chain_length': 0,
+    }
+
+
+def encode_delta(prev_ids: np.ndarray, prev_values: np.ndarray,
+                 ids: np.ndarray, values: np.ndarray,
+                 base_id: int, chain_length: int) -> Dict[str, Any]:
+    """تفاوت وضعیت جدید با وضعیت قبلی: ردیف‌های جدید/تغییرکرده و شناسه‌های حذف‌شده"""
+    _, new_pos, old_pos = np.intersect1d(ids, prev_ids, assume_unique=True, return_indices=True)
+    changed = np.any(np.abs(values[new_pos] - prev_values[old_pos]) > EPSILON, axis=1)
+    added_mask = ~np.isin(ids, prev_ids, assume_unique=True)
+    upsert_pos = np.sort(np.concatenate([new_pos[changed], np.flatnonzero(added_mask)]))
+    removed = np.setdiff1d(prev_ids, ids, assume_unique=True)
+    return {
+        'kind': SNAPSHOT_DELTA,
+        'base_id': base_id,
+        'columns': list(SNAPSHOT_COLUMNS),
+        'ids': ids[upsert_pos].tolist(),
+        'values': values[upsert_pos].tolist(),
+        'removed': removed.tolist(),
+        'chain_length': chain_length,
+    }
+
+
+def decode_arrays(details: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    ids = np.asarray(details.get('ids') or [], dtype=np.int64)
+    values = np.asarray(details.get('values') or [], dtype=np.float64).reshape(len(ids), len(SNAPSHOT_COLUMNS))
+    return ids, values
+
+
+def apply_delta(ids: np.ndarray, values: np.ndarray,
+                details: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """اعمال یک DELTA روی وضعیت قبلی"""
+    removed = np.asarray(details.get('removed') or [], dtype=np.int64)
+    delta_ids, delta_values = decode_arrays(details)
+
+    keep = ~np.isin(ids, removed) & ~np.isin(ids, delta_ids)
+    merged_ids = np.concatenate([ids[keep], delta_ids])
+    merged_values = np.concatenate([values[keep], delta_values])
+    order = np.argsort(merged_ids, kind='stable')
+    return merged_ids[order], merged_values[order]
+
+
+def materialize(chain: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    بازسازی وضعیت از زنجیره stock_details (اولی FULL و بقیه DELTA به ترتیب زمان)
+    """
+    if not chain:
+        return empty_state()
+    ids, values = decode_arrays(chain[0])
+    for details in chain[1:]:
+        ids, values = apply_delta(ids, values, details)
+    return ids, values
+
+
+def diff_states(ids_a: np.ndarray, values_a: np.ndarray,
+                ids_b: np.ndarray, values_b: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    هم‌ترازی دو وضعیت روی اجتماع شناسه‌ها و محاسبه برداری تفاوت‌ها.
+    آیتم غایب در یک طرف با مقادیر صفر در نظر گرفته می‌شود.
+    """
+    all_ids = np.union1d(ids_a, ids_b)
+    aligned_a = np.zeros((len(all_ids), len(SNAPSHOT_COLUMNS)), dtype=np.float64)
+    aligned_b = np.zeros_like(aligned_a)
+    in_a = np.isin(all_ids, ids_a, assume_unique=True)
+    in_b = np.isin(all_ids, ids_b, assume_unique=True)
+    aligned_a[in_a] = values_a[np.searchsorted(ids_a, all_ids[in_a])]
+    aligned_b[in_b] = values_b[np.searchsorted(ids_b, all_ids[in_b])]
+
+    delta = aligned_b - aligned_a
+    changed = in_a & in_b & np.any(np.abs(delta) > EPSILON, axis=1)
+    return {
+        'ids': all_ids,
+        'before': aligned_a,
+        'after': aligned_b,
+        'delta': delta,
+        'added': ~in_a & in_b,
+        'removed': in_a & ~in_b,
+        'changed': changed,
+    }
+
+
+def column(name: str) -> int:
+    return SNAPSHOT_COLUMNS.index(name)
+
+
+def totals(values: np.ndarray) -> Dict[str, float]:
+    """جمع مقادیر یک وضعیت (ارزش = موجودی فیزیکی × قیمت واحد)"""
+    physical = values[:, column('physical_qty')]
+    return {
+        'total_items': int(len(values)),
+        'total_quantity': float(physical.sum()),
+        'total_reserved': float(values[:, column('reserved_qty')].sum()),
+        'total_value': float((physical * values[:, column('unit_price')]).sum()),
+    }
+
+
+def needs_full(previous: Optional[Dict[str, Any]], delta: Dict[str, Any],
+               item_count: int, full_every: int) -> bool:
+    """آیا به جای DELTA باید وضعیت کامل ذخیره شود؟"""
+    if previous is None or delta['chain_length'] >= full_every:
+        return True
+    # اگر بیش از نیمی از آیتم‌ها تغییر کرده باشند DELTA صرفه‌ای ندارد
+    return len(delta['ids']) + len(delta['removed']) > item_count / 2
@@ -0,0 +1,201 @@
+# file: data/synonym_graph.py
+"""
+گراف مترادف کدهای متریال
+- هر ردیف تأییدشده MaterialSynonym یک یال بین primary_code و synonym_code است
+- کلاس‌های هم‌ارزی (بستار تعدی) با Union-Find نگه داشته می‌شوند
+- اطمینان هر کد هم‌ارز برابر بیشترین حاصل‌ضرب confidence_score روی مسیرهای
+  بین دو کد است؛ نتیجه گسترش هر کد در حافظه کش می‌شود
+"""
+
+import heapq
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set, Tuple, Any
+
+
+def _normalize(code: Optional[str]) -> str:
+    return (code or "").strip().upper()
+
+
+class SynonymGraph:
+    """گراف درون‌حافظه‌ای مترادف‌ها با گسترش وزن‌دار"""
+
+    def __init__(self):
+        self._adjacency: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self._parent: Dict[str, str] = {}
+        self._members: Dict[str, Set[str]] = {}
+        self._descriptions: Dict[str, Dict[str, float]] = {}  # description -> {code: weight}
+        self._expansions: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.RLock()
+
+        self.built_at: Optional[float] = None
+        self._build_seconds = 0.0
+        self._expansion_calls = 0
+        self._expansion_hits = 0
+        self._expansions_computed = 0
+        self._fanout_total = 0
+        self._fanout_max = 0
+
+    @property
+    def is_built(self) -> bool:
+        return self.built_at is not None
+
+    # ================== ساخت ==================
+
+    def build(self, rows: Iterable[Tuple[str, str, Optional[str], Optional[float]]]) -> None:
+        """
+        ساخت کامل گراف.
+        :param rows: (primary_code, synonym_code, synonym_description, confidence_score)
+        """
+        started = time.perf_counter()
+        with self._lock:
+            self._adjacency = defaultdict(dict)
+            self._parent = {}
+            self._members = {}
+            self._descriptions = {}
+            self._expansions = {}
+            for primary, synonym, description, confidence in rows:
+                self._add_edge(primary, synonym, description, confidence)
+            self.built_at = time.time()
+            self._build_seconds = time.perf_counter() - started
+
+    def add_edge(self, primary: str, synonym: str,
+                 description: Optional[str] = None, confidence: Optional[float] = None) -> None:
+        """افزودن یک مترادف تأییدشده بدون ساخت مجدد کل گراف"""
+        with self._lock:
+            self._add_edge(primary, synonym, description, confidence)
+            # فقط گسترش‌های کلاس تغییرکرده باطل می‌شوند
+            members = self._members.get(self._find(_normalize(primary)), set())
+            for code in members:
+                self._expansions.pop(code, None)
+
+    def _add_edge(self, primary, synonym, description, confidence) -> None:
+        primary, synonym = _normalize(primary), _normalize(synonym)
+        if not primary:
+            return
+        weight = min(max(confidence if confidence is not None else 0.5, 0.01), 1.0)
+        self._ensure_node(primary)
+        if description:
+            codes = self._descriptions.setdefault(description.strip().upper(), {})
+            codes[primary] = max(weight, codes.get(primary, 0.0))
+        if not synonym or synonym == primary:
+            return
+        self._ensure_node(synonym)
+        if weight > self._adjacency[primary].get(synonym, 0.0):
+            self._adjacency[primary][synonym] = weight
+            self._adjacency[synonym][primary] = weight
+        self._union(primary, synonym)
+
+    # ================== Union-Find ==================
+
+    def _ensure_node(self, code: str) -> None:
+        if code not in self._parent:
+            self._parent[code] = code
+            self._members[code] = {code}
+
+    def _find(self, code: str) -> str:
+        root = code
+        while self._parent.get(root, root) != root:
+            root = self._parent[root]
+        while self._parent.get(code, code) != root:
+            self._parent[code], code = root, self._parent[code]
+        return root
+
+    def _union(self, a: str, b: str) -> None:
+        root_a, root_b = self._find(a), self._find(b)
+        if root_a == root_b:
+            return
+        if len(self._members[root_a]) < len(self._members[root_b]):
+            root_a, root_b = root_b, root_a
+        self._parent[root_b] = root_a
+        self._members[root_a] |= self._members.pop(root_b)
+
+    # ================== گسترش ==================
+
+    def equivalence_class(self, code: str) -> Set[str]:
+        """همه کدهای هم‌ارز یک کد (شامل خودش)"""
+        code = _normalize(code)
+        with self._lock:
+            if code not in self._parent:
+                return {code} if code else set()
+            return set(self._members[self._find(code)])
+
+    def expand(self, code: str) -> Dict[str, float]:
+        """
+        کدهای هم‌ارز به همراه اطمینان (بیشترین حاصل‌ضرب وزن‌ها روی مسیر).
+        خود کد در خروجی نیست.
+        """
+        code = _normalize(code)
+        with self._lock:
+            self._expansion_calls += 1
+            cached = self._expansions.get(code)
+            if cached is not None:
+                self._expansion_hits += 1
+                return cached
+            if code not in self._adjacency:
+                return {}
+
+            # Dijkstra روی حاصل‌ضرب وزن‌ها (وزن‌ها ≤ 1 هستند، پس حریصانه صحیح است)
+            best = {code: 1.0}
+            heap = [(-1.0, code)]
+            while heap:
+                neg_score, node = heapq.heappop(heap)
+                score = -neg_score
+                if score < best.get(node, 0.0):
+                    continue
+                for neighbor, weight in self._adjacency[node].items():
+                    candidate = score * weight
+                    if candidate > best.get(neighbor, 0.0):
+                        best[neighbor] = candidate
+                        heapq.heappush(heap, (-candidate, neighbor))
+
+            del best[code]
+            self._expansions[code] = best
+            self._expansions_computed += 1
+            self._fanout_total += len(best)
+            self._fanout_max = max(self._fanout_max, len(best))
+            return best
+
+    def expand_query(self, query: str) -> Dict[str, float]:
+        """
+        گسترش یک عبارت جستجو: کدهای هم‌ارز کد وارد شده به علاوه کلاس کدهایی که
+        شرح مترادف آن‌ها شامل عبارت است.
+        """
+        expanded = dict(self.expand(query))
+        needle = _normalize(query)
+        if not needle:
+            return expanded
+        with self._lock:
+            described = [
+                (code, weight)
+                for description, codes in self._descriptions.items() if needle in description
+                for code, weight in codes.items()
+            ]
+        for code, weight in described:
+            for target, score in [(code, 1.0)] + list(self.expand(code).items()):
+                combined = weight * score
+                if target != needle and combined > expanded.get(target, 0.0):
+                    expanded[target] = combined
+        return expanded
+
+    # ================== آمار ==================
+
+    def get_stats(self) -> Dict[str, Any]:
+        """اندازه گراف و fan-out گسترش‌ها"""
+        with self._lock:
+            class_sizes = [len(members) for members in self._members.values()]
+            computed = self._expansions_computed
+            return {
+                'nodes': len(self._parent),
+                'edges': sum(len(n) for n in self._adjacency.values()) // 2,
+                'classes': len(class_sizes),
+                'largest_class': max(class_sizes, default=0),
+                'descriptions': len(self._descriptions),
+                'build_seconds': round(self._build_seconds, 4),
+                'expansion_calls': self._expansion_calls,
+                'expansion_cache_hits': self._expansion_hits,
+                'cached_expansions': len(self._expansions),
+                'avg_fanout': round(self._fanout_total / computed, 2) if computed else 0.0,
+                'max_fanout': self._fanout_max,
+            }
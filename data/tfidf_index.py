@@ -0,0 +1,291 @@
+# file: data/tfidf_index.py
+"""
+ایندکس TF-IDF (n-gram کاراکتری) روی کد و شرح آیتم‌های موجودی
+- شرح‌هایی مانند "ELBOW 90 LR BW A234 WPB SCH40 6\"" با ترتیب کلمات و
+  اختصارات متفاوت، با n-gram کاراکتری بهتر از SequenceMatcher تطبیق می‌شوند
+- ماتریس sparse به صورت اجزای CSR در فایل‌های .npy ذخیره و هنگام اجرا
+  با mmap باز می‌شود؛ بنابراین شروع کلاینت نیازی به ساخت دوباره ندارد
+- به‌روزرسانی افزایشی: فقط ردیف‌های تغییرکرده با همان واژگان تبدیل می‌شوند؛
+  اگر حجم تغییرات زیاد باشد (تغییر محسوس IDF) ایندکس از نو fit می‌شود
+"""
+
+import os
+import json
+import shutil
+import pickle
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Any
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from models import InventoryItem
+
+POINTER_FILE = "current.json"
+
+
+def build_document(material_code: Optional[str], description: Optional[str]) -> str:
+    """متن قابل ایندکس یک آیتم: کد + شرح با حروف بزرگ"""
+    return f"{material_code or ''} {description or ''}".upper().strip()
+
+
+class TfidfItemIndex:
+    """ایندکس TF-IDF پایدار روی دیسک با جستجوی top-k شباهت کسینوسی"""
+
+    def __init__(
+        self,
+        session_factory,
+        index_dir: str,
+        refresh_seconds: int = 300,
+        refit_ratio: float = 0.25
+    ):
+        """
+        Args:
+            session_factory: سازنده Session دیتابیس
+            index_dir: پوشه ذخیره ایندکس روی دیسک کلاینت
+            refresh_seconds: حداقل فاصله بین دو بررسی تغییرات موجودی
+            refit_ratio: اگر نسبت ردیف‌های تغییرکرده بیشتر از این باشد، fit کامل انجام می‌شود
+        """
+        self.session_factory = session_factory
+        self.index_dir = index_dir
+        self.refresh_seconds = refresh_seconds
+        self.refit_ratio = refit_ratio
+
+        self._vectorizer: Optional[TfidfVectorizer] = None
+        self._matrix: Optional[sp.csr_matrix] = None
+        self._ids: Optional[np.ndarray] = None
+        self._warehouse_ids: Optional[np.ndarray] = None
+        self._meta: Dict[str, Any] = {}
+
+        self._lock = threading.RLock()
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._last_check = 0.0
+
+        self._load()
+
+    # ================== جستجو ==================
+
+    def query(
+        self,
+        text: str,
+        top_k: int = 10,
+        warehouse_id: Optional[int] = None,
+        min_score: float = 0.3
+    ) -> List[Tuple[int, float]]:
+        """
+        top-k آیتم‌های مشابه بر اساس شباهت کسینوسی.
+        :return: [(inventory_item_id, score), ...] به ترتیب نزولی امتیاز
+        """
+        self._schedule_refresh()
+
+        with self._lock:
+            vectorizer, matrix = self._vectorizer, self._matrix
+            ids, warehouse_ids = self._ids, self._warehouse_ids
+        if vectorizer is None or matrix is None or not text:
+            return []
+
+        query_vec = vectorizer.transform([build_document(None, text)])
+        if not query_vec.nnz:
+            return []
+
+        # بردارها l2 نرمال هستند؛ ضرب داخلی همان شباهت کسینوسی است.
+        # ضرب ماتریس sparse در بردار چگال (SpMV) بسیار سریع‌تر از ضرب sparse×sparse است
+        scores = matrix @ query_vec.toarray().ravel()
+        if warehouse_id is not None:
+            scores[warehouse_ids != warehouse_id] = 0.0
+
+        candidates = np.flatnonzero(scores >= min_score)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(int(ids[i]), float(scores[i])) for i in candidates]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """اطلاعات ایندکس برای گزارش"""
+        with self._lock:
+            return {
+                'rows': int(self._matrix.shape[0]) if self._matrix is not None else 0,
+                'features': int(self._matrix.shape[1]) if self._matrix is not None else 0,
+                'built_at': self._meta.get('built_at'),
+                'fitted_at': self._meta.get('fitted_at'),
+            }
+
+    # ================== ساخت و به‌روزرسانی ==================
+
+    def refresh(self, force_refit: bool = False) -> Dict[str, int]:
+        """
+        همگام‌سازی ایندکس با جدول موجودی.
+        :return: {'changed', 'deleted', 'total', 'refit'}
+        """
+        session = self.session_factory()
+        try:
+            db_rows = session.query(InventoryItem.id, InventoryItem.updated_at).all()
+            db_ids = np.asarray([row[0] for row in db_rows], dtype=np.int64)
+
+            with self._lock:
+                ids = self._ids
+                matrix = self._matrix
+                vectorizer = self._vectorizer
+                last_updated = self._meta.get('max_updated_at')
+            last_updated = datetime.fromisoformat(last_updated) if last_updated else None
+
+            if ids is None or vectorizer is None:
+                force_refit = True
+                known = set()
+            else:
+                known = set(ids.tolist())
+
+            changed_ids = [
+                item_id for item_id, updated_at in db_rows
+                if item_id not in known or (updated_at and last_updated and updated_at > last_updated)
+            ]
+            deleted_ids = np.setdiff1d(ids, db_ids) if ids is not None else np.empty(0, dtype=np.int64)
+            max_updated = max((row[1] for row in db_rows if row[1]), default=None)
+
+            if not force_refit and not changed_ids and not len(deleted_ids):
+                return {'changed': 0, 'deleted': 0, 'total': len(db_ids), 'refit': 0}
+
+            refit = force_refit or (
+                (len(changed_ids) + len(deleted_ids)) > self.refit_ratio * max(len(ids), 1)
+            )
+            if refit:
+                changed_ids = db_ids.tolist()
+
+            # بارگذاری متن فقط برای ردیف‌های لازم
+            docs, new_ids, new_wh = [], [], []
+            for start in range(0, len(changed_ids), 5000):
+                chunk = changed_ids[start:start + 5000]
+                for item_id, wh_id, code, description in session.query(
+                    InventoryItem.id, InventoryItem.warehouse_id,
+                    InventoryItem.material_code, InventoryItem.description
+                ).filter(InventoryItem.id.in_(chunk)):
+                    new_ids.append(item_id)
+                    new_wh.append(wh_id)
+                    docs.append(build_document(code, description))
+        finally:
+            session.close()
+
+        started = time.perf_counter()
+        if refit:
+            vectorizer = TfidfVectorizer(
+                analyzer='char_wb', ngram_range=(2, 4),
+                sublinear_tf=True, dtype=np.float32
+            )
+            new_matrix = vectorizer.fit_transform(docs) if docs else None
+            all_ids = np.asarray(new_ids, dtype=np.int64)
+            all_wh = np.asarray(new_wh, dtype=np.int64)
+        else:
+            with self._lock:
+                warehouse_ids = self._warehouse_ids
+            keep = ~np.isin(ids, np.concatenate([np.asarray(new_ids, dtype=np.int64), deleted_ids]))
+            parts = [matrix[np.flatnonzero(keep)]]
+            if docs:
+                parts.append(vectorizer.transform(docs))
+            new_matrix = sp.vstack(parts, format='csr')
+            all_ids = np.concatenate([ids[keep], np.asarray(new_ids, dtype=np.int64)])
+            all_wh = np.concatenate([warehouse_ids[keep], np.asarray(new_wh, dtype=np.int64)])
+
+        if new_matrix is None:
+            return {'changed': 0, 'deleted': len(deleted_ids), 'total': 0, 'refit': int(refit)}
+
+        meta = dict(self._meta)
+        meta['built_at'] = datetime.now().isoformat()
+        meta['max_updated_at'] = max_updated.isoformat() if max_updated else None
+        if refit:
+            meta['fitted_at'] = meta['built_at']
+        self._save(vectorizer, new_matrix.astype(np.float32), all_ids, all_wh, meta)
+
+        logging.info(
+            f"ایندکس TF-IDF {'از نو ساخته' if refit else 'به‌روز'} شد: "
+            f"{len(docs)} ردیف تبدیل، {len(deleted_ids)} حذف، "
+            f"{len(all_ids)} کل ({time.perf_counter() - started:.1f} ثانیه)"
+        )
+        return {'changed': len(docs), 'deleted': len(deleted_ids), 'total': len(all_ids), 'refit': int(refit)}
+
+    def _schedule_refresh(self) -> None:
+        """اجرای refresh در ترد پس‌زمینه در صورت گذشت زمان کافی"""
+        now = time.monotonic()
+        if self._vectorizer is not None and now - self._last_check < self.refresh_seconds:
+            return
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return
+        self._last_check = now
+
+        def _run():
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"خطا در به‌روزرسانی ایندکس TF-IDF: {e}")
+
+        self._refresh_thread = threading.Thread(target=_run, name="TfidfIndexRefresh", daemon=True)
+        self._refresh_thread.start()
+
+    # ================== ذخیره و بارگذاری ==================
+
+    def _save(self, vectorizer, matrix: sp.csr_matrix, ids: np.ndarray,
+              warehouse_ids: np.ndarray, meta: Dict[str, Any]) -> None:
+        """
+        ذخیره در یک پوشه نسخه‌دار جدید و سپس جابه‌جایی اشاره‌گر current.json؛
+        خواننده‌ها هیچ‌وقت فایل نیمه‌نوشته نمی‌بینند.
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+        version = f"v{int(time.time() * 1000)}"
+        target = os.path.join(self.index_dir, version)
+        os.makedirs(target)
+
+        matrix.sort_indices()
+        np.save(os.path.join(target, "data.npy"), matrix.data)
+        np.save(os.path.join(target, "indices.npy"), matrix.indices)
+        np.save(os.path.join(target, "indptr.npy"), matrix.indptr)
+        np.save(os.path.join(target, "ids.npy"), ids)
+        np.save(os.path.join(target, "warehouse_ids.npy"), warehouse_ids)
+        with open(os.path.join(target, "vectorizer.pkl"), "wb") as f:
+            pickle.dump(vectorizer, f)
+
+        meta = dict(meta, version=version, shape=list(matrix.shape))
+        pointer_tmp = os.path.join(self.index_dir, POINTER_FILE + ".tmp")
+        with open(pointer_tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(pointer_tmp, os.path.join(self.index_dir, POINTER_FILE))
+
+        self._load()
+
+        # نسخه‌های قبلی پس از باز شدن نسخه جدید حذف می‌شوند؛ روی ویندوز فایل mmap شده
+        # قفل است و حذف آن به دفعه بعد موکول می‌شود
+        for name in os.listdir(self.index_dir):
+            path = os.path.join(self.index_dir, name)
+            if name != version and name.startswith("v") and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _load(self) -> None:
+        """باز کردن آخرین نسخه ایندکس از دیسک با mmap"""
+        pointer = os.path.join(self.index_dir, POINTER_FILE)
+        if not os.path.exists(pointer):
+            return
+        try:
+            with open(pointer, encoding="utf-8") as f:
+                meta = json.load(f)
+            source = os.path.join(self.index_dir, meta['version'])
+
+            def _open(name):
+                return np.load(os.path.join(source, name), mmap_mode='r')
+
+            matrix = sp.csr_matrix(
+                (_open("data.npy"), _open("indices.npy"), _open("indptr.npy")),
+                shape=tuple(meta['shape']), copy=False
+            )
+            with open(os.path.join(source, "vectorizer.pkl"), "rb") as f:
+                vectorizer = pickle.load(f)
+
+            with self._lock:
+                self._matrix = matrix
+                self._vectorizer = vectorizer
+                self._ids = _open("ids.npy")
+                self._warehouse_ids = _open("warehouse_ids.npy")
+                self._meta = meta
+        except Exception as e:
+            logging.error(f"خطا در بارگذاری ایندکس TF-IDF از {self.index_dir}: {e}")
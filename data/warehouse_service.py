@@ -4,11 +4,23 @@
 شامل عملیات CRUD انبار، موجودی، رزرو و تراکنش‌ها
 """
 
+import math
+import os
+import time
+import logging
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Tuple, Any
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
 
+import numpy as np
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, func, case, text, tuple_, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from data import stock_snapshots
+from data.id_sequences import allocate_reservation_nos
+from data.receipt_importer import read_receipt_file
+from data.low_stock_monitor import LowStockMonitor
+from data import ledger_partitions
 # import از models.py
 from models import (
     Base,
@@ -18,9 +30,17 @@ from models import (
     InventoryItem,
     InventoryTransaction,
     MaterialReservation,
-    InventoryAdjustment
+    InventoryAdjustment,
+    WarehouseStockSnapshot
 )
 
+# نوع snapshotها (ستون WarehouseStockSnapshot.kind): وضعیت آیتم‌ها برای گزارش و
+# نقطه بازبینی دفتر تراکنش‌ها (مانده هر آیتم در ابتدای ماه)
+SNAPSHOT_STATE_KIND = 'STATE'
+LEDGER_CHECKPOINT_KIND = 'LEDGER_CHECKPOINT'
+# اعتبار cache کد انبار -> id (انبار ممکن است از کلاینت دیگری تغییر کند)
+WAREHOUSE_ID_TTL_SECONDS = 300
+
 
 class WarehouseService:
     """سرویس مدیریت انبار"""
@@ -33,6 +53,14 @@ class WarehouseService:
         """
         self.session_factory = session_factory
         self.activity_logger = activity_logger
+        self._low_stock_monitor: Optional[LowStockMonitor] = None
+        self._warehouse_ids: Dict[str, Tuple[int, float]] = {}  # cache کد انبار -> (id, زمان)
+
+    def close(self) -> None:
+        """بستن اتصال شنونده موجودی کم"""
+        if self._low_stock_monitor is not None:
+            self._low_stock_monitor.close()
+            self._low_stock_monitor = None
 
     def _log_activity(self, action: str, details: str = "", user: str = "System"):
         """ثبت لاگ فعالیت"""
@@ -40,18 +68,23 @@ class WarehouseService:
             self.activity_logger(user=user, action=action, details=details)
 
     def _generate_reservation_no(self, session: Session) -> str:
-        """تولید شماره رزرو یکتا"""
-        # آخرین شماره رزرو
-        last_reservation = session.query(MaterialReservation) \
-            .order_by(MaterialReservation.id.desc()).first()
-
-        if last_reservation:
-            last_no = int(last_reservation.reservation_no.split('-')[-1])
-            new_no = last_no + 1
-        else:
-            new_no = 1
+        """تولید شماره رزرو یکتا (nextval روی sequence ماه جاری، در همان تراکنش)"""
+        return allocate_reservation_nos(session, 1)[0]
 
-        return f"RES-{datetime.now().strftime('%Y%m')}-{new_no:05d}"
+    def generate_reservation_numbers(self, count: int, session: Session = None) -> List[str]:
+        """
+        تخصیص گروهی شماره رزرو برای رزروهای دسته‌ای در یک رفت‌وبرگشت.
+        با session داده‌شده، شماره‌ها داخل همان تراکنش درج گرفته می‌شوند.
+        """
+        if session is not None:
+            return allocate_reservation_nos(session, count)
+        own_session = self.session_factory()
+        try:
+            numbers = allocate_reservation_nos(own_session, count)
+            own_session.commit()
+            return numbers
+        finally:
+            own_session.close()
 
     # ================== مدیریت انبار ==================
 
@@ -74,6 +107,7 @@ class WarehouseService:
             session.add(warehouse)
             session.commit()
             session.refresh(warehouse)
+            self._warehouse_ids.clear()
 
             self._log_activity(
                 action="CREATE_WAREHOUSE",
@@ -122,6 +156,7 @@ class WarehouseService:
             warehouse.updated_at = datetime.utcnow()
             session.commit()
             session.refresh(warehouse)
+            self._warehouse_ids.clear()  # کد انبار ممکن است تغییر کرده باشد
 
             self._log_activity(
                 action="UPDATE_WAREHOUSE",
@@ -151,6 +186,7 @@ class WarehouseService:
                 raise ValueError(f"انبار با کد {warehouse_code} یافت نشد")
 
             # بررسی عدم تکرار
+            self._lock_item_keys(session, [(warehouse.id, material_code)])
             existing = session.query(InventoryItem).filter_by(
                 warehouse_id=warehouse.id,
                 material_code=material_code,
@@ -254,7 +290,7 @@ class WarehouseService:
                 query = query.filter(InventoryItem.material_code.like(f"%{material_code}%"))
 
             if low_stock_only:
-                query = query.filter(InventoryItem.available_qty <= InventoryItem.min_stock_level)
+                query = query.filter(InventoryItem.is_low_stock)
 
             return query.order_by(InventoryItem.material_code).all()
 
@@ -295,13 +331,175 @@ class WarehouseService:
         available = item.available_qty
         return available >= required_qty, available
 
+    def check_availability_bulk(self, warehouse_code: str,
+                                items: List[Tuple[str, Optional[str], float]]) -> List[Dict[str, Any]]:
+        """
+        بررسی موجودی چند کالا با یک کوئری.
+        درخواست‌های تکراری یک آیتم با هم جمع می‌شوند.
+
+        :param items: [(material_code, size, required_qty), ...]
+        :return: به ترتیب ورودی [{'material_code', 'size', 'required_qty', 'total_required',
+                  'available_qty', 'is_available', 'inventory_item_id'}, ...]
+        """
+        session = self.session_factory()
+        try:
+            warehouse_id = self._get_warehouse_id(session, warehouse_code)
+            resolved = self._resolve_request_items(session, warehouse_id, items) if warehouse_id else [None] * len(items)
+            return self._availability_rows(items, resolved)
+        finally:
+            session.close()
+
+    def _resolve_request_items(self, session: Session, warehouse_id: int,
+                               items: List[Tuple[str, Optional[str], float]],
+                               lock: bool = False) -> List[Optional[InventoryItem]]:
+        """
+        پیدا کردن آیتم هر درخواست با یک کوئری؛ با lock ردیف‌ها به ترتیب id قفل می‌شوند
+        تا دو رزرو گروهی هم‌زمان بن‌بست نشوند. مثل check_availability اولین آیتم
+        (کمترین id) با کد و سایز درخواستی انتخاب می‌شود.
+        """
+        codes = sorted({code for code, _, _ in items})
+        query = session.query(InventoryItem).filter(
+            InventoryItem.warehouse_id == warehouse_id,
+            InventoryItem.material_code.in_(codes)
+        ).order_by(InventoryItem.id)
+        if lock:
+            query = query.with_for_update()
+
+        candidates: Dict[str, List[InventoryItem]] = {}
+        for item in query:
+            candidates.setdefault(item.material_code, []).append(item)
+
+        resolved = []
+        for code, size, _ in items:
+            matches = [item for item in candidates.get(code, []) if not size or item.size == size]
+            resolved.append(matches[0] if matches else None)
+        return resolved
+
+    @staticmethod
+    def _availability_rows(items: List[Tuple[str, Optional[str], float]],
+                           resolved: List[Optional[InventoryItem]]) -> List[Dict[str, Any]]:
+        """مقایسه مقدار درخواستی تجمعی هر آیتم با موجودی قابل تخصیص آن"""
+        requested: Dict[int, float] = {}
+        for (_, _, qty), item in zip(items, resolved):
+            if item is not None:
+                requested[item.id] = requested.get(item.id, 0) + qty
+
+        rows = []
+        for (code, size, qty), item in zip(items, resolved):
+            available = (item.available_qty or 0) if item is not None else 0
+            rows.append({
+                'material_code': code,
+                'size': size,
+                'required_qty': qty,
+                'total_required': requested[item.id] if item is not None else qty,
+                'available_qty': available,
+                'is_available': item is not None and available >= requested[item.id],
+                'inventory_item_id': item.id if item is not None else None,
+            })
+        return rows
+
     # ================== عملیات رزرو ==================
 
+    def reserve_materials_bulk(self, warehouse_code: str,
+                               items: List[Tuple[str, Optional[str], float]],
+                               project_id: int = None, miv_record_id: int = None,
+                               line_no: str = None, reserved_by: str = None,
+                               remarks: str = None, expiry_date: datetime = None) -> List[Dict[str, Any]]:
+        """
+        رزرو چند کالا در یک تراکنش (همه یا هیچ)
+        - آیتم‌ها با یک کوئری پیدا و به ترتیب id قفل می‌شوند (FOR UPDATE)
+        - شماره‌های رزرو با یک nextval گروهی گرفته و رزروها با یک INSERT چندردیفی درج می‌شوند
+        - اگر هر کدام از اقلام موجودی کافی نداشته باشد هیچ رزروی ثبت نمی‌شود
+
+        :param items: [(material_code, size, quantity), ...]
+        :return: [{'id', 'reservation_no', 'inventory_item_id', 'material_code', 'size', 'reserved_qty'}, ...]
+        """
+        if not items:
+            return []
+
+        session = self.session_factory()
+        try:
+            warehouse_id = self._get_warehouse_id(session, warehouse_code)
+            if warehouse_id is None:
+                raise ValueError(f"انبار {warehouse_code} یافت نشد")
+
+            resolved = self._resolve_request_items(session, warehouse_id, items, lock=True)
+            shortages = [
+                f"{row['material_code']} (درخواست {row['total_required']}، موجود {row['available_qty']})"
+                if row['inventory_item_id'] else f"{row['material_code']} (در انبار یافت نشد)"
+                for row in self._availability_rows(items, resolved) if not row['is_available']
+            ]
+            if shortages:
+                raise ValueError(f"موجودی کافی نیست: {'، '.join(shortages)}")
+
+            reservation_nos = self.generate_reservation_numbers(len(items), session=session)
+            now = datetime.utcnow()
+            rows = [
+                {
+                    'inventory_item_id': item.id,
+                    'reservation_no': reservation_no,
+                    'reserved_qty': qty,
+                    'consumed_qty': 0,
+                    'remaining_qty': qty,
+                    'project_id': project_id,
+                    'miv_record_id': miv_record_id,
+                    'line_no': line_no,
+                    'status': 'ACTIVE',
+                    'reservation_date': now,
+                    'expiry_date': expiry_date,
+                    'reserved_by': reserved_by,
+                    'remarks': remarks,
+                    'created_at': now,
+                    'updated_at': now,
+                }
+                for (_, _, qty), item, reservation_no in zip(items, resolved, reservation_nos)
+            ]
+            inserted = session.execute(
+                insert(MaterialReservation).values(rows).returning(
+                    MaterialReservation.id, MaterialReservation.reservation_no
+                )
+            ).all()
+            ids = {reservation_no: reservation_id for reservation_id, reservation_no in inserted}
+
+            # به‌روزرسانی موجودی آیتم‌های قفل‌شده
+            for (_, _, qty), item in zip(items, resolved):
+                item.reserved_qty = (item.reserved_qty or 0) + qty
+                item.available_qty = item.physical_qty - item.reserved_qty
+                item.updated_at = now
+
+            session.commit()
+
+            self._log_activity(
+                action="RESERVE_MATERIALS_BULK",
+                details=f"رزرو گروهی {len(rows)} قلم از انبار {warehouse_code}"
+                        + (f" برای خط {line_no}" if line_no else "")
+            )
+
+            return [
+                {
+                    'id': ids[row['reservation_no']],
+                    'reservation_no': row['reservation_no'],
+                    'inventory_item_id': row['inventory_item_id'],
+                    'material_code': code,
+                    'size': size,
+                    'reserved_qty': row['reserved_qty'],
+                }
+                for (code, size, _), row in zip(items, rows)
+            ]
+
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+
     def reserve_material(self, warehouse_code: str, material_code: str,
                          quantity: float, project_id: int = None,
                          miv_record_id: int = None, line_no: str = None,
-                         reserved_by: str = None, remarks: str = None) -> MaterialReservation:
-        """رزرو کالا"""
+                         reserved_by: str = None, remarks: str = None,
+                         expiry_date: datetime = None) -> MaterialReservation:
+        """رزرو کالا (با expiry_date رزرو پس از آن تاریخ خودکار آزاد می‌شود)"""
         session = self.session_factory()
         try:
             # پیدا کردن کالا
@@ -333,6 +531,7 @@ class WarehouseService:
                 miv_record_id=miv_record_id,
                 line_no=line_no,
                 status='ACTIVE',
+                expiry_date=expiry_date,
                 reserved_by=reserved_by,
                 remarks=remarks
             )
@@ -485,6 +684,89 @@ class WarehouseService:
         finally:
             session.close()
 
+    def expire_reservations(self, batch_size: int = 5000, max_batches: int = None,
+                            now: datetime = None) -> Dict[str, Any]:
+        """
+        انقضای رزروهای فعالی که expiry_date آن‌ها گذشته است
+        هر دسته با یک دستور انجام می‌شود: انتخاب از ایندکس (status, expiry_date) با
+        SKIP LOCKED، تغییر وضعیت به EXPIRED و آزادسازی مانده رزرو از reserved_qty
+        آیتم‌ها با یک UPDATE مجموعه‌ای؛ هر دسته جداگانه commit می‌شود.
+
+        :return: {'expired', 'released_qty', 'items', 'batches', 'seconds'}
+        """
+        started = time.perf_counter()
+        now = now or datetime.utcnow()
+        totals = {'expired': 0, 'released_qty': 0.0, 'items': 0, 'batches': 0}
+
+        session = self.session_factory()
+        try:
+            while max_batches is None or totals['batches'] < max_batches:
+                expired, released_qty, items = session.execute(text("""
+                    WITH batch AS (
+                        SELECT id, inventory_item_id,
+                               GREATEST(COALESCE(reserved_qty, 0) - COALESCE(consumed_qty, 0), 0) AS qty
+                        FROM material_reservations
+                        WHERE status = 'ACTIVE' AND expiry_date < :now
+                        ORDER BY expiry_date
+                        LIMIT :batch_size
+                        FOR UPDATE SKIP LOCKED
+                    ), locked AS (
+                        -- قفل آیتم‌ها به ترتیب id مثل رزرو گروهی تا بن‌بست پیش نیاید
+                        SELECT id FROM inventory_items
+                        WHERE id IN (SELECT inventory_item_id FROM batch)
+                        ORDER BY id
+                        FOR UPDATE
+                    ), expired AS (
+                        UPDATE material_reservations r
+                        SET status = 'EXPIRED', updated_at = :now
+                        FROM batch
+                        WHERE r.id = batch.id
+                        RETURNING batch.inventory_item_id, batch.qty
+                    ), released AS (
+                        UPDATE inventory_items i
+                        SET reserved_qty = GREATEST(COALESCE(i.reserved_qty, 0) - e.qty, 0),
+                            available_qty = i.physical_qty - GREATEST(COALESCE(i.reserved_qty, 0) - e.qty, 0),
+                            updated_at = :now
+                        FROM (
+                            SELECT inventory_item_id, SUM(qty) AS qty
+                            FROM expired
+                            GROUP BY inventory_item_id
+                        ) e
+                        WHERE i.id = e.inventory_item_id
+                          AND i.id IN (SELECT id FROM locked)
+                        RETURNING i.id
+                    )
+                    SELECT (SELECT COUNT(*) FROM expired),
+                           (SELECT COALESCE(SUM(qty), 0) FROM expired),
+                           (SELECT COUNT(*) FROM released)
+                """), {'now': now, 'batch_size': batch_size}).one()
+                session.commit()
+
+                if not expired:
+                    break
+                totals['expired'] += expired
+                totals['released_qty'] += float(released_qty)
+                totals['items'] += items
+                totals['batches'] += 1
+                if expired < batch_size:
+                    break
+
+        except Exception as e:
+            session.rollback()
+            logging.error(f"خطا در انقضای رزروها: {e}")
+            raise
+        finally:
+            session.close()
+
+        totals['seconds'] = round(time.perf_counter() - started, 2)
+        if totals['expired']:
+            self._log_activity(
+                action="EXPIRE_RESERVATIONS",
+                details=f"{totals['expired']} رزرو منقضی شد؛ {totals['released_qty']} واحد از "
+                        f"{totals['items']} آیتم آزاد شد ({totals['seconds']} ثانیه)"
+            )
+        return totals
+
     # ================== تراکنش‌های انبار ==================
 
     def record_inventory_in(self, warehouse_code: str, material_code: str,
@@ -500,6 +782,7 @@ class WarehouseService:
             if not warehouse:
                 raise ValueError(f"انبار {warehouse_code} یافت نشد")
 
+            self._lock_item_keys(session, [(warehouse.id, material_code)])
             item = session.query(InventoryItem).filter_by(
                 warehouse_id=warehouse.id,
                 material_code=material_code,
@@ -573,6 +856,262 @@ class WarehouseService:
         finally:
             session.close()
 
+    def record_inventory_in_bulk(self, lines: List[Dict[str, Any]],
+                                 reference_type: str = "RECEIPT", reference_no: str = None,
+                                 performed_by: str = None, create_warehouses: bool = False,
+                                 batch_size: int = 1000) -> Dict[str, Any]:
+        """
+        ثبت گروهی رسید کالا در یک تراکنش
+        - انبارها و آیتم‌ها با کوئری‌های دسته‌ای پیدا و آیتم‌های جدید با
+          ON CONFLICT روی uq_inventory_item درج می‌شوند
+        - خطوط در یک جدول موقت نوشته و تراکنش‌های ورود با یک INSERT ... SELECT
+          ساخته می‌شوند؛ balance_before/after با SUM() OVER روی خطوط هر آیتم
+        - موجودی و قیمت میانگین موزون آیتم‌ها با یک UPDATE به‌روز می‌شود
+        - رسید همه یا هیچ است: با هر خط نامعتبر هیچ چیز ثبت نمی‌شود و خطاها
+          برگردانده می‌شوند تا فایل اصلاح‌شده با همان شماره مرجع دوباره وارد شود
+
+        :param lines: [{'warehouse_code', 'material_code', 'quantity', 'unit_price',
+                        'size', 'heat_no', 'description', 'specification', 'unit', 'remarks'}, ...]
+        :return: {'lines', 'items_created', 'transactions', 'total_quantity', 'errors', 'seconds'}
+        :raises ValueError: اگر رسیدی با همین reference_type و reference_no قبلاً ثبت شده باشد
+        """
+        started = time.perf_counter()
+        errors = []
+        session = self.session_factory()
+        try:
+            # 0. رسید تکراری؛ قفل advisory روی شماره مرجع تا دو ورود هم‌زمان هر دو از بررسی رد نشوند
+            if reference_no:
+                session.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+                                {'key': f"{reference_type}:{reference_no}"})
+                duplicate = session.query(InventoryTransaction.id).filter(
+                    InventoryTransaction.reference_type == reference_type,
+                    InventoryTransaction.reference_no == reference_no
+                ).first()
+                if duplicate:
+                    raise ValueError(f"رسید با شماره مرجع {reference_no} قبلاً ثبت شده است")
+
+            # 1. انبارها
+            codes = {str(line['warehouse_code']).strip() for line in lines}
+            warehouses = dict(session.query(Warehouse.code, Warehouse.id).filter(Warehouse.code.in_(codes)).all())
+            missing = codes - set(warehouses)
+            if missing and create_warehouses:
+                names = {str(line['warehouse_code']).strip(): line.get('warehouse_name') for line in lines}
+                session.execute(pg_insert(Warehouse).values([
+                    {'code': code, 'name': names.get(code) or code, 'is_active': True}
+                    for code in sorted(missing)
+                ]).on_conflict_do_nothing(index_elements=['code']))
+                warehouses = dict(session.query(Warehouse.code, Warehouse.id).filter(Warehouse.code.in_(codes)).all())
+                missing = codes - set(warehouses)
+
+            valid = []
+            for line in lines:
+                wh_id = warehouses.get(str(line['warehouse_code']).strip())
+                if wh_id is None:
+                    errors.append(f"سطر {line.get('row_no', '?')}: انبار {line['warehouse_code']} یافت نشد")
+                    continue
+                try:
+                    quantity = float(line['quantity'])
+                except (TypeError, ValueError):
+                    quantity = 0.0
+                if not quantity > 0 or math.isinf(quantity):
+                    errors.append(f"سطر {line.get('row_no', '?')}: مقدار باید بزرگ‌تر از صفر باشد")
+                    continue
+                try:
+                    unit_price = float(line.get('unit_price') or 0)
+                except (TypeError, ValueError):
+                    unit_price = -1.0
+                if not 0 <= unit_price < math.inf:
+                    errors.append(f"سطر {line.get('row_no', '?')}: قیمت واحد نامعتبر است")
+                    continue
+                valid.append((self._item_key(wh_id, line),
+                              dict(line, quantity=quantity, unit_price=unit_price)))
+            if errors or not valid:
+                session.rollback()
+                return self._empty_receipt_result(errors, started)
+
+            # 2. آیتم‌های موجود (قفل به ترتیب id تا رسیدهای هم‌زمان بن‌بست نشوند)
+            items = {}
+            pairs = sorted({(key[0], key[1]) for key, _ in valid})
+            self._lock_item_keys(session, pairs)
+            for start in range(0, len(pairs), batch_size):
+                for item_id, wh_id, code, size, heat_no in session.query(
+                    InventoryItem.id, InventoryItem.warehouse_id, InventoryItem.material_code,
+                    InventoryItem.size, InventoryItem.heat_no
+                ).filter(
+                    tuple_(InventoryItem.warehouse_id, InventoryItem.material_code).in_(pairs[start:start + batch_size])
+                ).order_by(InventoryItem.id).with_for_update():
+                    items[self._item_key(wh_id, {'material_code': code, 'size': size, 'heat_no': heat_no})] = item_id
+
+            # 3. آیتم‌های جدید
+            new_items = {}
+            for key, line in valid:
+                if key not in items and key not in new_items:
+                    new_items[key] = {
+                        'warehouse_id': key[0], 'material_code': key[1], 'size': key[2], 'heat_no': key[3],
+                        'description': line.get('description'), 'specification': line.get('specification'),
+                        'unit': line.get('unit') or 'EA', 'unit_price': 0, 'total_value': 0,
+                        'physical_qty': 0, 'reserved_qty': 0, 'available_qty': 0,
+                    }
+            rows = list(new_items.values())
+            for start in range(0, len(rows), batch_size):
+                stmt = pg_insert(InventoryItem).values(rows[start:start + batch_size])
+                stmt = stmt.on_conflict_do_update(
+                    constraint='uq_inventory_item',
+                    set_={'updated_at': func.now()}
+                ).returning(
+                    InventoryItem.id, InventoryItem.warehouse_id, InventoryItem.material_code,
+                    InventoryItem.size, InventoryItem.heat_no
+                )
+                for item_id, wh_id, code, size, heat_no in session.execute(stmt):
+                    items[self._item_key(wh_id, {'material_code': code, 'size': size, 'heat_no': heat_no})] = item_id
+
+            # 4. خطوط در جدول موقت
+            session.execute(text("""
+                CREATE TEMP TABLE tmp_receipt_lines (
+                    seq integer, warehouse_id integer, inventory_item_id integer,
+                    quantity double precision, unit_price double precision, remarks varchar(500)
+                ) ON COMMIT DROP
+            """))
+            line_rows = [
+                {
+                    'seq': seq, 'warehouse_id': key[0], 'inventory_item_id': items[key],
+                    'quantity': line['quantity'], 'unit_price': line['unit_price'],
+                    'remarks': line.get('remarks')
+                }
+                for seq, (key, line) in enumerate(valid)
+            ]
+            for start in range(0, len(line_rows), batch_size):
+                session.execute(text("""
+                    INSERT INTO tmp_receipt_lines (seq, warehouse_id, inventory_item_id, quantity, unit_price, remarks)
+                    VALUES (:seq, :warehouse_id, :inventory_item_id, :quantity, :unit_price, :remarks)
+                """), line_rows[start:start + batch_size])
+
+            # 5. تراکنش‌های ورود با مانده‌های پیوسته (window) در یک دستور
+            now = datetime.utcnow()
+            inserted = session.execute(text("""
+                INSERT INTO inventory_transactions (
+                    warehouse_id, inventory_item_id, transaction_type, transaction_date,
+                    quantity, unit_price, total_value, balance_before, balance_after,
+                    reference_type, reference_no, performed_by, remarks, created_at
+                )
+                SELECT r.warehouse_id, r.inventory_item_id, 'IN', :now,
+                       r.quantity, r.unit_price, r.quantity * r.unit_price,
+                       COALESCE(i.physical_qty, 0) + r.running - r.quantity,
+                       COALESCE(i.physical_qty, 0) + r.running,
+                       :reference_type, :reference_no, :performed_by, r.remarks, :now
+                FROM (
+                    SELECT t.*, SUM(t.quantity) OVER (
+                        PARTITION BY t.inventory_item_id ORDER BY t.seq
+                    ) AS running
+                    FROM tmp_receipt_lines t
+                ) r
+                JOIN inventory_items i ON i.id = r.inventory_item_id
+                ORDER BY r.seq
+            """), {
+                'now': now, 'reference_type': reference_type,
+                'reference_no': reference_no, 'performed_by': performed_by
+            }).rowcount
+
+            # 6. موجودی و قیمت میانگین موزون آیتم‌ها
+            session.execute(text("""
+                UPDATE inventory_items i
+                SET physical_qty = i.physical_qty + r.qty,
+                    available_qty = i.physical_qty + r.qty - COALESCE(i.reserved_qty, 0),
+                    total_value = COALESCE(i.total_value, 0) + r.value,
+                    unit_price = CASE
+                        WHEN r.value > 0 AND i.physical_qty + r.qty > 0
+                        THEN (COALESCE(i.total_value, 0) + r.value) / (i.physical_qty + r.qty)
+                        ELSE i.unit_price
+                    END,
+                    last_receipt_date = :now,
+                    updated_at = :now
+                FROM (
+                    SELECT inventory_item_id, SUM(quantity) AS qty, SUM(quantity * unit_price) AS value
+                    FROM tmp_receipt_lines
+                    GROUP BY inventory_item_id
+                ) r
+                WHERE i.id = r.inventory_item_id
+            """), {'now': now})
+
+            session.commit()
+
+            total_quantity = sum(row['quantity'] for row in line_rows)
+            self._log_activity(
+                action="INVENTORY_IN_BULK",
+                details=f"رسید گروهی {reference_no or ''}: {len(line_rows)} خط، "
+                        f"{len(new_items)} کالای جدید، جمع {total_quantity}"
+            )
+            return {
+                'lines': len(line_rows),
+                'items_created': len(new_items),
+                'transactions': inserted,
+                'total_quantity': total_quantity,
+                'errors': errors,
+                'seconds': round(time.perf_counter() - started, 2)
+            }
+
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    def import_receipt_file(self, file_path: str, reference_no: str = None,
+                            performed_by: str = None, create_warehouses: bool = False,
+                            balance_as_quantity: bool = False) -> Dict[str, Any]:
+        """
+        ورود رسید از فایل XLSX/CSV با قالب warehouse.xlsx
+        (شماره مرجع پیش‌فرض نام فایل است؛ ورود دوباره همان فایل رد می‌شود).
+        فایلی که سطر نامعتبر دارد اصلاً ثبت نمی‌شود.
+        """
+        started = time.perf_counter()
+        lines, errors = read_receipt_file(file_path, balance_as_quantity=balance_as_quantity)
+        if errors or not lines:
+            return self._empty_receipt_result(errors, started)
+        return self.record_inventory_in_bulk(
+            lines,
+            reference_type="RECEIPT",
+            reference_no=reference_no or os.path.basename(file_path),
+            performed_by=performed_by,
+            create_warehouses=create_warehouses
+        )
+
+    @staticmethod
+    def _empty_receipt_result(errors: List[str], started: float) -> Dict[str, Any]:
+        """نتیجه رسید ثبت‌نشده (بدون خط معتبر یا با خطا)"""
+        return {'lines': 0, 'items_created': 0, 'transactions': 0, 'total_quantity': 0.0,
+                'errors': errors, 'seconds': round(time.perf_counter() - started, 2)}
+
+    @staticmethod
+    def _lock_item_keys(session: Session, pairs) -> None:
+        """
+        قفل advisory تراکنشی روی هر (warehouse_id, material_code) به ترتیب ثابت.
+        size/heat_no در uq_inventory_item قابل NULL هستند و یکتایی (و ON CONFLICT)
+        برای کلیدهای NULL عمل نمی‌کند؛ هر مسیری که آیتم می‌سازد با این قفل
+        سریال می‌شود تا دو تراکنش هم‌زمان آیتم تکراری نسازند.
+        """
+        if not pairs:
+            return
+        session.execute(text("""
+            SELECT count(pg_advisory_xact_lock(h)) FROM (
+                SELECT DISTINCT hashtext(k) AS h FROM unnest(CAST(:keys AS text[])) AS k
+                ORDER BY h OFFSET 0
+            ) s
+        """), {'keys': [f"inventory_item:{wh_id}:{str(code).strip()}" for wh_id, code in pairs]})
+
+    @staticmethod
+    def _item_key(warehouse_id: int, line: Dict[str, Any]) -> Tuple:
+        """کلید یکتای آیتم (مطابق uq_inventory_item؛ فاصله‌های اطراف حذف، رشته خالی = NULL)"""
+        def normalize(value):
+            return (str(value).strip() or None) if value is not None else None
+
+        return (
+            warehouse_id,
+            str(line['material_code']).strip(),
+            normalize(line.get('size')),
+            normalize(line.get('heat_no')),
+        )
+
     def record_inventory_out(self, warehouse_code: str, material_code: str,
                              quantity: float, miv_record_id: int = None,
                              reference_type: str = None, reference_no: str = None,
@@ -719,20 +1258,31 @@ class WarehouseService:
         finally:
             session.close()
 
+    # ستون‌های سبک تاریخچه تراکنش‌ها (ردیف tuple به جای آبجکت ORM)
+    _HISTORY_COLUMNS = (
+        'id', 'transaction_date', 'transaction_type', 'warehouse_id', 'inventory_item_id',
+        'material_code', 'size', 'quantity', 'unit_price', 'balance_before', 'balance_after',
+        'reference_type', 'reference_no', 'performed_by', 'remarks'
+    )
+
     def get_transactions_history(self, warehouse_code: str = None,
                                  material_code: str = None,
                                  transaction_type: str = None,
                                  from_date: datetime = None,
-                                 to_date: datetime = None) -> List[InventoryTransaction]:
-        """دریافت تاریخچه تراکنش‌ها"""
+                                 to_date: datetime = None,
+                                 limit: int = None) -> List[InventoryTransaction]:
+        """
+        دریافت تاریخچه تراکنش‌ها (آبجکت‌های ORM)
+        برای داده‌های حجیم از get_transactions_page یا iter_transactions_history استفاده کنید.
+        """
         session = self.session_factory()
         try:
             query = session.query(InventoryTransaction)
 
             if warehouse_code:
-                warehouse = session.query(Warehouse).filter_by(code=warehouse_code).first()
-                if warehouse:
-                    query = query.filter_by(warehouse_id=warehouse.id)
+                warehouse_id = self._get_warehouse_id(session, warehouse_code)
+                if warehouse_id:
+                    query = query.filter_by(warehouse_id=warehouse_id)
 
             if material_code:
                 query = query.join(InventoryItem).filter(
@@ -748,11 +1298,152 @@ class WarehouseService:
             if to_date:
                 query = query.filter(InventoryTransaction.transaction_date <= to_date)
 
-            return query.order_by(InventoryTransaction.transaction_date.desc()).all()
+            query = query.order_by(InventoryTransaction.transaction_date.desc(), InventoryTransaction.id.desc())
+            if limit:
+                query = query.limit(limit)
+            return query.all()
+
+        finally:
+            session.close()
+
+    def get_transactions_page(self, warehouse_code: str = None,
+                              material_code: str = None,
+                              transaction_type: str = None,
+                              from_date: datetime = None,
+                              to_date: datetime = None,
+                              cursor: str = None,
+                              page_size: int = 200) -> Dict[str, Any]:
+        """
+        یک صفحه از تاریخچه تراکنش‌ها با صفحه‌بندی keyset روی (transaction_date, id) نزولی.
+        هزینه هر صفحه به عمق صفحه بستگی ندارد (بدون OFFSET).
+
+        :param cursor: مقدار next_cursor صفحه قبل (None = صفحه اول)
+        :return: {'columns', 'rows': [tuple, ...], 'next_cursor'}؛ next_cursor=None یعنی صفحه آخر
+        """
+        session = self.session_factory()
+        try:
+            query = self._history_query(
+                session, warehouse_code, material_code, transaction_type, from_date, to_date
+            )
+            if query is None:
+                return {'columns': self._HISTORY_COLUMNS, 'rows': [], 'next_cursor': None}
+
+            if cursor:
+                query = self._after_history_cursor(query, cursor, descending=True)
+
+            rows = [tuple(row) for row in query.order_by(
+                InventoryTransaction.transaction_date.desc(), InventoryTransaction.id.desc()
+            ).limit(page_size + 1)]
+
+            next_cursor = None
+            if len(rows) > page_size:
+                rows = rows[:page_size]
+                last = rows[-1]
+                next_cursor = self._encode_history_cursor(last[1], last[0])
+
+            return {'columns': self._HISTORY_COLUMNS, 'rows': rows, 'next_cursor': next_cursor}
 
         finally:
             session.close()
 
+    def iter_transactions_history(self, warehouse_code: str = None,
+                                  material_code: str = None,
+                                  transaction_type: str = None,
+                                  from_date: datetime = None,
+                                  to_date: datetime = None,
+                                  batch_size: int = 2000):
+        """
+        تاریخچه تراکنش‌ها به صورت جریانی (cursor سمت سرور) به ترتیب (transaction_date, id)
+        برای خروجی کامل؛ هر ردیف یک tuple با ترتیب _HISTORY_COLUMNS است.
+        """
+        session = self.session_factory()
+        try:
+            query = self._history_query(
+                session, warehouse_code, material_code, transaction_type, from_date, to_date
+            )
+            if query is None:
+                return
+            query = query.order_by(InventoryTransaction.transaction_date, InventoryTransaction.id)
+            for row in query.yield_per(batch_size):
+                yield tuple(row)
+        finally:
+            session.close()
+
+    def _history_query(self, session: Session, warehouse_code: str, material_code: str,
+                       transaction_type: str, from_date: datetime, to_date: datetime):
+        """کوئری ستونی تاریخچه با فیلترها؛ انبار ناموجود -> None"""
+        query = session.query(
+            InventoryTransaction.id,
+            InventoryTransaction.transaction_date,
+            InventoryTransaction.transaction_type,
+            InventoryTransaction.warehouse_id,
+            InventoryTransaction.inventory_item_id,
+            InventoryItem.material_code,
+            InventoryItem.size,
+            InventoryTransaction.quantity,
+            InventoryTransaction.unit_price,
+            InventoryTransaction.balance_before,
+            InventoryTransaction.balance_after,
+            InventoryTransaction.reference_type,
+            InventoryTransaction.reference_no,
+            InventoryTransaction.performed_by,
+            InventoryTransaction.remarks
+        ).join(InventoryItem, InventoryItem.id == InventoryTransaction.inventory_item_id)
+
+        if warehouse_code:
+            warehouse_id = self._get_warehouse_id(session, warehouse_code)
+            if warehouse_id is None:
+                return None
+            query = query.filter(InventoryTransaction.warehouse_id == warehouse_id)
+        if material_code:
+            query = query.filter(InventoryItem.material_code.like(f"%{material_code}%"))
+        if transaction_type:
+            query = query.filter(InventoryTransaction.transaction_type == transaction_type)
+        if from_date:
+            query = query.filter(InventoryTransaction.transaction_date >= from_date)
+        if to_date:
+            query = query.filter(InventoryTransaction.transaction_date <= to_date)
+        return query
+
+    def _get_warehouse_id(self, session: Session, warehouse_code: str) -> Optional[int]:
+        """
+        شناسه انبار از روی کد با cache؛ با ایجاد/ویرایش انبار پاک می‌شود و هر
+        ورودی پس از WAREHOUSE_ID_TTL_SECONDS دوباره خوانده می‌شود
+        """
+        now = time.monotonic()
+        cached = self._warehouse_ids.get(warehouse_code)
+        if cached is not None and now - cached[1] < WAREHOUSE_ID_TTL_SECONDS:
+            return cached[0]
+        warehouse_id = session.query(Warehouse.id).filter(Warehouse.code == warehouse_code).scalar()
+        if warehouse_id is not None:
+            self._warehouse_ids[warehouse_code] = (warehouse_id, now)
+        else:
+            self._warehouse_ids.pop(warehouse_code, None)
+        return warehouse_id
+
+    def _after_history_cursor(self, query, cursor: str, descending: bool):
+        """ردیف‌های بعد از cursor در ترتیب (transaction_date, id) صعودی یا نزولی"""
+        cursor_date, cursor_id = self._decode_history_cursor(cursor)
+        key = tuple_(InventoryTransaction.transaction_date, InventoryTransaction.id)
+        if descending:
+            # شرط ساده تاریخ کنار مقایسه tuple برای حذف پارتیشن‌های بعد از cursor
+            return query.filter(InventoryTransaction.transaction_date <= cursor_date,
+                                key < tuple_(cursor_date, cursor_id))
+        return query.filter(InventoryTransaction.transaction_date >= cursor_date,
+                            key > tuple_(cursor_date, cursor_id))
+
+    @staticmethod
+    def _encode_history_cursor(transaction_date: datetime, transaction_id: int) -> str:
+        return f"{transaction_date.isoformat()}|{transaction_id}"
+
+    @staticmethod
+    def _decode_history_cursor(cursor: str) -> Tuple[datetime, int]:
+        try:
+            date_part, id_part = cursor.rsplit('|', 1)
+            return datetime.fromisoformat(date_part), int(id_part)
+        except ValueError:
+            raise ValueError(f"cursor نامعتبر: {cursor}")
+
     # ================== گزارش‌گیری ==================
 
     def get_inventory_summary(self, warehouse_code: str = None) -> Dict[str, Any]:
@@ -766,11 +1457,10 @@ class WarehouseService:
                 if warehouse:
                     query = query.filter_by(warehouse_id=warehouse.id)
 
-            items = query.all()
-
-            total_items = len(items)
-            total_value = sum(item.total_value or 0 for item in items)
-            low_stock_items = [item for item in items if item.available_qty <= item.min_stock_level]
+            total_items, total_value = query.with_entities(
+                func.count(InventoryItem.id), func.coalesce(func.sum(InventoryItem.total_value), 0)
+            ).one()
+            low_stock_items = query.filter(InventoryItem.is_low_stock).all()
 
             return {
                 'total_items': total_items,
@@ -783,68 +1473,174 @@ class WarehouseService:
         finally:
             session.close()
 
+    # ستون‌های سبک خروجی تراکنش‌ها در گزارش گردش (بدون ساخت آبجکت ORM)
+    _MOVEMENT_TRANSACTION_COLUMNS = (
+        'id', 'transaction_date', 'transaction_type', 'material_code', 'size',
+        'quantity', 'balance_before', 'balance_after', 'reference_type',
+        'reference_no', 'performed_by'
+    )
+
+    def _movement_transactions_query(self, session: Session, warehouse_id: int,
+                                     from_date: datetime, to_date: datetime):
+        """کوئری تراکنش‌های دوره با کد کالا از join (مرتب بر اساس تاریخ و id)"""
+        return session.query(
+            InventoryTransaction.id,
+            InventoryTransaction.transaction_date,
+            InventoryTransaction.transaction_type,
+            InventoryItem.material_code,
+            InventoryItem.size,
+            InventoryTransaction.quantity,
+            InventoryTransaction.balance_before,
+            InventoryTransaction.balance_after,
+            InventoryTransaction.reference_type,
+            InventoryTransaction.reference_no,
+            InventoryTransaction.performed_by
+        ).join(
+            InventoryItem, InventoryItem.id == InventoryTransaction.inventory_item_id
+        ).filter(
+            InventoryTransaction.warehouse_id == warehouse_id,
+            InventoryTransaction.transaction_date >= from_date,
+            InventoryTransaction.transaction_date <= to_date
+        ).order_by(InventoryTransaction.transaction_date, InventoryTransaction.id)
+
     def get_stock_movement_report(self, warehouse_code: str,
-                                  from_date: datetime, to_date: datetime) -> Dict[str, Any]:
-        """گزارش گردش کالا"""
+                                  from_date: datetime, to_date: datetime,
+                                  include_transactions: bool = False,
+                                  cursor: str = None, page_size: int = 500) -> Dict[str, Any]:
+        """
+        گزارش گردش کالا
+        جمع‌ها با یک کوئری GROUP BY (کد کالا، نوع تراکنش) در دیتابیس محاسبه می‌شوند.
+        لیست تراکنش‌ها اختیاری و با keyset روی (transaction_date, id) صفحه‌بندی
+        می‌شود (cursor = next_cursor صفحه قبل)؛ برای خروجی کامل از
+        iter_stock_movement_transactions استفاده کنید.
+        """
         session = self.session_factory()
         try:
             warehouse = session.query(Warehouse).filter_by(code=warehouse_code).first()
             if not warehouse:
                 return {}
 
-            # تراکنش‌های دوره
-            transactions = session.query(InventoryTransaction).filter(
+            totals = session.query(
+                InventoryItem.material_code,
+                InventoryTransaction.transaction_type,
+                func.sum(InventoryTransaction.quantity),
+                func.sum(
+                    func.coalesce(InventoryTransaction.balance_after, 0) -
+                    func.coalesce(InventoryTransaction.balance_before, 0)
+                ),
+                func.count(InventoryTransaction.id)
+            ).join(
+                InventoryItem, InventoryItem.id == InventoryTransaction.inventory_item_id
+            ).filter(
                 InventoryTransaction.warehouse_id == warehouse.id,
                 InventoryTransaction.transaction_date >= from_date,
                 InventoryTransaction.transaction_date <= to_date
+            ).group_by(
+                InventoryItem.material_code, InventoryTransaction.transaction_type
             ).all()
 
-            # محاسبات
-            total_in = sum(t.quantity for t in transactions if t.transaction_type == 'IN')
-            total_out = sum(t.quantity for t in transactions if t.transaction_type == 'OUT')
-            total_adjust = sum(t.quantity for t in transactions if t.transaction_type == 'ADJUST')
-
             # گروه‌بندی بر اساس کالا
-            from collections import defaultdict
-            item_movements = defaultdict(lambda: {'in': 0, 'out': 0, 'adjust': 0})
-
-            for trans in transactions:
-                item = session.query(InventoryItem).get(trans.inventory_item_id)
-                if item:
-                    key = item.material_code
-                    if trans.transaction_type == 'IN':
-                        item_movements[key]['in'] += trans.quantity
-                    elif trans.transaction_type == 'OUT':
-                        item_movements[key]['out'] += trans.quantity
-                    elif trans.transaction_type == 'ADJUST':
-                        item_movements[key]['adjust'] += trans.quantity
+            type_keys = {
+                'IN': 'in', 'OUT': 'out', 'ADJUST': 'adjust',
+                'TRANSFER_IN': 'transfer_in', 'TRANSFER_OUT': 'transfer_out'
+            }
+            summary = {key: 0.0 for key in type_keys.values()}
+            net_adjust = 0.0
+            transaction_count = 0
+            item_movements = {}
+
+            for material_code, transaction_type, quantity, balance_delta, count in totals:
+                movement = item_movements.setdefault(material_code, {
+                    'in': 0.0, 'out': 0.0, 'adjust': 0.0,
+                    'transfer_in': 0.0, 'transfer_out': 0.0, 'net': 0.0
+                })
+                transaction_count += count
+                key = type_keys.get(transaction_type)
+                if key:
+                    movement[key] += quantity or 0
+                    summary[key] += quantity or 0
+                # تعدیل مقدار مطلق ذخیره می‌شود؛ جهت آن از اختلاف موجودی‌ها است
+                if transaction_type == 'ADJUST':
+                    net_adjust += balance_delta or 0
+                    movement['net'] += balance_delta or 0
+
+            for movement in item_movements.values():
+                movement['net'] += (
+                    movement['in'] + movement['transfer_in'] -
+                    movement['out'] - movement['transfer_out']
+                )
 
-            return {
+            report = {
                 'warehouse': warehouse.name,
                 'period': {
                     'from': from_date,
                     'to': to_date
                 },
                 'summary': {
-                    'total_in': total_in,
-                    'total_out': total_out,
-                    'total_adjust': total_adjust,
-                    'net_movement': total_in - total_out
+                    'total_in': summary['in'],
+                    'total_out': summary['out'],
+                    'total_adjust': summary['adjust'],
+                    'net_adjust': net_adjust,
+                    'total_transfer_in': summary['transfer_in'],
+                    'total_transfer_out': summary['transfer_out'],
+                    'net_movement': (
+                        summary['in'] + summary['transfer_in'] -
+                        summary['out'] - summary['transfer_out'] + net_adjust
+                    ),
+                    'transaction_count': transaction_count
                 },
-                'item_movements': dict(item_movements),
-                'transactions': transactions
+                'item_movements': item_movements
             }
 
+            if include_transactions:
+                query = self._movement_transactions_query(session, warehouse.id, from_date, to_date)
+                if cursor:
+                    query = self._after_history_cursor(query, cursor, descending=False)
+                rows = query.limit(page_size + 1).all()
+
+                next_cursor = None
+                if len(rows) > page_size:
+                    rows = rows[:page_size]
+                    next_cursor = self._encode_history_cursor(rows[-1][1], rows[-1][0])
+
+                report['transactions'] = [
+                    dict(zip(self._MOVEMENT_TRANSACTION_COLUMNS, row)) for row in rows
+                ]
+                report['pagination'] = {
+                    'page_size': page_size,
+                    'total': transaction_count,
+                    'pages': (transaction_count + page_size - 1) // page_size,
+                    'next_cursor': next_cursor
+                }
+
+            return report
+
+        finally:
+            session.close()
+
+    def iter_stock_movement_transactions(self, warehouse_code: str,
+                                         from_date: datetime, to_date: datetime,
+                                         batch_size: int = 2000):
+        """
+        تراکنش‌های دوره به صورت جریانی (cursor سمت سرور) برای خروجی اکسل/CSV؛
+        حافظه مصرفی مستقل از تعداد تراکنش‌ها است.
+        """
+        session = self.session_factory()
+        try:
+            warehouse = session.query(Warehouse).filter_by(code=warehouse_code).first()
+            if not warehouse:
+                return
+            query = self._movement_transactions_query(session, warehouse.id, from_date, to_date)
+            for row in query.yield_per(batch_size):
+                yield dict(zip(self._MOVEMENT_TRANSACTION_COLUMNS, row))
         finally:
             session.close()
 
     def get_low_stock_items(self, warehouse_code: str = None) -> List[InventoryItem]:
-        """دریافت اقلام با موجودی کم"""
+        """دریافت اقلام با موجودی کم (فقط ردیف‌های پرچم‌دار از ایندکس جزئی)"""
         session = self.session_factory()
         try:
-            query = session.query(InventoryItem).filter(
-                InventoryItem.available_qty <= InventoryItem.min_stock_level
-            )
+            query = session.query(InventoryItem).filter(InventoryItem.is_low_stock)
 
             if warehouse_code:
                 warehouse = session.query(Warehouse).filter_by(code=warehouse_code).first()
@@ -856,50 +1652,333 @@ class WarehouseService:
         finally:
             session.close()
 
+    def subscribe_low_stock(self, callback) -> None:
+        """
+        ثبت تابعی که هنگام ورود/خروج یک آیتم از حالت موجودی کم صدا زده می‌شود.
+        رویدادها در poll_low_stock_alerts (در ترد شنونده) تحویل داده می‌شوند.
+        """
+        self._get_low_stock_monitor().subscribe(callback)
+
+    def poll_low_stock_alerts(self, timeout: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        رویدادهای موجودی کم رسیده از آخرین فراخوانی.
+        :param timeout: حداکثر انتظار برای رویداد (ثانیه)؛ فقط از ترد پس‌زمینه
+        :return: [{'id', 'warehouse_id', 'material_code', 'available_qty',
+                   'min_stock_level', 'is_low_stock'}, ...]
+        """
+        return self._get_low_stock_monitor().poll(timeout)
+
+    def _get_low_stock_monitor(self) -> LowStockMonitor:
+        if self._low_stock_monitor is None:
+            self._low_stock_monitor = LowStockMonitor(self._get_engine())
+        return self._low_stock_monitor
+
     def get_inventory_valuation(self, warehouse_code: str = None,
                                 as_of_date: datetime = None) -> Dict[str, Any]:
-        """ارزش‌گذاری موجودی انبار"""
+        """
+        ارزش‌گذاری موجودی انبار
+        - بدون as_of_date: از موجودی فعلی با یک کوئری GROUP BY
+        - با as_of_date: مانده هر آیتم در آن لحظه از دفتر تراکنش‌ها؛ از نزدیک‌ترین
+          نقطه بازبینی قبلی شروع و فقط تراکنش‌های بعد از آن بازپخش می‌شوند.
+          ارزش با قیمت واحد فعلی آیتم محاسبه می‌شود.
+        """
         session = self.session_factory()
         try:
-            query = session.query(InventoryItem)
-
+            warehouses = session.query(Warehouse.id, Warehouse.name)
             if warehouse_code:
-                warehouse = session.query(Warehouse).filter_by(code=warehouse_code).first()
-                if warehouse:
-                    query = query.filter_by(warehouse_id=warehouse.id)
+                warehouses = warehouses.filter(Warehouse.code == warehouse_code)
+            warehouses = warehouses.all()
+            warehouse_ids = [wh_id for wh_id, _ in warehouses]
+
+            by_material = {}
+            checkpoints = {}
+
+            if as_of_date is None:
+                rows = session.query(
+                    InventoryItem.material_code,
+                    func.sum(InventoryItem.physical_qty),
+                    func.sum(func.coalesce(InventoryItem.total_value, 0)),
+                    func.count(InventoryItem.id)
+                ).filter(
+                    InventoryItem.warehouse_id.in_(warehouse_ids)
+                ).group_by(InventoryItem.material_code).all()
+                for material_code, qty, value, count in rows:
+                    by_material[material_code] = {'qty': qty or 0, 'value': value or 0, 'item_count': count}
+            else:
+                balances = {}
+                for wh_id in warehouse_ids:
+                    wh_balances, checkpoint_date = self._get_ledger_balances(session, wh_id, as_of_date)
+                    balances.update(wh_balances)
+                    checkpoints[wh_id] = checkpoint_date
+
+                item_ids = list(balances)
+                for start in range(0, len(item_ids), 5000):
+                    chunk = item_ids[start:start + 5000]
+                    for item_id, material_code, unit_price in session.query(
+                        InventoryItem.id, InventoryItem.material_code, InventoryItem.unit_price
+                    ).filter(InventoryItem.id.in_(chunk)):
+                        qty = balances[item_id]
+                        entry = by_material.setdefault(material_code, {'qty': 0, 'value': 0, 'item_count': 0})
+                        entry['qty'] += qty
+                        entry['value'] += qty * (unit_price or 0)
+                        entry['item_count'] += 1
 
-            if as_of_date:
-                # فقط آیتم‌هایی که قبل از تاریخ مشخص ایجاد شده‌اند
-                query = query.filter(InventoryItem.created_at <= as_of_date)
+            return {
+                'as_of_date': as_of_date or datetime.utcnow(),
+                'source': 'LEDGER' if as_of_date else 'CURRENT',
+                'total_items': sum(entry['item_count'] for entry in by_material.values()),
+                'total_quantity': sum(entry['qty'] for entry in by_material.values()),
+                'total_value': sum(entry['value'] for entry in by_material.values()),
+                'by_material': by_material,
+                'warehouses': [name for _, name in warehouses],
+                'checkpoints': checkpoints
+            }
 
-            items = query.all()
+        finally:
+            session.close()
 
-            # محاسبه ارزش
-            total_qty = sum(item.physical_qty for item in items)
-            total_value = sum(item.total_value or 0 for item in items)
+    # ================== دفتر تراکنش‌ها و نقاط بازبینی ==================
+
+    @staticmethod
+    def _ledger_delta_expr():
+        """اثر علامت‌دار هر تراکنش روی موجودی فیزیکی"""
+        return case(
+            (InventoryTransaction.transaction_type.in_(('IN', 'TRANSFER_IN', 'RETURN')),
+             InventoryTransaction.quantity),
+            (InventoryTransaction.transaction_type.in_(('OUT', 'TRANSFER_OUT')),
+             -InventoryTransaction.quantity),
+            # تعدیل مقدار مطلق ذخیره می‌کند؛ جهت از اختلاف موجودی‌ها
+            (InventoryTransaction.transaction_type == 'ADJUST',
+             func.coalesce(InventoryTransaction.balance_after, 0) -
+             func.coalesce(InventoryTransaction.balance_before, 0)),
+            else_=0
+        )
+
+    def _get_ledger_balances(self, session: Session, warehouse_id: int, as_of: datetime,
+                             inclusive: bool = True) -> Tuple[Dict[int, float], Optional[datetime]]:
+        """
+        مانده فیزیکی آیتم‌های یک انبار در لحظه as_of.
+        نقطه بازبینی با تاریخ D شامل تراکنش‌های قبل از D است؛ بنابراین فقط
+        تراکنش‌های D <= t <= as_of (یا < as_of اگر inclusive نباشد) بازپخش می‌شوند.
+        :return: ({inventory_item_id: qty} فقط مانده‌های غیرصفر، تاریخ نقطه بازبینی)
+        :raises ValueError: اگر as_of قبل از مرز بایگانی پارتیشن‌ها باشد
+        """
+        archive_cutoff = ledger_partitions.archived_before(session.connection())
+        if archive_cutoff and as_of < datetime.combine(archive_cutoff, datetime.min.time()):
+            raise ValueError(
+                f"تراکنش‌های قبل از {archive_cutoff} بایگانی شده‌اند؛ "
+                f"مانده در {as_of} از دفتر تراکنش‌ها قابل محاسبه نیست"
+            )
 
-            # گروه‌بندی بر اساس کد کالا
-            from collections import defaultdict
-            grouped = defaultdict(lambda: {'qty': 0, 'value': 0, 'items': []})
+        checkpoint_filter = WarehouseStockSnapshot.snapshot_date <= as_of if inclusive \
+            else WarehouseStockSnapshot.snapshot_date < as_of
+        checkpoint = session.query(
+            WarehouseStockSnapshot.snapshot_date, WarehouseStockSnapshot.stock_details
+        ).filter(
+            WarehouseStockSnapshot.warehouse_id == warehouse_id,
+            WarehouseStockSnapshot.kind == LEDGER_CHECKPOINT_KIND,
+            checkpoint_filter
+        ).order_by(WarehouseStockSnapshot.snapshot_date.desc()).first()
+
+        balances: Dict[int, float] = {}
+        checkpoint_date = None
+        query = session.query(
+            InventoryTransaction.inventory_item_id,
+            func.sum(self._ledger_delta_expr())
+        ).filter(InventoryTransaction.warehouse_id == warehouse_id)
+
+        if checkpoint:
+            checkpoint_date = checkpoint.snapshot_date
+            balances = {
+                int(item_id): float(qty)
+                for item_id, qty in (checkpoint.stock_details or {}).get('balances', {}).items()
+            }
+            query = query.filter(InventoryTransaction.transaction_date >= checkpoint_date)
 
-            for item in items:
-                key = item.material_code
-                grouped[key]['qty'] += item.physical_qty
-                grouped[key]['value'] += item.total_value or 0
-                grouped[key]['items'].append(item)
+        if archive_cutoff and (checkpoint_date is None or checkpoint_date.date() < archive_cutoff):
+            logging.warning(
+                f"انبار {warehouse_id}: بازپخش از {checkpoint_date or 'ابتدا'} به تراکنش‌های "
+                f"بایگانی‌شده قبل از {archive_cutoff} نیاز دارد؛ مانده ممکن است ناقص باشد"
+            )
 
-            return {
-                'as_of_date': as_of_date or datetime.utcnow(),
-                'total_items': len(items),
-                'total_quantity': total_qty,
-                'total_value': total_value,
-                'by_material': dict(grouped),
-                'warehouses': [w.name for w in set(item.warehouse for item in items)]
-            }
+        if inclusive:
+            query = query.filter(InventoryTransaction.transaction_date <= as_of)
+        else:
+            query = query.filter(InventoryTransaction.transaction_date < as_of)
+
+        for item_id, delta in query.group_by(InventoryTransaction.inventory_item_id):
+            balances[item_id] = balances.get(item_id, 0.0) + (delta or 0)
+
+        return {item_id: round(qty, 6) for item_id, qty in balances.items() if abs(qty) > 1e-9}, checkpoint_date
+
+    def create_valuation_checkpoint(self, warehouse_id: int, checkpoint_date: datetime,
+                                    session: Session = None) -> Optional[WarehouseStockSnapshot]:
+        """
+        ثبت نقطه بازبینی: مانده همه آیتم‌های انبار قبل از checkpoint_date
+        (خودش از نقطه بازبینی قبلی ساخته می‌شود و فقط تراکنش‌های بین دو نقطه را می‌خواند)
+        """
+        own_session = session is None
+        session = session or self.session_factory()
+        try:
+            # snapshot گزارشی هم‌زمان نباید جای نقطه بازبینی حساب شود
+            exists = session.query(WarehouseStockSnapshot.id).filter_by(
+                warehouse_id=warehouse_id, snapshot_date=checkpoint_date,
+                kind=LEDGER_CHECKPOINT_KIND
+            ).first()
+            if exists:
+                return None
 
+            balances, _ = self._get_ledger_balances(session, warehouse_id, checkpoint_date, inclusive=False)
+            prices = {}
+            item_ids = list(balances)
+            for start in range(0, len(item_ids), 5000):
+                prices.update(session.query(InventoryItem.id, InventoryItem.unit_price).filter(
+                    InventoryItem.id.in_(item_ids[start:start + 5000])
+                ).all())
+
+            checkpoint = WarehouseStockSnapshot(
+                warehouse_id=warehouse_id,
+                snapshot_date=checkpoint_date,
+                total_items=len(balances),
+                total_value=sum(qty * (prices.get(item_id) or 0) for item_id, qty in balances.items()),
+                stock_details={
+                    'kind': LEDGER_CHECKPOINT_KIND,
+                    'balances': {str(item_id): qty for item_id, qty in balances.items()}
+                },
+                kind=LEDGER_CHECKPOINT_KIND,
+                created_by="System"
+            )
+            session.add(checkpoint)
+            if own_session:
+                session.commit()
+            else:
+                session.flush()
+            return checkpoint
+        except Exception:
+            if own_session:
+                session.rollback()
+            raise
+        finally:
+            if own_session:
+                session.close()
+
+    def ensure_valuation_checkpoints(self, until: datetime = None) -> Dict[str, int]:
+        """
+        ساخت نقاط بازبینی ابتدای هر ماه که هنوز ثبت نشده‌اند (تا ماه جاری).
+        هر نقطه از نقطه قبلی ساخته می‌شود؛ اجرای دوره‌ای فقط ماه‌های جدید را می‌سازد.
+        :return: {'created': تعداد، 'warehouses': تعداد انبارهای بررسی‌شده}
+        """
+        until = until or datetime.utcnow()
+        last_boundary = datetime(until.year, until.month, 1)
+        created = 0
+
+        session = self.session_factory()
+        try:
+            warehouse_ids = [row[0] for row in session.query(Warehouse.id).all()]
+            for wh_id in warehouse_ids:
+                last_checkpoint = session.query(func.max(WarehouseStockSnapshot.snapshot_date)).filter(
+                    WarehouseStockSnapshot.warehouse_id == wh_id,
+                    WarehouseStockSnapshot.kind == LEDGER_CHECKPOINT_KIND
+                ).scalar()
+                if last_checkpoint is None:
+                    first_txn = session.query(func.min(InventoryTransaction.transaction_date)).filter(
+                        InventoryTransaction.warehouse_id == wh_id
+                    ).scalar()
+                    if first_txn is None:
+                        continue
+                    last_checkpoint = datetime(first_txn.year, first_txn.month, 1)
+
+                boundary = self._next_month(last_checkpoint)
+                while boundary <= last_boundary:
+                    if self.create_valuation_checkpoint(wh_id, boundary, session=session):
+                        created += 1
+                    session.commit()
+                    boundary = self._next_month(boundary)
+        except Exception as e:
+            session.rollback()
+            logging.error(f"خطا در ساخت نقاط بازبینی ارزش‌گذاری: {e}")
+            raise
+        finally:
+            session.close()
+
+        if created:
+            self._log_activity(
+                action="VALUATION_CHECKPOINTS",
+                details=f"{created} نقطه بازبینی ماهانه موجودی ثبت شد"
+            )
+        return {'created': created, 'warehouses': len(warehouse_ids)}
+
+    def ensure_transaction_partitions(self, months_ahead: int = 3) -> List[str]:
+        """
+        ساخت پارتیشن‌های ماهانه inventory_transactions تا months_ahead ماه آینده
+        (و پارتیشن ماه‌هایی که تراکنششان در پارتیشن DEFAULT مانده است).
+        :return: نام پارتیشن‌های ساخته‌شده
+        """
+        until = ledger_partitions.add_months(ledger_partitions.month_start(datetime.utcnow()), months_ahead)
+        with self._get_engine().begin() as conn:
+            created = ledger_partitions.ensure_partitions(conn, until)
+        if created:
+            self._log_activity(
+                action="LEDGER_PARTITIONS",
+                details=f"پارتیشن‌های تراکنش ساخته شد: {', '.join(created)}"
+            )
+        return created
+
+    def archive_transaction_partitions(self, keep_months: int = 24) -> Dict[str, Any]:
+        """
+        جدا کردن پارتیشن‌های تراکنش قدیمی‌تر از keep_months ماه و انتقال به schema بایگانی.
+        فقط ماه‌هایی بایگانی می‌شوند که برای همه انبارها نقطه بازبینی ارزش‌گذاری بعد از
+        آن‌ها ثبت شده است تا ارزش‌گذاری تاریخی از ابتدای هر ماه بعدی درست بماند.
+        مرز بایگانی از پارتیشن‌های schema بایگانی خوانده می‌شود (ledger_partitions.archived_before)
+        و ارزش‌گذاری تاریخی قبل از آن خطا می‌دهد.
+        :return: {'archived': [نام پارتیشن‌ها], 'cutoff': تاریخ مرز}
+        """
+        cutoff = ledger_partitions.add_months(ledger_partitions.month_start(datetime.utcnow()), -keep_months)
+
+        session = self.session_factory()
+        try:
+            for (wh_id,) in session.query(Warehouse.id).all():
+                has_old = session.query(
+                    session.query(InventoryTransaction.id).filter(
+                        InventoryTransaction.warehouse_id == wh_id,
+                        InventoryTransaction.transaction_date < cutoff
+                    ).exists()
+                ).scalar()
+                if not has_old:
+                    continue
+                checkpoint_date = session.query(func.max(WarehouseStockSnapshot.snapshot_date)).filter(
+                    WarehouseStockSnapshot.warehouse_id == wh_id,
+                    WarehouseStockSnapshot.kind == LEDGER_CHECKPOINT_KIND
+                ).scalar()
+                if checkpoint_date is None:
+                    return {'archived': [], 'cutoff': None}
+                cutoff = min(cutoff, ledger_partitions.month_start(checkpoint_date))
+        finally:
+            session.close()
+
+        with self._get_engine().begin() as conn:
+            archived = ledger_partitions.archive_partitions(conn, cutoff)
+        if archived:
+            self._log_activity(
+                action="LEDGER_PARTITIONS_ARCHIVED",
+                details=f"پارتیشن‌های تراکنش بایگانی شد: {', '.join(archived)}"
+            )
+        return {'archived': archived, 'cutoff': cutoff}
+
+    def _get_engine(self):
+        session = self.session_factory()
+        try:
+            return session.get_bind()
         finally:
             session.close()
 
+    @staticmethod
+    def _next_month(date: datetime) -> datetime:
+        """ابتدای ماه بعد"""
+        if date.month == 12:
+            return datetime(date.year + 1, 1, 1)
+        return datetime(date.year, date.month + 1, 1)
+
     def transfer_between_warehouses(self, from_warehouse_code: str, to_warehouse_code: str,
                                     material_code: str, quantity: float,
                                     transfer_no: str, performed_by: str,
@@ -933,6 +2012,7 @@ class WarehouseService:
                 raise ValueError(f"موجودی کافی نیست. موجود: {from_item.available_qty}")
 
             # آیتم در انبار مقصد (ایجاد اگر وجود ندارد)
+            self._lock_item_keys(session, [(to_warehouse.id, material_code)])
             to_item = session.query(InventoryItem).filter_by(
                 warehouse_id=to_warehouse.id,
                 material_code=material_code,
@@ -1019,6 +2099,312 @@ class WarehouseService:
         finally:
             session.close()
 
+    # ================== Snapshot انبار ==================
+
+    def create_snapshot(self, warehouse_code: str, created_by: str = "System",
+                        full_every: int = 10) -> Dict[str, Any]:
+        """
+        ثبت snapshot وضعیت موجودی یک انبار
+        وضعیت آیتم‌ها با یک کوئری خوانده می‌شود و فقط تفاوت با snapshot قبلی
+        ذخیره می‌شود؛ هر full_every snapshot یک بار وضعیت کامل ذخیره می‌شود.
+        """
+        session = self.session_factory()
+        try:
+            warehouse = session.query(Warehouse).filter_by(code=warehouse_code).first()
+            if not warehouse:
+                raise ValueError(f"انبار {warehouse_code} یافت نشد")
+
+            rows = session.query(
+                InventoryItem.id, InventoryItem.physical_qty, InventoryItem.reserved_qty,
+                InventoryItem.available_qty, InventoryItem.unit_price,
+                InventoryItem.material_code, InventoryItem.min_stock_level
+            ).filter(InventoryItem.warehouse_id == warehouse.id).all()
+            ids, values = stock_snapshots.state_from_rows([row[:5] for row in rows])
+
+            previous = self._latest_snapshot(session, warehouse.id)
+            details = stock_snapshots.encode_full(ids, values)
+            if previous is not None:
+                prev_ids, prev_values = stock_snapshots.materialize(self._snapshot_chain(session, previous.id))
+                delta = stock_snapshots.encode_delta(
+                    prev_ids, prev_values, ids, values,
+                    base_id=previous.id,
+                    chain_length=(previous.stock_details or {}).get('chain_length', 0) + 1
+                )
+                if not stock_snapshots.needs_full(previous, delta, len(ids), full_every):
+                    details = delta
+
+            low_stock = [
+                {'id': item_id, 'material_code': code, 'available_qty': available, 'min_stock_level': min_level}
+                for item_id, _, _, available, _, code, min_level in rows
+                if min_level and (available or 0) <= min_level
+            ]
+
+            # گردش بالا: بیشترین خروج از snapshot قبلی (یا 30 روز اخیر)
+            since = previous.snapshot_date if previous is not None else datetime.utcnow() - timedelta(days=30)
+            turnover = session.query(
+                InventoryTransaction.inventory_item_id,
+                func.sum(InventoryTransaction.quantity).label('issued')
+            ).filter(
+                InventoryTransaction.warehouse_id == warehouse.id,
+                InventoryTransaction.transaction_type.in_(('OUT', 'TRANSFER_OUT')),
+                InventoryTransaction.transaction_date >= since
+            ).group_by(InventoryTransaction.inventory_item_id).order_by(
+                func.sum(InventoryTransaction.quantity).desc()
+            ).limit(10).all()
+
+            summary = stock_snapshots.totals(values)
+            snapshot = WarehouseStockSnapshot(
+                warehouse_id=warehouse.id,
+                snapshot_date=datetime.utcnow(),
+                total_items=summary['total_items'],
+                total_value=summary['total_value'],
+                total_reserved=summary['total_reserved'],
+                stock_details=details,
+                low_stock_items=low_stock,
+                high_turnover_items=[{'id': item_id, 'issued_qty': issued} for item_id, issued in turnover],
+                kind=SNAPSHOT_STATE_KIND,
+                created_by=created_by
+            )
+            session.add(snapshot)
+            session.commit()
+
+            self._log_activity(
+                action="CREATE_SNAPSHOT",
+                details=f"Snapshot {details['kind']} انبار {warehouse_code}: "
+                        f"{len(details['ids'])} ردیف ذخیره‌شده از {summary['total_items']}"
+            )
+
+            return {
+                'id': snapshot.id,
+                'warehouse': warehouse.name,
+                'snapshot_date': snapshot.snapshot_date,
+                'kind': details['kind'],
+                'stored_rows': len(details['ids']),
+                **summary
+            }
+
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    def get_snapshots(self, warehouse_code: str = None, from_date: datetime = None,
+                      to_date: datetime = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """فهرست snapshotها بدون بارگذاری جزئیات JSON"""
+        session = self.session_factory()
+        try:
+            query = session.query(
+                WarehouseStockSnapshot.id, Warehouse.code, Warehouse.name,
+                WarehouseStockSnapshot.snapshot_date, WarehouseStockSnapshot.total_items,
+                WarehouseStockSnapshot.total_value, WarehouseStockSnapshot.total_reserved,
+                WarehouseStockSnapshot.created_by
+            ).join(
+                Warehouse, Warehouse.id == WarehouseStockSnapshot.warehouse_id
+            ).filter(WarehouseStockSnapshot.kind == SNAPSHOT_STATE_KIND)
+
+            if warehouse_code:
+                query = query.filter(Warehouse.code == warehouse_code)
+            if from_date:
+                query = query.filter(WarehouseStockSnapshot.snapshot_date >= from_date)
+            if to_date:
+                query = query.filter(WarehouseStockSnapshot.snapshot_date <= to_date)
+
+            rows = query.order_by(WarehouseStockSnapshot.snapshot_date.desc()).limit(limit).all()
+            return [
+                {
+                    'id': snapshot_id,
+                    'warehouse_code': code,
+                    'warehouse': name,
+                    'snapshot_date': snapshot_date,
+                    'total_items': total_items,
+                    'total_value': total_value,
+                    'total_reserved': total_reserved,
+                    'created_by': snapshot_by
+                }
+                for snapshot_id, code, name, snapshot_date, total_items, total_value, total_reserved, snapshot_by
+                in rows
+            ]
+        finally:
+            session.close()
+
+    def compare_snapshots(self, snapshot_id_1: int, snapshot_id_2: int,
+                          limit: int = 200) -> Dict[str, Any]:
+        """
+        مقایسه دو snapshot (قدیمی‌تر → جدیدتر) با تفاوت‌گیری برداری.
+        :return: خلاصه تغییرات و حداکثر limit ردیف با بیشترین تغییر موجودی فیزیکی
+        """
+        session = self.session_factory()
+        try:
+            ids_a, values_a = stock_snapshots.materialize(self._snapshot_chain(session, snapshot_id_1))
+            ids_b, values_b = stock_snapshots.materialize(self._snapshot_chain(session, snapshot_id_2))
+            diff = stock_snapshots.diff_states(ids_a, values_a, ids_b, values_b)
+
+            physical = stock_snapshots.column('physical_qty')
+            price = stock_snapshots.column('unit_price')
+            value_a = diff['before'][:, physical] * diff['before'][:, price]
+            value_b = diff['after'][:, physical] * diff['after'][:, price]
+            touched = diff['added'] | diff['removed'] | diff['changed']
+
+            positions = np.flatnonzero(touched)
+            if len(positions) > limit:
+                magnitude = np.abs(diff['delta'][positions, physical])
+                positions = positions[np.argpartition(-magnitude, limit - 1)[:limit]]
+            positions = positions[np.argsort(-np.abs(diff['delta'][positions, physical]), kind='stable')]
+
+            item_ids = diff['ids'][positions].tolist()
+            codes = dict(session.query(InventoryItem.id, InventoryItem.material_code).filter(
+                InventoryItem.id.in_(item_ids)
+            ).all()) if item_ids else {}
+
+            changes = []
+            for pos in positions:
+                status = 'ADDED' if diff['added'][pos] else 'REMOVED' if diff['removed'][pos] else 'CHANGED'
+                change = {
+                    'id': int(diff['ids'][pos]),
+                    'material_code': codes.get(int(diff['ids'][pos])),
+                    'status': status,
+                }
+                for index, name in enumerate(stock_snapshots.SNAPSHOT_COLUMNS):
+                    change[f'{name}_before'] = float(diff['before'][pos, index])
+                    change[f'{name}_after'] = float(diff['after'][pos, index])
+                changes.append(change)
+
+            return {
+                'snapshot_1': snapshot_id_1,
+                'snapshot_2': snapshot_id_2,
+                'summary': {
+                    'items_added': int(diff['added'].sum()),
+                    'items_removed': int(diff['removed'].sum()),
+                    'items_changed': int(diff['changed'].sum()),
+                    'quantity_change': float(diff['delta'][:, physical].sum()),
+                    'reserved_change': float(diff['delta'][:, stock_snapshots.column('reserved_qty')].sum()),
+                    'value_change': float((value_b - value_a).sum()),
+                },
+                'changes': changes
+            }
+        finally:
+            session.close()
+
+    def restore_from_snapshot(self, snapshot_id: int, performed_by: str,
+                              dry_run: bool = False) -> Dict[str, Any]:
+        """
+        بازگرداندن موجودی فیزیکی آیتم‌ها به مقدار snapshot با ثبت تراکنش‌های تعدیل.
+        رزروهای فعلی دست نمی‌خورند (available = physical - reserved).
+        آیتم‌هایی که پس از snapshot حذف یا اضافه شده‌اند فقط گزارش می‌شوند.
+        """
+        session = self.session_factory()
+        try:
+            snapshot = session.query(
+                WarehouseStockSnapshot.id, WarehouseStockSnapshot.warehouse_id,
+                WarehouseStockSnapshot.snapshot_date
+            ).filter(WarehouseStockSnapshot.id == snapshot_id).first()
+            if not snapshot:
+                raise ValueError(f"Snapshot {snapshot_id} یافت نشد")
+
+            snap_ids, snap_values = stock_snapshots.materialize(self._snapshot_chain(session, snapshot_id))
+            rows = session.query(
+                InventoryItem.id, InventoryItem.physical_qty, InventoryItem.reserved_qty,
+                InventoryItem.available_qty, InventoryItem.unit_price
+            ).filter(
+                InventoryItem.warehouse_id == snapshot.warehouse_id
+            ).order_by(InventoryItem.id).with_for_update().all()
+            cur_ids, cur_values = stock_snapshots.state_from_rows(rows)
+
+            diff = stock_snapshots.diff_states(cur_ids, cur_values, snap_ids, snap_values)
+            physical = stock_snapshots.column('physical_qty')
+            reserved = stock_snapshots.column('reserved_qty')
+            price = stock_snapshots.column('unit_price')
+            to_restore = np.flatnonzero(
+                diff['changed'] & (np.abs(diff['delta'][:, physical]) > stock_snapshots.EPSILON)
+            )
+
+            result = {
+                'snapshot_id': snapshot_id,
+                'items_restored': int(len(to_restore)),
+                'items_added_since': int(diff['removed'].sum()),
+                'items_deleted_since': int(diff['added'].sum()),
+                'quantity_change': float(diff['delta'][to_restore, physical].sum()),
+                'dry_run': dry_run
+            }
+            if dry_run or not len(to_restore):
+                return result
+
+            now = datetime.utcnow()
+            item_updates, transactions = [], []
+            for pos in to_restore:
+                item_id = int(diff['ids'][pos])
+                before = float(diff['before'][pos, physical])
+                after = float(diff['after'][pos, physical])
+                current_reserved = float(diff['before'][pos, reserved])
+                unit_price = float(diff['before'][pos, price])
+                item_updates.append({
+                    'id': item_id,
+                    'physical_qty': after,
+                    'available_qty': after - current_reserved,
+                    'total_value': after * unit_price,
+                    'updated_at': now
+                })
+                transactions.append({
+                    'warehouse_id': snapshot.warehouse_id,
+                    'inventory_item_id': item_id,
+                    'transaction_type': 'ADJUST',
+                    'transaction_date': now,
+                    'quantity': abs(after - before),
+                    'unit_price': unit_price,
+                    'total_value': abs(after - before) * unit_price,
+                    'balance_before': before,
+                    'balance_after': after,
+                    'reference_type': 'SNAPSHOT_RESTORE',
+                    'reference_id': snapshot_id,
+                    'performed_by': performed_by,
+                    'remarks': f"بازگردانی از snapshot {snapshot.snapshot_date:%Y-%m-%d %H:%M}",
+                    'created_at': now
+                })
+
+            session.bulk_update_mappings(InventoryItem, item_updates)
+            session.bulk_insert_mappings(InventoryTransaction, transactions)
+            session.commit()
+
+            self._log_activity(
+                action="RESTORE_SNAPSHOT",
+                details=f"بازگردانی {len(item_updates)} آیتم از snapshot {snapshot_id} توسط {performed_by}"
+            )
+            return result
+
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    @staticmethod
+    def _latest_snapshot(session: Session, warehouse_id: int) -> Optional[WarehouseStockSnapshot]:
+        """آخرین snapshot وضعیت (بدون نقاط بازبینی دفتر)"""
+        return session.query(WarehouseStockSnapshot).filter(
+            WarehouseStockSnapshot.warehouse_id == warehouse_id,
+            WarehouseStockSnapshot.kind == SNAPSHOT_STATE_KIND
+        ).order_by(WarehouseStockSnapshot.snapshot_date.desc()).first()
+
+    @staticmethod
+    def _snapshot_chain(session: Session, snapshot_id: int) -> List[Dict[str, Any]]:
+        """زنجیره stock_details از آخرین FULL تا snapshot خواسته‌شده (به ترتیب زمان)"""
+        chain = []
+        current_id = snapshot_id
+        while current_id is not None:
+            row = session.query(
+                WarehouseStockSnapshot.kind, WarehouseStockSnapshot.stock_details
+            ).filter(WarehouseStockSnapshot.id == current_id).first()
+            if row is None:
+                raise ValueError(f"Snapshot {current_id} یافت نشد")
+            if row.kind == LEDGER_CHECKPOINT_KIND:
+                raise ValueError(f"Snapshot {current_id} نقطه بازبینی دفتر است و وضعیت آیتم‌ها را ندارد")
+            details = row.stock_details or {}
+            chain.append(details)
+            current_id = details.get('base_id') if details.get('kind') == stock_snapshots.SNAPSHOT_DELTA else None
+        chain.reverse()
+        return chain
+
     # ================== متدهای کمکی خصوصی ==================
 
     def _log_activity(self, action: str, details: str):
@@ -6,17 +6,24 @@ Facade اصلی برای ماژول data
 """
 
 import os
+import socket
 from typing import Optional, Any
 from urllib.parse import quote_plus
 from sqlalchemy import create_engine, func
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import OperationalError
 
-from config_manager import DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME
+from config_manager import (
+    DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME,
+    MATCHING_INDEX_DIR, MATCHING_SEMANTIC_MODEL, MATCHING_SEMANTIC_BATCH_SIZE,
+    MATCHING_STAGES, MATCHING_STAGE_BUDGET_MS, MATCHING_PARALLEL_STAGES,
+    MATCHING_HISTORY_FLUSH_EVERY, MATCHING_HISTORY_FLUSH_SECONDS
+)
 from models import Base
 
 # Services
 from data.db_session import DBSessionManager
+from data.db_objects import install_database_objects
 from data.constants import *
 from data.activity_service import ActivityService
 from data.miv_service import MIVService
@@ -28,6 +35,7 @@ from data.report_service import ReportService
 from data.iso_service import ISOService
 from data.warehouse_service import WarehouseService
 from data.item_matching_service import ItemMatchingService
+from data.job_leader_service import JobLeaderService
 from alembic import command
 from alembic.config import Config
 from alembic.script import ScriptDirectory
@@ -57,6 +65,8 @@ class DataManagerFacade:
             max_overflow=20
         )
         Base.metadata.create_all(self.engine)
+        # اشیایی که فقط migrationها می‌سازند (trigger، ایندکس trigram، ...) برای دیتابیس create_all
+        install_database_objects(self.engine)
         self.session_factory = sessionmaker(bind=self.engine)
 
         # ------- Services Instances --------
@@ -92,17 +102,42 @@ class DataManagerFacade:
             self.session_factory,
             self.activity_service.log_activity
         )
+        # پارتیشن ماه جاری و ماه‌های آینده دفتر تراکنش‌ها باید پیش از هر درج وجود داشته باشد
+        try:
+            self.warehouse_service.ensure_transaction_partitions()
+        except Exception as e:
+            logging.error(f"خطا در ساخت پارتیشن‌های تراکنش انبار: {e}")
 
         # اضافه کردن سرویس تطبیق هوشمند
         self.item_matching_service = ItemMatchingService(
             self.session_factory,
-            self.activity_service.log_activity
+            self.activity_service.log_activity,
+            index_dir=MATCHING_INDEX_DIR,
+            semantic_model_path=MATCHING_SEMANTIC_MODEL,
+            semantic_batch_size=MATCHING_SEMANTIC_BATCH_SIZE,
+            stage_budget_ms=MATCHING_STAGE_BUDGET_MS,
+            parallel_stages=MATCHING_PARALLEL_STAGES,
+            enabled_stages=MATCHING_STAGES,
+            history_flush_every=MATCHING_HISTORY_FLUSH_EVERY,
+            history_flush_seconds=MATCHING_HISTORY_FLUSH_SECONDS
+        )
+
+        # رهبری کارهای پس‌زمینه بین کلاینت‌ها
+        self.job_leader_service = JobLeaderService(
+            self.engine,
+            self.activity_service.log_activity,
+            client_name=f"{user}@{socket.gethostname()}:{os.getpid()}"
         )
 
     # ----------------- DB Utils -----------------
     def get_session(self):
         return self.session_factory()
 
+    def close(self):
+        """نوشتن بافرهای باقی‌مانده سرویس‌ها قبل از خروج برنامه"""
+        self.item_matching_service.close()
+        self.warehouse_service.close()
+
     @staticmethod
     def test_connection(db_user: str, db_password: str):
         try:
@@ -202,6 +237,13 @@ class DataManagerFacade:
     def upsert_iso_index_entry(self, *args, **kwargs): return self.iso_service.upsert_iso_index_entry(*args, **kwargs)
     def remove_iso_index_entry(self, *args, **kwargs): return self.iso_service.remove_iso_index_entry(*args, **kwargs)
     def rebuild_iso_index_from_scratch(self, *args, **kwargs): return self.iso_service.rebuild_iso_index_from_scratch(*args, **kwargs)
+    def index_iso_directory(self, *args, **kwargs): return self.iso_service.index_iso_directory(*args, **kwargs)
+    def reconcile_iso_index(self, *args, **kwargs): return self.iso_service.reconcile_iso_index(*args, **kwargs)
+    def search_iso_index(self, *args, **kwargs): return self.iso_service.search_iso_index(*args, **kwargs)
+    def get_iso_files_for_line(self, *args, **kwargs): return self.iso_service.get_iso_files_for_line(*args, **kwargs)
+    def rebuild_line_iso_mapping(self, *args, **kwargs): return self.iso_service.rebuild_line_iso_mapping(*args, **kwargs)
+    def index_iso_contents(self, *args, **kwargs): return self.iso_service.index_iso_contents(*args, **kwargs)
+    def search_iso_contents(self, *args, **kwargs): return self.iso_service.search_iso_contents(*args, **kwargs)
     def _extract_prefix_key(self, *args, **kwargs): return self.iso_service._extract_prefix_key(*args, **kwargs)
 
     # ---------------- WarehouseService -------------------
@@ -234,10 +276,22 @@ class DataManagerFacade:
     def check_availability(self, *args, **kwargs):
         return self.warehouse_service.check_availability(*args, **kwargs)
 
+    def check_availability_bulk(self, *args, **kwargs):
+        return self.warehouse_service.check_availability_bulk(*args, **kwargs)
+
     # رزرو و تراکنش
     def reserve_material(self, *args, **kwargs):
         return self.warehouse_service.reserve_material(*args, **kwargs)
 
+    def reserve_materials_bulk(self, *args, **kwargs):
+        return self.warehouse_service.reserve_materials_bulk(*args, **kwargs)
+
+    def expire_reservations(self, *args, **kwargs):
+        return self.warehouse_service.expire_reservations(*args, **kwargs)
+
+    def generate_reservation_numbers(self, *args, **kwargs):
+        return self.warehouse_service.generate_reservation_numbers(*args, **kwargs)
+
     def cancel_reservation(self, *args, **kwargs):
         return self.warehouse_service.cancel_reservation(*args, **kwargs)
 
@@ -251,6 +305,12 @@ class DataManagerFacade:
     def record_inventory_in(self, *args, **kwargs):
         return self.warehouse_service.record_inventory_in(*args, **kwargs)
 
+    def record_inventory_in_bulk(self, *args, **kwargs):
+        return self.warehouse_service.record_inventory_in_bulk(*args, **kwargs)
+
+    def import_receipt_file(self, *args, **kwargs):
+        return self.warehouse_service.import_receipt_file(*args, **kwargs)
+
     def record_inventory_out(self, *args, **kwargs):
         return self.warehouse_service.record_inventory_out(*args, **kwargs)
 
@@ -260,6 +320,18 @@ class DataManagerFacade:
     def get_transactions_history(self, *args, **kwargs):  # ✅ اصلاح شد
         return self.warehouse_service.get_transactions_history(*args, **kwargs)
 
+    def ensure_transaction_partitions(self, *args, **kwargs):
+        return self.warehouse_service.ensure_transaction_partitions(*args, **kwargs)
+
+    def archive_transaction_partitions(self, *args, **kwargs):
+        return self.warehouse_service.archive_transaction_partitions(*args, **kwargs)
+
+    def get_transactions_page(self, *args, **kwargs):
+        return self.warehouse_service.get_transactions_page(*args, **kwargs)
+
+    def iter_transactions_history(self, *args, **kwargs):
+        return self.warehouse_service.iter_transactions_history(*args, **kwargs)
+
     # گزارشات انبار
     def get_inventory_summary(self, *args, **kwargs):
         return self.warehouse_service.get_inventory_summary(*args, **kwargs)
@@ -267,9 +339,18 @@ class DataManagerFacade:
     def get_stock_movement_report(self, *args, **kwargs):
         return self.warehouse_service.get_stock_movement_report(*args, **kwargs)
 
+    def iter_stock_movement_transactions(self, *args, **kwargs):
+        return self.warehouse_service.iter_stock_movement_transactions(*args, **kwargs)
+
     def get_low_stock_items(self, *args, **kwargs):
         return self.warehouse_service.get_low_stock_items(*args, **kwargs)
 
+    def subscribe_low_stock(self, *args, **kwargs):
+        return self.warehouse_service.subscribe_low_stock(*args, **kwargs)
+
+    def poll_low_stock_alerts(self, *args, **kwargs):
+        return self.warehouse_service.poll_low_stock_alerts(*args, **kwargs)
+
     def get_inventory_valuation(self, *args, **kwargs):
         return self.warehouse_service.get_inventory_valuation(*args, **kwargs)
 
@@ -280,18 +361,52 @@ class DataManagerFacade:
     def find_matching_items(self, *args, **kwargs):
         return self.item_matching_service.find_matching_items(*args, **kwargs)
 
+    def find_matching_items_staged(self, *args, **kwargs):
+        return self.item_matching_service.find_matching_items_staged(*args, **kwargs)
+
     def record_material_selection(self, *args, **kwargs):  # ✅ اصلاح شد
         return self.item_matching_service.record_material_selection(*args, **kwargs)
 
     def add_material_synonym(self, *args, **kwargs):  # ✅ اصلاح شد
         return self.item_matching_service.add_material_synonym(*args, **kwargs)
 
+    def match_mto_items_bulk(self, *args, **kwargs):
+        return self.item_matching_service.match_mto_items_bulk(*args, **kwargs)
+
     def learn_from_mto_miv_match(self, *args, **kwargs):
         return self.item_matching_service.learn_from_mto_miv_match(*args, **kwargs)
 
+    def mine_mappings_from_consumption(self, *args, **kwargs):
+        return self.item_matching_service.mine_mappings_from_consumption(*args, **kwargs)
+
     def get_matching_statistics(self, *args, **kwargs):
         return self.item_matching_service.get_matching_statistics(*args, **kwargs)
 
+    def rebuild_description_index(self, *args, **kwargs):
+        return self.item_matching_service.rebuild_description_index(*args, **kwargs)
+
+    def rebuild_semantic_index(self, *args, **kwargs):
+        return self.item_matching_service.rebuild_semantic_index(*args, **kwargs)
+
+    # ---------------- JobLeaderService -------------------
+    def try_acquire_job_leadership(self, *args, **kwargs):
+        return self.job_leader_service.try_acquire(*args, **kwargs)
+
+    def release_job_leadership(self, *args, **kwargs):
+        return self.job_leader_service.release(*args, **kwargs)
+
+    def release_all_job_leadership(self, *args, **kwargs):
+        return self.job_leader_service.release_all(*args, **kwargs)
+
+    def is_job_leader(self, *args, **kwargs):
+        return self.job_leader_service.is_leader(*args, **kwargs)
+
+    def ensure_job_leadership(self, *args, **kwargs):
+        return self.job_leader_service.ensure_leadership(*args, **kwargs)
+
+    def get_job_leadership_status(self, *args, **kwargs):
+        return self.job_leader_service.get_leadership_status(*args, **kwargs)
+
     # متدهای Snapshot انبار
     def create_snapshot(self, *args, **kwargs):
         return self.warehouse_service.create_snapshot(*args, **kwargs)
@@ -305,6 +420,9 @@ class DataManagerFacade:
     def restore_from_snapshot(self, *args, **kwargs):
         return self.warehouse_service.restore_from_snapshot(*args, **kwargs)
 
+    def ensure_valuation_checkpoints(self, *args, **kwargs):
+        return self.warehouse_service.ensure_valuation_checkpoints(*args, **kwargs)
+
 
 # ----------------------------------------------------------------------
     def check_and_apply_migrations(self) -> tuple[bool, str]:
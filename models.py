@@ -1,6 +1,7 @@
 # file: models.py
 
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, Boolean, ForeignKey, UniqueConstraint, Index, Text, JSON
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Date, DateTime, Float, Boolean, ForeignKey, UniqueConstraint, Index, Text, JSON, Computed, Sequence
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import relationship, declarative_base
 from datetime import datetime
 Base = declarative_base()
@@ -134,6 +135,10 @@ class MigratedFile(Base):
 # -------------------------
 # جدول Spools
 # -------------------------
+# شناسه اسپول‌های جدید (SNNN) از این sequence گرفته می‌شود (data/id_sequences.py)
+spool_id_seq = Sequence('spool_id_seq', metadata=Base.metadata)
+
+
 class Spool(Base):
     __tablename__ = 'spools'
     id = Column(Integer, primary_key=True)
@@ -219,6 +224,51 @@ class IsoFileIndex(Base):
     normalized_name = Column(String, index=True) # ایندکس برای جستجوی سریع
     prefix_key = Column(String, index=True) # ایندکس برای جستجوی سریع
     last_modified = Column(DateTime)
+    file_size = Column(BigInteger)  # برای مقایسه سریع stat در اسکن دوره‌ای
+
+
+# -------------------------
+# جدول نگاشت خط ↔ فایل ISO (در زمان ایندکس پر می‌شود)
+# -------------------------
+class LineIsoFile(Base):
+    __tablename__ = 'line_iso_files'
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, ForeignKey('projects.id', ondelete='CASCADE'), nullable=False)
+    line_no = Column(String, nullable=False)
+    iso_file_id = Column(Integer, ForeignKey('iso_file_index.id', ondelete='CASCADE'), nullable=False)
+    file_path = Column(String, nullable=False)
+    revision = Column(String(20))          # مثل A، B، 0، 1
+    revision_rank = Column(Integer, default=0)  # برای مرتب‌سازی آخرین ویرایش در ابتدا
+    match_type = Column(String(20))        # FULL_KEY: شماره خط کامل، PREFIX: پیشوند خط، DIGITS: فقط 6 رقم
+    last_modified = Column(DateTime)
+
+    __table_args__ = (
+        Index('ix_line_iso_project_line', 'project_id', 'line_no', 'revision_rank'),
+        Index('ix_line_iso_file', 'iso_file_id'),
+        UniqueConstraint('project_id', 'line_no', 'iso_file_id', name='uq_line_iso_file'),
+    )
+
+
+# -------------------------
+# جدول متن استخراج‌شده از صفحه اول PDFهای ISO (جستجوی محتوایی)
+# -------------------------
+class IsoFileContent(Base):
+    __tablename__ = 'iso_file_contents'
+    id = Column(Integer, primary_key=True)
+    iso_file_id = Column(Integer, ForeignKey('iso_file_index.id', ondelete='CASCADE'), unique=True, nullable=False)
+    content_text = Column(Text)          # متن خام صفحه اول (شامل جدول عنوان)
+    normalized_text = Column(Text)       # متن بدون جداکننده با حروف بزرگ برای تطبیق شماره خط
+    source_mtime = Column(DateTime)      # last_modified فایل هنگام استخراج (برای ایندکس افزایشی)
+    extracted_at = Column(DateTime, default=datetime.now)
+    error = Column(String)               # پیام خطای استخراج (PDF خراب یا رمزدار)
+    search_vector = Column(
+        TSVECTOR,
+        Computed("to_tsvector('simple', coalesce(content_text, ''))", persisted=True)
+    )
+
+    __table_args__ = (
+        Index('ix_iso_content_search_vector', 'search_vector', postgresql_using='gin'),
+    )
 
     # ===============================================
     # جداول سیستم انبار (Warehouse Management)
@@ -268,6 +318,8 @@ class InventoryItem(Base):
     min_stock_level = Column(Float, default=0)
     max_stock_level = Column(Float)
     reorder_point = Column(Float)
+    # پرچم موجودی کم؛ ستون محاسبه‌شده که با هر تغییر موجودی/آستانه خودکار به‌روز می‌شود
+    is_low_stock = Column(Boolean, Computed('available_qty <= min_stock_level', persisted=True))
 
     # تاریخ‌ها
     last_receipt_date = Column(DateTime)
@@ -283,21 +335,25 @@ class InventoryItem(Base):
     # Indexes
     __table_args__ = (
         Index('ix_inventory_warehouse_material', 'warehouse_id', 'material_code'),
+        # فقط ردیف‌های زیر حد مجاز؛ گزارش موجودی کم بدون پیمایش کل جدول
+        Index('ix_inventory_items_low_stock', 'warehouse_id', 'material_code',
+              postgresql_where=is_low_stock),
         UniqueConstraint('warehouse_id', 'material_code', 'size', 'heat_no',
                          name='uq_inventory_item'),
     )
 
 class InventoryTransaction(Base):
-    """جدول تراکنش‌های انبار"""
+    """جدول تراکنش‌های انبار (پارتیشن‌بندی ماهانه روی transaction_date)"""
     __tablename__ = 'inventory_transactions'
 
-    id = Column(Integer, primary_key=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     warehouse_id = Column(Integer, ForeignKey('warehouses.id'), nullable=False)
     inventory_item_id = Column(Integer, ForeignKey('inventory_items.id'), nullable=False)
 
     # نوع تراکنش
     transaction_type = Column(String(50), nullable=False)  # IN, OUT, ADJUST, RETURN
-    transaction_date = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # کلید پارتیشن؛ در جدول پارتیشن‌بندی‌شده باید جزو کلید اصلی باشد
+    transaction_date = Column(DateTime, primary_key=True, default=datetime.utcnow, nullable=False)
 
     # مقادیر
     quantity = Column(Float, nullable=False)
@@ -326,8 +382,15 @@ class InventoryTransaction(Base):
 
     # Indexes
     __table_args__ = (
-        Index('ix_transaction_date', 'transaction_date'),
+        # id در انتهای ایندکس‌های تاریخ برای صفحه‌بندی keyset روی (transaction_date, id)
+        Index('ix_transaction_date_id', 'transaction_date', 'id'),
         Index('ix_transaction_reference', 'reference_type', 'reference_id'),
+        # جلوگیری از ثبت دوباره رسید با همان شماره مرجع
+        Index('ix_transaction_reference_no', 'reference_type', 'reference_no'),
+        # بازپخش دفتر از نقطه بازبینی: تراکنش‌های یک انبار در بازه زمانی
+        Index('ix_transaction_warehouse_date_id', 'warehouse_id', 'transaction_date', 'id'),
+        # پارتیشن‌های ماهانه و DEFAULT را data/ledger_partitions.py می‌سازد
+        {'postgresql_partition_by': 'RANGE (transaction_date)'},
     )
 
 class MaterialReservation(Base):
@@ -349,7 +412,7 @@ class MaterialReservation(Base):
     line_no = Column(String(100))
 
     # وضعیت و تاریخ
-    status = Column(String(50), default='ACTIVE')  # ACTIVE, CONSUMED, CANCELLED
+    status = Column(String(50), default='ACTIVE')  # ACTIVE, CONSUMED, CANCELLED, EXPIRED
     reservation_date = Column(DateTime, default=datetime.utcnow)
     expiry_date = Column(DateTime)
 
@@ -368,6 +431,8 @@ class MaterialReservation(Base):
     __table_args__ = (
         Index('ix_reservation_status', 'status'),
         Index('ix_reservation_project', 'project_id', 'line_no'),
+        # پیدا کردن رزروهای فعال منقضی‌شده توسط job انقضا
+        Index('ix_reservation_status_expiry', 'status', 'expiry_date'),
     )
 
 class InventoryAdjustment(Base):
@@ -486,6 +551,28 @@ class MaterialSearchHistory(Base):
     )
 
 
+class MaterialUsageStat(Base):
+    """
+    شمارنده‌های روزانه انتخاب آیتم‌ها برای رتبه‌بندی بر اساس تاریخچه
+    هر انتخاب در سه سطح ثبت می‌شود: (پروژه، کاربر)، (پروژه، همه کاربران) و
+    (همه پروژه‌ها، کاربر)؛ بنابراین رتبه‌بندی فقط یک جستجوی کلید اصلی است
+    """
+    __tablename__ = 'material_usage_stats'
+
+    ALL_PROJECTS = 0
+    ALL_USERS = '*'
+
+    project_id = Column(Integer, primary_key=True)     # 0 = همه پروژه‌ها
+    user_id = Column(String(100), primary_key=True)    # '*' = همه کاربران
+    item_code = Column(String(100), primary_key=True)
+    bucket_date = Column(Date, primary_key=True)
+    usage_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('idx_usage_stats_bucket', 'bucket_date'),
+    )
+
+
 class MaterialSynonym(Base):
     """مترادف‌ها و نام‌های جایگزین متریال‌ها"""
     __tablename__ = 'material_synonyms'
@@ -535,6 +622,9 @@ class WarehouseStockSnapshot(Base):
     low_stock_items = Column(JSON)  # آیتم‌های زیر حد مجاز
     high_turnover_items = Column(JSON)  # آیتم‌های با گردش بالا
 
+    # نوع: STATE (وضعیت آیتم‌ها برای گزارش) یا LEDGER_CHECKPOINT (مانده دفتر تراکنش‌ها)
+    kind = Column(String(20), nullable=False, default='STATE', server_default='STATE')
+
     # متادیتا
     created_at = Column(DateTime, default=datetime.utcnow)
     created_by = Column(String(100))
@@ -544,5 +634,6 @@ class WarehouseStockSnapshot(Base):
 
     __table_args__ = (
         Index('idx_snapshot_warehouse_date', 'warehouse_id', 'snapshot_date'),
+        Index('ix_snapshot_warehouse_kind_date', 'warehouse_id', 'kind', 'snapshot_date'),
         UniqueConstraint('warehouse_id', 'snapshot_date', name='uq_warehouse_snapshot_date'),
     )
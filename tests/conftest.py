@@ -0,0 +1,5 @@
+import os
+import sys
+
+# ماژول‌های پروژه (models، data، ...) از ریشه مخزن import می‌شوند
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
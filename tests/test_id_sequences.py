@@ -0,0 +1,65 @@
+"""
+تست هم‌زمانی تخصیص شناسه‌ها با sequenceهای PostgreSQL
+نیازمند PostgreSQL تست (متغیر محیطی TEST_DATABASE_URL)
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+pytest.importorskip("pandas")
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL تنظیم نشده است")
+
+PARALLEL_CALLS = 3000
+WORKERS = 32
+
+
+@pytest.fixture
+def session_factory():
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import sessionmaker
+    from models import Base
+
+    engine = create_engine(TEST_DATABASE_URL, pool_size=WORKERS, max_overflow=0)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("TRUNCATE spools CASCADE"))
+        conn.execute(text("ALTER SEQUENCE spool_id_seq RESTART WITH 1"))
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def test_parallel_spool_ids_are_unique(session_factory):
+    from data.spool_service import SpoolService
+    from models import Spool
+
+    # شناسه‌های واردشده خارج از sequence (import دستی)
+    with session_factory() as session:
+        session.add_all([Spool(spool_id=f"S{n:03d}") for n in (1, 2, 3)])
+        session.commit()
+
+    service = SpoolService(session_factory)
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        spool_ids = list(executor.map(lambda _: service.generate_next_spool_id(), range(PARALLEL_CALLS)))
+
+    assert len(set(spool_ids)) == PARALLEL_CALLS
+    assert not {"S001", "S002", "S003"} & set(spool_ids)
+
+
+def test_parallel_reservation_nos_are_unique(session_factory):
+    from data.id_sequences import allocate_reservation_nos
+
+    def reserve(_):
+        with session_factory() as session:
+            reservation_no = allocate_reservation_nos(session)[0]
+            session.commit()
+            return reservation_no
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        reservation_nos = list(executor.map(reserve, range(PARALLEL_CALLS)))
+
+    assert len(set(reservation_nos)) == PARALLEL_CALLS
@@ -0,0 +1,84 @@
+"""
+تست اسکنر دوره‌ای ISO: استخراج متن PDF از داخل پروسه daemon اسکنر
+نیازمند PostgreSQL تست (متغیر محیطی TEST_DATABASE_URL) و pypdf
+"""
+
+import os
+import queue
+import time
+
+import pytest
+
+pypdf = pytest.importorskip("pypdf")
+sqlalchemy = pytest.importorskip("sqlalchemy")
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL تنظیم نشده است")
+
+
+@pytest.fixture
+def engine():
+    from sqlalchemy import create_engine
+    from models import Base, IsoFileContent, IsoFileIndex, LineIsoFile
+
+    engine = create_engine(TEST_DATABASE_URL)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for table in (LineIsoFile.__table__, IsoFileContent.__table__, IsoFileIndex.__table__):
+            conn.execute(table.delete())
+    yield engine
+    engine.dispose()
+
+
+def _write_blank_pdf(path):
+    writer = pypdf.PdfWriter()
+    writer.add_blank_page(width=595, height=842)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def test_index_iso_contents_runs_inside_daemon_scanner(engine, tmp_path):
+    import multiprocessing
+    from sqlalchemy import func, select
+    from data.iso_polling_scanner import IsoPollingScanner
+    from models import IsoFileContent
+
+    _write_blank_pdf(tmp_path / "100001-A.pdf")
+    _write_blank_pdf(tmp_path / "100002-B.pdf")
+
+    status_queue = multiprocessing.Queue()
+    scanner = IsoPollingScanner(
+        db_url=TEST_DATABASE_URL,
+        base_dir=str(tmp_path),
+        status_queue=status_queue,
+        interval_work=3600,
+        interval_idle=3600,
+        content_indexing=True,
+        content_workers=2,
+    )
+    assert scanner.daemon
+    scanner.start()
+    try:
+        deadline = time.monotonic() + 60
+        extracted = 0
+        while time.monotonic() < deadline:
+            with engine.connect() as conn:
+                extracted = conn.execute(
+                    select(func.count()).select_from(IsoFileContent.__table__)
+                    .where(IsoFileContent.error.is_(None))
+                ).scalar()
+            if extracted == 2:
+                break
+            time.sleep(0.5)
+    finally:
+        scanner.stop()
+
+    messages = []
+    while True:
+        try:
+            messages.append(status_queue.get_nowait())
+        except queue.Empty:
+            break
+
+    assert not [m for level, m in messages if level == "error"], messages
+    assert extracted == 2
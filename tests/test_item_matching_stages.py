@@ -0,0 +1,136 @@
+"""
+تست pipeline مرحله‌ای تطبیق آیتم‌ها (find_matching_items_staged)
+مراحل با توابع ساختگی و Session جعلی جایگزین می‌شوند؛ دیتابیس لازم نیست
+"""
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("pandas")
+
+
+class _FakeSession:
+    """Session جعلی: فقط متدهایی که pipeline صدا می‌زند"""
+
+    class _Bind:
+        class dialect:
+            name = "sqlite"
+
+    def get_bind(self):
+        return self._Bind()
+
+    def execute(self, *args, **kwargs):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _item(code):
+    return {'material_code': code, 'size': None, 'heat_no': None, 'confidence': 0.8}
+
+
+def _stage(codes, delay=0.0, calls=None, name=None):
+    def run(session, query, size, spec, warehouse_code, limit, should_stop):
+        if calls is not None:
+            calls.append(name)
+        deadline = time.perf_counter() + delay
+        while time.perf_counter() < deadline:
+            if should_stop():
+                return []
+            time.sleep(0.005)
+        return [_item(code) for code in codes]
+    return run
+
+
+@pytest.fixture(params=[True, False], ids=["parallel", "sequential"])
+def service(request, monkeypatch):
+    from data.item_matching_service import ItemMatchingService
+
+    service = ItemMatchingService(_FakeSession, parallel_stages=request.param, stage_budget_ms=300)
+    monkeypatch.setattr(service, "_warm_caches", lambda session: None)
+    monkeypatch.setattr(service, "_rank_by_usage_history", lambda session, results, *args: results)
+    monkeypatch.setattr(service, "_find_exact_matches", lambda *args: [])
+    yield service
+    service.close()
+
+
+def _use_stages(monkeypatch, service, stages):
+    monkeypatch.setattr(service, "_get_enabled_stages", lambda: stages)
+
+
+def test_exact_matches_filling_limit_skip_all_stages(service, monkeypatch):
+    calls = []
+    monkeypatch.setattr(service, "_find_exact_matches", lambda *args: [_item("A"), _item("B")])
+    _use_stages(monkeypatch, service, [
+        ("RULE_BASED", _stage(["X"], calls=calls, name="RULE_BASED")),
+        ("FUZZY", _stage(["Y"], calls=calls, name="FUZZY")),
+    ])
+
+    result = service.find_matching_items_staged("A", limit=2)
+
+    assert [item['material_code'] for item in result['items']] == ["A", "B"]
+    assert all(item['match_type'] == 'EXACT' for item in result['items'])
+    assert result['skipped'] == ["RULE_BASED", "FUZZY"]
+    assert result['timed_out'] == []
+    assert not result['partial']
+    assert calls == []
+
+
+def test_results_are_merged_in_priority_order(service, monkeypatch):
+    # مرحله با اولویت بالاتر کندتر تمام می‌شود ولی نتایجش اول می‌آید
+    _use_stages(monkeypatch, service, [
+        ("RULE_BASED", _stage(["R1", "DUP"], delay=0.05)),
+        ("SYNONYM", _stage(["DUP", "S1"])),
+        ("FUZZY", _stage(["F1"])),
+    ])
+
+    result = service.find_matching_items_staged("Q", limit=10)
+
+    assert [(item['material_code'], item['match_type']) for item in result['items']] == [
+        ("R1", "RULE_BASED"), ("DUP", "RULE_BASED"), ("S1", "SYNONYM"), ("F1", "FUZZY"),
+    ]
+    assert set(result['timings']) >= {"EXACT", "RULE_BASED", "SYNONYM", "FUZZY", "TOTAL"}
+    assert not result['partial']
+
+
+def test_stages_after_limit_is_filled_are_skipped(service, monkeypatch):
+    _use_stages(monkeypatch, service, [
+        ("RULE_BASED", _stage(["R1", "R2"])),
+        ("FUZZY", _stage(["F1"])),
+    ])
+
+    result = service.find_matching_items_staged("Q", limit=2)
+
+    assert [item['material_code'] for item in result['items']] == ["R1", "R2"]
+    assert result['skipped'] == ["FUZZY"]
+
+
+def test_timed_out_stage_returns_partial_result(service, monkeypatch):
+    stopped = threading.Event()
+
+    def slow(session, query, size, spec, warehouse_code, limit, should_stop):
+        while not should_stop():
+            time.sleep(0.005)
+        stopped.set()
+        return []
+
+    _use_stages(monkeypatch, service, [
+        ("RULE_BASED", _stage(["R1"])),
+        ("SEMANTIC", slow),
+    ])
+
+    result = service.find_matching_items_staged("Q", limit=10, stage_budget_ms=50)
+
+    assert [item['material_code'] for item in result['items']] == ["R1"]
+    assert result['timed_out'] == ["SEMANTIC"]
+    assert result['partial']
+    assert "SEMANTIC" not in result['timings']
+    # مرحله کنار گذاشته شده با should_stop متوقف می‌شود
+    assert stopped.wait(1.0)
@@ -0,0 +1,100 @@
+"""
+تست کدگذاری snapshotهای موجودی (data/stock_snapshots.py)
+ماژول مستقیماً از فایل بارگذاری می‌شود تا import بسته data (و pandas) لازم نباشد
+"""
+
+import importlib.util
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "stock_snapshots.py")
+_spec = importlib.util.spec_from_file_location("stock_snapshots", _PATH)
+stock_snapshots = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(stock_snapshots)
+
+
+def _state(rows):
+    return stock_snapshots.state_from_rows(rows)
+
+
+def _as_dict(ids, values):
+    return {int(item_id): list(row) for item_id, row in zip(ids, values)}
+
+
+def test_state_from_rows_sorts_ids_and_replaces_nulls():
+    ids, values = _state([(3, 1, 0, 1, None), (1, 5, 2, 3, 10.0)])
+    assert ids.tolist() == [1, 3]
+    assert values.tolist() == [[5, 2, 3, 10.0], [1, 0, 1, 0.0]]
+
+
+def test_delta_round_trip_through_materialize():
+    prev_ids, prev_values = _state([(1, 10, 0, 10, 2.0), (2, 5, 1, 4, 3.0), (3, 7, 0, 7, 1.0)])
+    # 1 تغییر، 2 بدون تغییر، 3 حذف، 4 اضافه
+    ids, values = _state([(1, 8, 0, 8, 2.0), (2, 5, 1, 4, 3.0), (4, 1, 0, 1, 9.0)])
+
+    full = stock_snapshots.encode_full(prev_ids, prev_values)
+    delta = stock_snapshots.encode_delta(prev_ids, prev_values, ids, values, base_id=1, chain_length=1)
+
+    assert delta['kind'] == stock_snapshots.SNAPSHOT_DELTA
+    assert delta['ids'] == [1, 4]
+    assert delta['removed'] == [3]
+
+    restored_ids, restored_values = stock_snapshots.materialize([full, delta])
+    assert _as_dict(restored_ids, restored_values) == _as_dict(ids, values)
+
+
+def test_delta_against_empty_previous_state():
+    prev_ids, prev_values = stock_snapshots.empty_state()
+    ids, values = _state([(5, 2, 0, 2, 1.5), (6, 3, 1, 2, 0.5)])
+
+    full = stock_snapshots.encode_full(prev_ids, prev_values)
+    delta = stock_snapshots.encode_delta(prev_ids, prev_values, ids, values, base_id=1, chain_length=1)
+
+    assert delta['ids'] == [5, 6]
+    assert delta['removed'] == []
+    restored_ids, restored_values = stock_snapshots.materialize([full, delta])
+    assert _as_dict(restored_ids, restored_values) == _as_dict(ids, values)
+    assert stock_snapshots.materialize([])[0].size == 0
+
+
+def test_needs_full_rolls_over_on_chain_length():
+    ids, values = _state([(n, n, 0, n, 1.0) for n in range(1, 11)])
+    changed_values = values.copy()
+    changed_values[0, 0] += 1
+
+    full = stock_snapshots.encode_full(ids, values)
+    short = stock_snapshots.encode_delta(ids, values, ids, changed_values, base_id=1, chain_length=3)
+    long = stock_snapshots.encode_delta(ids, values, ids, changed_values, base_id=1, chain_length=5)
+
+    assert stock_snapshots.needs_full(None, short, len(ids), full_every=5)
+    assert not stock_snapshots.needs_full(full, short, len(ids), full_every=5)
+    assert stock_snapshots.needs_full(full, long, len(ids), full_every=5)
+    # تغییر بیش از نیمی از آیتم‌ها هم وضعیت کامل می‌خواهد
+    most = stock_snapshots.encode_delta(ids, values, ids, values + 1, base_id=1, chain_length=1)
+    assert stock_snapshots.needs_full(full, most, len(ids), full_every=5)
+
+
+def test_diff_states_aligns_on_union_of_ids():
+    ids_a, values_a = _state([(1, 10, 0, 10, 2.0), (2, 5, 0, 5, 1.0), (4, 1, 0, 1, 1.0)])
+    ids_b, values_b = _state([(2, 5, 0, 5, 1.0), (3, 4, 0, 4, 3.0), (4, 3, 1, 2, 1.0)])
+
+    diff = stock_snapshots.diff_states(ids_a, values_a, ids_b, values_b)
+
+    assert diff['ids'].tolist() == [1, 2, 3, 4]
+    assert diff['added'].tolist() == [False, False, True, False]
+    assert diff['removed'].tolist() == [True, False, False, False]
+    assert diff['changed'].tolist() == [False, False, False, True]
+    assert diff['before'][0].tolist() == [10, 0, 10, 2.0]
+    assert diff['after'][0].tolist() == [0, 0, 0, 0]
+    assert diff['delta'][3].tolist() == [2, 1, 1, 0]
+    assert diff['delta'][2].tolist() == [4, 0, 4, 3.0]
+
+
+def test_totals():
+    _, values = _state([(1, 2, 1, 1, 10.0), (2, 3, 0, 3, 5.0)])
+    assert stock_snapshots.totals(values) == {
+        'total_items': 2, 'total_quantity': 5.0, 'total_reserved': 1.0, 'total_value': 35.0,
+    }
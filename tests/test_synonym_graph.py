@@ -0,0 +1,81 @@
+"""
+تست گراف مترادف کدهای متریال (data/synonym_graph.py)
+ماژول مستقیماً از فایل بارگذاری می‌شود تا import بسته data (و pandas) لازم نباشد
+"""
+
+import importlib.util
+import os
+
+import pytest
+
+_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "synonym_graph.py")
+_spec = importlib.util.spec_from_file_location("synonym_graph", _PATH)
+synonym_graph = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(synonym_graph)
+
+
+@pytest.fixture
+def graph():
+    graph = synonym_graph.SynonymGraph()
+    graph.build([
+        ("a", "B", None, 0.9),
+        ("B", "C", None, 0.8),
+        ("A", "C", None, 0.5),
+        ("X", "Y", "Gasket Spiral Wound", 0.7),
+        ("Z", None, "Spiral Wound Filler", 0.6),
+    ])
+    return graph
+
+
+def test_union_find_merges_transitive_classes(graph):
+    assert graph.equivalence_class("c") == {"A", "B", "C"}
+    assert graph.equivalence_class("X") == {"X", "Y"}
+    assert graph.equivalence_class("Z") == {"Z"}
+    assert graph.equivalence_class("UNKNOWN") == {"UNKNOWN"}
+    assert graph.equivalence_class("") == set()
+
+    graph.add_edge("C", "X", confidence=0.4)
+    assert graph.equivalence_class("Y") == {"A", "B", "C", "X", "Y"}
+    stats = graph.get_stats()
+    assert stats["classes"] == 2
+    assert stats["largest_class"] == 5
+
+
+def test_expand_uses_max_product_path(graph):
+    expanded = graph.expand("A")
+    assert set(expanded) == {"B", "C"}
+    assert expanded["B"] == pytest.approx(0.9)
+    # مسیر A-B-C (0.72) از یال مستقیم A-C (0.5) قوی‌تر است
+    assert expanded["C"] == pytest.approx(0.72)
+    assert graph.expand("NOPE") == {}
+
+
+def test_expand_is_cached_and_add_edge_invalidates_class(graph):
+    first = graph.expand("A")
+    assert graph.expand("A") is first
+    other = graph.expand("X")
+
+    graph.add_edge("A", "C", confidence=0.95)
+
+    assert graph.expand("A")["C"] == pytest.approx(0.95)
+    # گسترش کلاس‌های دیگر دست نمی‌خورد
+    assert graph.expand("X") is other
+    stats = graph.get_stats()
+    assert stats["expansion_cache_hits"] == 2
+    assert stats["edges"] == 4
+
+
+def test_add_edge_keeps_strongest_weight(graph):
+    graph.add_edge("A", "B", confidence=0.1)
+    assert graph.expand("A")["B"] == pytest.approx(0.9)
+
+
+def test_expand_query_includes_description_matches(graph):
+    expanded = graph.expand_query("spiral wound")
+    assert expanded["X"] == pytest.approx(0.7)
+    assert expanded["Y"] == pytest.approx(0.49)
+    assert expanded["Z"] == pytest.approx(0.6)
+
+    by_code = graph.expand_query("b")
+    assert set(by_code) == {"A", "C"}
+    assert graph.expand_query("") == {}
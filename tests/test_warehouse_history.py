@@ -0,0 +1,79 @@
+"""
+تست cursor صفحه‌بندی تاریخچه تراکنش‌ها و cache شناسه انبار در WarehouseService
+بدون دیتابیس (Session جعلی)
+"""
+
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("pandas")
+
+
+@pytest.fixture
+def service():
+    from data.warehouse_service import WarehouseService
+    return WarehouseService(session_factory=None)
+
+
+class _FakeQuery:
+    def __init__(self, session):
+        self.session = session
+
+    def filter(self, *args):
+        return self
+
+    def scalar(self):
+        self.session.queries += 1
+        return self.session.warehouse_id
+
+
+class _FakeSession:
+    def __init__(self, warehouse_id):
+        self.warehouse_id = warehouse_id
+        self.queries = 0
+
+    def query(self, *args):
+        return _FakeQuery(self)
+
+
+@pytest.mark.parametrize("transaction_date", [
+    datetime(2026, 3, 1, 12, 30, 45, 123456),
+    datetime(2026, 3, 1),
+])
+def test_history_cursor_round_trip(service, transaction_date):
+    cursor = service._encode_history_cursor(transaction_date, 987654321)
+    assert service._decode_history_cursor(cursor) == (transaction_date, 987654321)
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "no-separator",
+    "2026-03-01T12:00:00|abc",
+    "not-a-date|12",
+    "|12",
+])
+def test_malformed_history_cursor_raises_value_error(service, cursor):
+    with pytest.raises(ValueError):
+        service._decode_history_cursor(cursor)
+
+
+def test_warehouse_id_cache_expires_and_is_cleared(service, monkeypatch):
+    import data.warehouse_service as warehouse_service
+
+    session = _FakeSession(7)
+    assert service._get_warehouse_id(session, "WH1") == 7
+    assert service._get_warehouse_id(session, "WH1") == 7
+    assert session.queries == 1
+
+    # پس از پایان TTL دوباره خوانده می‌شود
+    monkeypatch.setattr(warehouse_service, "WAREHOUSE_ID_TTL_SECONDS", 0)
+    session.warehouse_id = 8
+    assert service._get_warehouse_id(session, "WH1") == 8
+    assert session.queries == 2
+
+    # انبار حذف‌شده از cache هم حذف می‌شود
+    session.warehouse_id = None
+    assert service._get_warehouse_id(session, "WH1") is None
+    assert "WH1" not in service._warehouse_ids
@@ -0,0 +1,79 @@
+# ui/dialogs/job_leadership_dialog.py
+"""
+نمای مدیریت رهبری کارهای پس‌زمینه (کدام کلاینت کدام کار را اجرا می‌کند)
+"""
+
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtGui import QColor
+from PyQt6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
+    QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView
+)
+
+
+class JobLeadershipDialog(QDialog):
+    """نمایش وضعیت قفل‌های رهبری کارهای پس‌زمینه"""
+
+    def __init__(self, dm, parent=None):
+        super().__init__(parent)
+        self.dm = dm
+
+        self.setWindowTitle("وضعیت کارهای پس‌زمینه")
+        self.setMinimumSize(900, 300)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel(
+            "هر کار پس‌زمینه فقط توسط یک کلاینت (رهبر) اجرا می‌شود. "
+            "با بسته شدن کلاینت رهبر، کلاینت دیگری به صورت خودکار جایگزین می‌شود."
+        ))
+
+        self.table = QTableWidget()
+        self.table.setColumnCount(6)
+        self.table.setHorizontalHeaderLabels([
+            "کار", "وضعیت", "کلاینت رهبر", "کاربر دیتابیس", "آدرس", "از زمان"
+        ])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        button_layout = QHBoxLayout()
+        refresh_btn = QPushButton("🔄 به‌روزرسانی")
+        refresh_btn.clicked.connect(self.refresh)
+        button_layout.addWidget(refresh_btn)
+        button_layout.addStretch()
+        close_btn = QPushButton("بستن")
+        close_btn.clicked.connect(self.close)
+        button_layout.addWidget(close_btn)
+        layout.addLayout(button_layout)
+
+        # به‌روزرسانی خودکار هر 5 ثانیه
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(5000)
+
+        self.refresh()
+
+    def refresh(self):
+        """خواندن مجدد وضعیت رهبری از دیتابیس"""
+        status = self.dm.get_job_leadership_status()
+        self.table.setRowCount(len(status))
+
+        for row, job in enumerate(status):
+            self.table.setItem(row, 0, QTableWidgetItem(job['label']))
+
+            if job['is_local']:
+                state_item = QTableWidgetItem("رهبر: همین کلاینت")
+                state_item.setBackground(QColor(80, 250, 123))
+            elif job['has_leader']:
+                state_item = QTableWidgetItem("رهبر: کلاینت دیگر")
+                state_item.setBackground(QColor(241, 250, 140))
+            else:
+                state_item = QTableWidgetItem("بدون رهبر")
+                state_item.setBackground(QColor(255, 85, 85))
+            self.table.setItem(row, 1, state_item)
+
+            self.table.setItem(row, 2, QTableWidgetItem(job['holder'] or "-"))
+            self.table.setItem(row, 3, QTableWidgetItem(job['db_user'] or "-"))
+            self.table.setItem(row, 4, QTableWidgetItem(job['client_addr'] or "-"))
+            since = job['acquired_at'] or job['since']
+            self.table.setItem(row, 5, QTableWidgetItem(since.strftime("%Y-%m-%d %H:%M:%S") if since else "-"))
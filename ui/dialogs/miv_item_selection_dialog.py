@@ -3,6 +3,7 @@
 دیالوگ انتخاب هوشمند آیتم از انبار برای MIV
 """
 
+from types import SimpleNamespace
 from typing import Optional, List, Dict, Any
 from PyQt6.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
@@ -224,14 +225,25 @@ class MIVItemSelectionDialog(QDialog):
             return
 
         try:
-            # دریافت پیشنهادهای هوشمند
-            suggestions = self.item_matching_service.find_matches(
-                source_code=self.mto_item.item_code,
-                source_description=self.mto_item.description,
-                source_size=self.mto_item.size_1,
-                source_spec=self.mto_item.spec,
+            # دریافت پیشنهادهای هوشمند (pipeline مرحله‌ای با بودجه زمانی)
+            size = getattr(self.mto_item, 'size_1', None)
+            result = self.item_matching_service.find_matching_items_staged(
+                search_query=self.mto_item.item_code or self.mto_item.description or "",
+                size=str(size) if size not in (None, "") else None,
+                spec=getattr(self.mto_item, 'spec', None) or None,
+                warehouse_code=getattr(self.mto_item, 'warehouse_code', None),
                 limit=10
             )
+            suggestions = [
+                {'inventory_item': SimpleNamespace(**item), 'score': item['confidence'],
+                 'match_type': item['match_type']}
+                for item in result['items']
+            ]
+            timings = ", ".join(f"{stage}: {ms}ms" for stage, ms in result['timings'].items())
+            self.smart_table.setToolTip(
+                f"زمان مراحل: {timings}" +
+                (f"\nمراحل ناتمام: {', '.join(result['timed_out'])}" if result['partial'] else "")
+            )
 
             # نمایش در جدول
             self.smart_table.setRowCount(0)
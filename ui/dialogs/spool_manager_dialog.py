@@ -134,8 +134,12 @@ class SpoolManagerDialog(QDialog):
 
     def new_spool(self):
         """فرم را برای ایجاد یک اسپول جدید آماده می‌کند."""
+        try:
+            next_id = self.dm.generate_next_spool_id()
+        except Exception as e:
+            self.show_msg("خطا", f"شناسه اسپول جدید ساخته نشد: {e}", icon=QMessageBox.Icon.Critical)
+            return
         self.current_spool_id = None
-        next_id = self.dm.generate_next_spool_id()
         self.spool_id_entry.setText(next_id)
         self.location_entry.clear()
         self.table.setRowCount(0)
@@ -0,0 +1,40 @@
+# ui/handlers/iso_content_indexing_worker.py
+"""
+Worker استخراج متن PDFهای ISO برای اجرا در QThread
+پس از پایان ایندکس نام فایل اجرا می‌شود و خود استخراج در Process Pool انجام
+می‌شود؛ بنابراین نه رابط کاربری و نه ایندکس نام فایل معطل آن نمی‌مانند.
+"""
+
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+
+
+class IsoContentIndexingWorker(QObject):
+    """اجرای ایندکس افزایشی محتوای PDFها و گزارش پیشرفت با سیگنال"""
+
+    status_updated = pyqtSignal(str)
+    progress_updated = pyqtSignal(int, int)  # (پردازش‌شده، کل)
+    finished = pyqtSignal(dict)
+    failed = pyqtSignal(str)
+
+    def __init__(self, dm, max_workers: int = None):
+        super().__init__()
+        self.dm = dm
+        self.max_workers = max_workers
+        self._stop_requested = False
+
+    def stop(self):
+        """درخواست توقف پس از دسته جاری"""
+        self._stop_requested = True
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            self.status_updated.emit("در حال استخراج متن PDFهای ISO...")
+            result = self.dm.index_iso_contents(
+                max_workers=self.max_workers,
+                progress_callback=self.progress_updated.emit,
+                should_stop=lambda: self._stop_requested
+            )
+            self.finished.emit(result)
+        except Exception as e:
+            self.failed.emit(str(e))
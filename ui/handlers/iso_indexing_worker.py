@@ -0,0 +1,42 @@
+# ui/handlers/iso_indexing_worker.py
+"""
+Worker ایندکس‌سازی اولیه ISO برای اجرا در QThread
+تمام ارتباط با رابط کاربری از طریق سیگنال انجام می‌شود تا ویجت‌ها فقط
+در ترد اصلی Qt به‌روزرسانی شوند.
+"""
+
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+
+
+class IsoIndexingWorker(QObject):
+    """اجرای ایندکس‌سازی گروهی مسیر ISO و گزارش پیشرفت با سیگنال"""
+
+    status_updated = pyqtSignal(str)
+    progress_updated = pyqtSignal(int, int)  # (پردازش‌شده، کل)
+    finished = pyqtSignal(dict)
+    failed = pyqtSignal(str)
+
+    def __init__(self, dm, base_directory: str, batch_size: int = 5000):
+        super().__init__()
+        self.dm = dm
+        self.base_directory = base_directory
+        self.batch_size = batch_size
+        self._stop_requested = False
+
+    def stop(self):
+        """درخواست توقف پس از دسته جاری (حلقه دسته‌ها این پرچم را بررسی می‌کند)"""
+        self._stop_requested = True
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            self.status_updated.emit("در حال ایندکس‌سازی فایل‌های ISO...")
+            result = self.dm.index_iso_directory(
+                self.base_directory,
+                batch_size=self.batch_size,
+                progress_callback=self.progress_updated.emit,
+                should_stop=lambda: self._stop_requested
+            )
+            self.finished.emit(result)
+        except Exception as e:
+            self.failed.emit(str(e))
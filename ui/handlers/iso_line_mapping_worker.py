@@ -0,0 +1,25 @@
+# ui/handlers/iso_line_mapping_worker.py
+"""
+Worker بازسازی کامل نگاشت خط ↔ فایل ISO برای اجرا در QThread
+عملیات نگهداری دستی (منوی Admin)؛ ایندکس افزایشی فقط فایل‌های تغییرکرده را نگاشت می‌کند.
+"""
+
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+
+
+class IsoLineMappingWorker(QObject):
+    """بازسازی line_iso_files برای همه فایل‌های ایندکس‌شده"""
+
+    finished = pyqtSignal(int)
+    failed = pyqtSignal(str)
+
+    def __init__(self, dm):
+        super().__init__()
+        self.dm = dm
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            self.finished.emit(self.dm.rebuild_line_iso_mapping())
+        except Exception as e:
+            self.failed.emit(str(e))
@@ -0,0 +1,26 @@
+# ui/handlers/job_leader_worker.py
+"""
+Worker heartbeat رهبری کارهای پس‌زمینه برای اجرا در QThread
+کوئری‌های قفل advisory ممکن است با کندی دیتابیس طول بکشند؛ اجرای آن‌ها
+خارج از ترد اصلی مانع قفل شدن رابط کاربری می‌شود.
+"""
+
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+
+
+class JobLeaderWorker(QObject):
+    """یک دور heartbeat رهبری و گزارش نتیجه"""
+
+    finished = pyqtSignal(dict)
+    failed = pyqtSignal(str)
+
+    def __init__(self, dm):
+        super().__init__()
+        self.dm = dm
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            self.finished.emit(self.dm.ensure_job_leadership())
+        except Exception as e:
+            self.failed.emit(str(e))
@@ -0,0 +1,36 @@
+# ui/handlers/low_stock_worker.py
+"""
+Worker شنونده اعلان‌های موجودی کم برای اجرا در QThread
+انتظار روی اتصال LISTEN و اتصال دوباره پس از قطع در ترد پس‌زمینه انجام
+می‌شود و هر رویداد با سیگنال به ترد اصلی تحویل داده می‌شود.
+"""
+
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+
+
+class LowStockWorker(QObject):
+    """حلقه دریافت رویدادهای موجودی کم تا درخواست توقف"""
+
+    alert = pyqtSignal(dict)
+    finished = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self, dm, wait_seconds: float = 2.0):
+        super().__init__()
+        self.dm = dm
+        self.wait_seconds = wait_seconds
+        self._stop_requested = False
+
+    def stop(self):
+        """درخواست توقف پس از انتظار جاری (حداکثر wait_seconds)"""
+        self._stop_requested = True
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            while not self._stop_requested:
+                for event in self.dm.poll_low_stock_alerts(timeout=self.wait_seconds):
+                    self.alert.emit(event)
+            self.finished.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
@@ -0,0 +1,26 @@
+# ui/handlers/reservation_expiry_worker.py
+"""
+Worker کار پس‌زمینه "انقضای رزروها" برای اجرا در QThread
+فقط روی کلاینت رهبر این کار اجرا می‌شود و نتیجه را با سیگنال گزارش می‌دهد.
+"""
+
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+
+
+class ReservationExpiryWorker(QObject):
+    """آزادسازی رزروهای فعال منقضی‌شده"""
+
+    finished = pyqtSignal(dict)
+    failed = pyqtSignal(str)
+
+    def __init__(self, dm):
+        super().__init__()
+        self.dm = dm
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            result = self.dm.expire_reservations()
+            self.finished.emit(result)
+        except Exception as e:
+            self.failed.emit(str(e))
@@ -0,0 +1,27 @@
+# ui/handlers/warehouse_snapshot_worker.py
+"""
+Worker کار پس‌زمینه "Snapshot انبار" برای اجرا در QThread
+فقط روی کلاینت رهبر این کار اجرا می‌شود و نتیجه را با سیگنال گزارش می‌دهد.
+"""
+
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+
+
+class WarehouseSnapshotWorker(QObject):
+    """ساخت نقاط بازبینی ماهانه ارزش‌گذاری موجودی و پارتیشن‌های آینده دفتر تراکنش‌ها"""
+
+    finished = pyqtSignal(dict)
+    failed = pyqtSignal(str)
+
+    def __init__(self, dm):
+        super().__init__()
+        self.dm = dm
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            result = self.dm.ensure_valuation_checkpoints()
+            result['partitions'] = self.dm.ensure_transaction_partitions()
+            self.finished.emit(result)
+        except Exception as e:
+            self.failed.emit(str(e))
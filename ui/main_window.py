@@ -4,7 +4,12 @@ from PyQt6.QtCore import *
 from PyQt6.QtCore import QTimer
 from PyQt6.QtGui import *
 from PyQt6.QtWidgets import *
-from config_manager import DB_HOST, DB_PORT, DB_NAME, ISO_PATH
+from config_manager import (
+    DB_HOST, DB_PORT, DB_NAME, ISO_PATH,
+    ISO_SCAN_MODE, ISO_POLL_INTERVAL_WORK, ISO_POLL_INTERVAL_IDLE,
+    ISO_WORK_HOURS_START, ISO_WORK_HOURS_END, ISO_SCAN_BATCH_SIZE,
+    ISO_CONTENT_INDEXING, ISO_CONTENT_WORKERS
+)
 # from ..data_manager_facade import DataManagerFacade as DataManager
 from functools import partial
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
@@ -12,17 +17,26 @@ from matplotlib.figure import Figure
 from models import *
 from watchdog.observers import Observer
 import matplotlib.pyplot as plt
+import multiprocessing
 import os
 import subprocess
 import sys
-import threading
 import webbrowser
 import time
 
 # Import dialog های مورد نیاز
 from .dialogs.mto_consumption_dialog import MTOConsumptionDialog
 from .dialogs.spool_manager_dialog import SpoolManagerDialog
+from .dialogs.job_leadership_dialog import JobLeadershipDialog
 from .handlers.iso_index_handler import IsoIndexEventHandler
+from .handlers.iso_indexing_worker import IsoIndexingWorker
+from .handlers.warehouse_snapshot_worker import WarehouseSnapshotWorker
+from .handlers.job_leader_worker import JobLeaderWorker
+from .handlers.low_stock_worker import LowStockWorker
+from .handlers.reservation_expiry_worker import ReservationExpiryWorker
+from .handlers.iso_content_indexing_worker import IsoContentIndexingWorker
+from .handlers.iso_line_mapping_worker import IsoLineMappingWorker
+from data.iso_polling_scanner import IsoPollingScanner
 if __name__ != "__main__":
     sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -48,6 +62,32 @@ class MainWindow(QMainWindow):
         self.suggestion_timer.setInterval(300)  # 300 میلی‌ثانیه تاخیر
 
         self.iso_observer = None  # متغیر برای نگه داشتن ترد نگهبان
+        self.iso_scanner = None  # پروسه اسکن دوره‌ای (حالت polling)
+        self.iso_scanner_queue = None
+        self.iso_scanner_timer = QTimer(self)
+        self.iso_scanner_timer.setInterval(2000)
+        self.iso_indexing_thread = None  # QThread ایندکس‌سازی اولیه
+        self.iso_indexing_worker = None
+        self.iso_content_thread = None  # QThread استخراج متن PDFها
+        self.iso_content_worker = None
+        self.iso_line_mapping_thread = None  # QThread بازسازی دستی نگاشت خط ↔ ISO
+        self.iso_line_mapping_worker = None
+        self.warehouse_snapshot_thread = None  # QThread نقاط بازبینی انبار
+        self.warehouse_snapshot_worker = None
+        self.warehouse_snapshot_last_run = None
+        self.reservation_expiry_thread = None  # QThread انقضای رزروها
+        self.reservation_expiry_worker = None
+        self.reservation_expiry_last_run = None
+
+        # Heartbeat رهبری کارهای پس‌زمینه (فقط یک کلاینت ایندکس ISO را اجرا می‌کند)
+        self.job_leader_timer = QTimer(self)
+        self.job_leader_timer.setInterval(30000)  # 30 ثانیه
+        self.job_leader_thread = None  # QThread heartbeat رهبری
+        self.job_leader_worker = None
+
+        # دریافت اعلان‌های موجودی کم (LISTEN روی دیتابیس، بدون پیمایش جدول) در QThread
+        self.low_stock_thread = None
+        self.low_stock_worker = None
 
         # تعریف یک سیگنال در کلاس اصلی برای دریافت پیام از ترد نگهبان
         self.iso_event_handler = IsoIndexEventHandler(self.dm)
@@ -59,7 +99,11 @@ class MainWindow(QMainWindow):
         self.populate_project_combo()
         QApplication.instance().aboutToQuit.connect(self.cleanup_processes)
 
-        self.start_iso_watcher()
+        self.iso_scanner_timer.timeout.connect(self.poll_iso_scanner_status)
+        self.job_leader_timer.timeout.connect(self.refresh_job_leadership)
+        self.job_leader_timer.start()
+        self.refresh_job_leadership()
+        self.start_low_stock_listener()
 
     def setup_menu(self):
         """
@@ -92,6 +136,13 @@ class MainWindow(QMainWindow):
         spool_consumption_action.triggered.connect(
             lambda: self.handle_report_export('spool_consumption'))  # اتصال گزارش جدید
 
+        # منوی مدیریت
+        admin_menu = menu_bar.addMenu("&Admin")
+        jobs_action = admin_menu.addAction("Background Jobs")
+        jobs_action.triggered.connect(self.open_job_leadership_dialog)
+        iso_mapping_action = admin_menu.addAction("Rebuild ISO Line Mapping")
+        iso_mapping_action.triggered.connect(self.start_iso_line_mapping_rebuild)
+
         # منوی Help
         help_menu = menu_bar.addMenu("&Help")
         about_action = help_menu.addAction("&About")
@@ -901,8 +952,18 @@ class MainWindow(QMainWindow):
         search_pattern = digits[:6]
         self.log_to_console(f"جستجو برای فایل‌های مرتبط با الگوی: {search_pattern}", "info")
 
-        # جستجو در ایندکس ISO
-        results = self.dm.search_iso_index(search_pattern)
+        # ابتدا نگاشت پیش‌محاسبه‌شده خط (آخرین ویرایش در ابتدا)، سپس جستجو در ایندکس ISO
+        results = []
+        if self.current_project:
+            results = self.dm.get_iso_files_for_line(self.current_project.id, line_no)
+        if not results:
+            results = self.dm.search_iso_index(search_pattern)
+
+        # نقشه‌هایی که شماره خط فقط در جدول عنوان آن‌ها آمده است
+        known_paths = {r.file_path for r in results}
+        results = list(results) + [
+            r for r in self.dm.search_iso_contents(line_no) if r.file_path not in known_paths
+        ]
 
         if not results:
             self.show_message("نتیجه", f"هیچ فایلی با الگوی '{search_pattern}' یافت نشد.", "info")
@@ -916,8 +977,8 @@ class MainWindow(QMainWindow):
 
         # جدول نتایج
         table = QTableWidget()
-        table.setColumnCount(4)
-        table.setHorizontalHeaderLabels(["نام فایل", "نوع", "تاریخ تغییر", "عملیات"])
+        table.setColumnCount(5)
+        table.setHorizontalHeaderLabels(["نام فایل", "نوع", "ویرایش", "تاریخ تغییر", "عملیات"])
         table.setRowCount(len(results))
         table.horizontalHeader().setStretchLastSection(True)
 
@@ -929,14 +990,17 @@ class MainWindow(QMainWindow):
             file_type = "PDF" if result.file_name.lower().endswith('.pdf') else "DWG"
             table.setItem(row, 1, QTableWidgetItem(file_type))
 
+            # ویرایش
+            table.setItem(row, 2, QTableWidgetItem(result.revision or "-"))
+
             # تاریخ تغییر
             date_str = result.last_modified.strftime("%Y-%m-%d %H:%M") if result.last_modified else ""
-            table.setItem(row, 2, QTableWidgetItem(date_str))
+            table.setItem(row, 3, QTableWidgetItem(date_str))
 
             # دکمه باز کردن
             open_btn = QPushButton("باز کردن")
             open_btn.clicked.connect(partial(self.open_iso_file, result.file_path))
-            table.setCellWidget(row, 3, open_btn)
+            table.setCellWidget(row, 4, open_btn)
 
         table.resizeColumnsToContents()
         layout.addWidget(table)
@@ -1151,6 +1215,12 @@ class MainWindow(QMainWindow):
             self.canvas.draw()
             return
 
+        # تعداد نقشه‌های خط از نگاشت پیش‌محاسبه‌شده
+        iso_files = self.dm.get_iso_files_for_line(self.current_project.id, line_no)
+        self.iso_search_btn.setText(
+            f"🔎 فایل‌های ISO/DWG ({len(iso_files)})" if iso_files else "🔎 جستجوی فایل‌های ISO/DWG"
+        )
+
         # دریافت داده‌های پیشرفت
         progress_data = self.dm.get_mto_progress_for_line(self.current_project.id, line_no)
 
@@ -1312,6 +1382,118 @@ class MainWindow(QMainWindow):
         dialog = SpoolManagerDialog(self.dm, parent=self)
         dialog.exec()
 
+    def open_job_leadership_dialog(self):
+        """باز کردن نمای مدیریت کارهای پس‌زمینه"""
+        dialog = JobLeadershipDialog(self.dm, parent=self)
+        dialog.exec()
+
+    def refresh_job_leadership(self):
+        """Heartbeat رهبری در QThread (کوئری‌های قفل روی ترد اصلی اجرا نمی‌شوند)"""
+        if self.job_leader_thread is not None and self.job_leader_thread.isRunning():
+            return
+
+        self.job_leader_thread = QThread(self)
+        self.job_leader_worker = JobLeaderWorker(self.dm)
+        self.job_leader_worker.moveToThread(self.job_leader_thread)
+
+        self.job_leader_thread.started.connect(self.job_leader_worker.run)
+        self.job_leader_worker.finished.connect(self._on_job_leadership_refreshed)
+        self.job_leader_worker.failed.connect(self._on_job_leadership_failed)
+        self.job_leader_worker.finished.connect(self.job_leader_thread.quit)
+        self.job_leader_worker.failed.connect(self.job_leader_thread.quit)
+        self.job_leader_thread.finished.connect(self.job_leader_worker.deleteLater)
+
+        self.job_leader_thread.start()
+
+    def _on_job_leadership_failed(self, error: str):
+        self.log_to_console(f"خطا در heartbeat رهبری کارها: {error}", "error")
+
+    def _on_job_leadership_refreshed(self, leadership: dict):
+        """
+        نتیجه heartbeat: اگر این کلاینت رهبر ایندکس ISO شد ناظر را راه‌اندازی کن
+        و اگر رهبری از دست رفت ناظر را متوقف کن.
+        """
+        watcher_running = (
+            (self.iso_observer is not None and self.iso_observer.is_alive()) or
+            (self.iso_scanner is not None and self.iso_scanner.is_alive())
+        )
+
+        if leadership.get("iso_indexing") and not watcher_running:
+            self.log_to_console("این کلاینت رهبر ایندکس ISO شد.", "info")
+            self.start_iso_watcher()
+        elif not leadership.get("iso_indexing"):
+            if watcher_running:
+                self.stop_iso_watcher()
+                self.log_to_console("رهبری ایندکس ISO به کلاینت دیگری منتقل شد.", "warning")
+            self.update_iso_status_label("ایندکس ISO توسط کلاینت دیگری انجام می‌شود")
+
+        if leadership.get("warehouse_snapshot"):
+            self.start_warehouse_snapshot_job()
+        if leadership.get("reservation_expiry"):
+            self.start_reservation_expiry_job()
+
+    def start_warehouse_snapshot_job(self, min_interval: int = 3600):
+        """ساخت نقاط بازبینی ماهانه انبار در QThread (حداکثر هر ساعت یک بار)"""
+        if self.warehouse_snapshot_thread is not None and self.warehouse_snapshot_thread.isRunning():
+            return
+        now = time.monotonic()
+        if self.warehouse_snapshot_last_run is not None and now - self.warehouse_snapshot_last_run < min_interval:
+            return
+        self.warehouse_snapshot_last_run = now
+
+        self.warehouse_snapshot_thread = QThread(self)
+        self.warehouse_snapshot_worker = WarehouseSnapshotWorker(self.dm)
+        self.warehouse_snapshot_worker.moveToThread(self.warehouse_snapshot_thread)
+
+        self.warehouse_snapshot_thread.started.connect(self.warehouse_snapshot_worker.run)
+        self.warehouse_snapshot_worker.finished.connect(self._on_warehouse_snapshot_finished)
+        self.warehouse_snapshot_worker.failed.connect(self._on_warehouse_snapshot_failed)
+        self.warehouse_snapshot_worker.finished.connect(self.warehouse_snapshot_thread.quit)
+        self.warehouse_snapshot_worker.failed.connect(self.warehouse_snapshot_thread.quit)
+        self.warehouse_snapshot_thread.finished.connect(self.warehouse_snapshot_worker.deleteLater)
+
+        self.warehouse_snapshot_thread.start()
+
+    def start_reservation_expiry_job(self, min_interval: int = 300):
+        """آزادسازی رزروهای منقضی‌شده در QThread (حداکثر هر 5 دقیقه یک بار)"""
+        if self.reservation_expiry_thread is not None and self.reservation_expiry_thread.isRunning():
+            return
+        now = time.monotonic()
+        if self.reservation_expiry_last_run is not None and now - self.reservation_expiry_last_run < min_interval:
+            return
+        self.reservation_expiry_last_run = now
+
+        self.reservation_expiry_thread = QThread(self)
+        self.reservation_expiry_worker = ReservationExpiryWorker(self.dm)
+        self.reservation_expiry_worker.moveToThread(self.reservation_expiry_thread)
+
+        self.reservation_expiry_thread.started.connect(self.reservation_expiry_worker.run)
+        self.reservation_expiry_worker.finished.connect(self._on_reservation_expiry_finished)
+        self.reservation_expiry_worker.failed.connect(self._on_reservation_expiry_failed)
+        self.reservation_expiry_worker.finished.connect(self.reservation_expiry_thread.quit)
+        self.reservation_expiry_worker.failed.connect(self.reservation_expiry_thread.quit)
+        self.reservation_expiry_thread.finished.connect(self.reservation_expiry_worker.deleteLater)
+
+        self.reservation_expiry_thread.start()
+
+    def _on_reservation_expiry_finished(self, result: dict):
+        if result.get("expired"):
+            self.log_to_console(
+                f"{result['expired']} رزرو منقضی شد و {result['released_qty']} واحد آزاد شد.", "info"
+            )
+
+    def _on_reservation_expiry_failed(self, error: str):
+        self.log_to_console(f"خطا در انقضای رزروها: {error}", "error")
+
+    def _on_warehouse_snapshot_finished(self, result: dict):
+        if result.get("created"):
+            self.log_to_console(f"{result['created']} نقطه بازبینی ماهانه انبار ثبت شد.", "info")
+        if result.get("partitions"):
+            self.log_to_console(f"پارتیشن‌های تراکنش انبار ساخته شد: {', '.join(result['partitions'])}", "info")
+
+    def _on_warehouse_snapshot_failed(self, error: str):
+        self.log_to_console(f"خطا در ساخت نقاط بازبینی انبار: {error}", "error")
+
     def show_about_dialog(self):
         """نمایش دیالوگ درباره برنامه"""
         about_text = """
@@ -1342,9 +1524,26 @@ class MainWindow(QMainWindow):
     def cleanup_processes(self):
         """پاکسازی فرآیندهای پس‌زمینه هنگام بستن برنامه"""
         # توقف ناظر ISO
-        if self.iso_observer and self.iso_observer.is_alive():
-            self.iso_observer.stop()
-            self.iso_observer.join(timeout=2)
+        self.job_leader_timer.stop()
+        if self.job_leader_thread is not None and self.job_leader_thread.isRunning():
+            self.job_leader_thread.quit()
+            self.job_leader_thread.wait(5000)
+        if self.low_stock_thread is not None and self.low_stock_thread.isRunning():
+            self.low_stock_worker.stop()
+            self.low_stock_thread.quit()
+            self.low_stock_thread.wait(int(self.low_stock_worker.wait_seconds * 1000) + 2000)
+        self.stop_iso_watcher()
+        if self.iso_line_mapping_thread is not None and self.iso_line_mapping_thread.isRunning():
+            self.iso_line_mapping_thread.quit()
+            self.iso_line_mapping_thread.wait(10000)
+        if self.warehouse_snapshot_thread is not None and self.warehouse_snapshot_thread.isRunning():
+            self.warehouse_snapshot_thread.quit()
+            self.warehouse_snapshot_thread.wait(2000)
+        if self.reservation_expiry_thread is not None and self.reservation_expiry_thread.isRunning():
+            self.reservation_expiry_thread.quit()
+            self.reservation_expiry_thread.wait(2000)
+        self.dm.release_all_job_leadership()
+        self.dm.close()
 
         # بستن داشبورد وب
         if hasattr(self, 'dashboard_process') and self.dashboard_process.poll() is None:
@@ -1376,6 +1575,11 @@ class MainWindow(QMainWindow):
                 self.update_iso_status_label(f"مسیر ISO یافت نشد: {ISO_PATH}")
                 return
 
+            # حالت polling برای مسیرهای شبکه که رویدادهای watchdog در آن‌ها قابل اعتماد نیست
+            if ISO_SCAN_MODE == "polling":
+                self.start_iso_polling_scanner()
+                return
+
             # ایجاد observer
             self.iso_observer = Observer()
             self.iso_observer.schedule(self.iso_event_handler, ISO_PATH, recursive=True)
@@ -1384,55 +1588,204 @@ class MainWindow(QMainWindow):
             self.update_iso_status_label("ناظر ISO فعال شد")
             self.log_to_console(f"مانیتورینگ مسیر {ISO_PATH} آغاز شد.", "success")
 
-            # ایندکس‌سازی اولیه در ترد جداگانه
-            indexing_thread = threading.Thread(target=self._initial_iso_indexing)
-            indexing_thread.daemon = True
-            indexing_thread.start()
+            # ایندکس‌سازی اولیه در QThread جداگانه
+            self._initial_iso_indexing()
 
         except Exception as e:
             self.update_iso_status_label(f"خطا در راه‌اندازی ناظر: {str(e)}")
             self.log_to_console(f"خطا در راه‌اندازی ناظر ISO: {str(e)}", "error")
 
-    def _initial_iso_indexing(self):
-        """ایندکس‌سازی اولیه فایل‌های ISO در پس‌زمینه"""
-        try:
-            self.iso_progress_bar.show()
-            self.update_iso_status_label("در حال ایندکس‌سازی فایل‌های ISO...")
-
-            # شمارش فایل‌ها
-            total_files = 0
-            for root, dirs, files in os.walk(ISO_PATH):
-                for file in files:
-                    if file.lower().endswith(('.pdf', '.dwg')):
-                        total_files += 1
-
-            if total_files == 0:
-                self.update_iso_status_label("هیچ فایل ISO/DWG یافت نشد")
-                self.iso_progress_bar.hide()
-                return
+    def start_iso_polling_scanner(self):
+        """راه‌اندازی پروسه اسکن دوره‌ای مسیر ISO (اسکن اول همان ایندکس‌سازی اولیه است)"""
+        self.iso_scanner_queue = multiprocessing.Queue()
+        self.iso_scanner = IsoPollingScanner(
+            db_url=self.dm.engine.url.render_as_string(hide_password=False),
+            base_dir=ISO_PATH,
+            status_queue=self.iso_scanner_queue,
+            interval_work=ISO_POLL_INTERVAL_WORK,
+            interval_idle=ISO_POLL_INTERVAL_IDLE,
+            work_hours=(ISO_WORK_HOURS_START, ISO_WORK_HOURS_END),
+            batch_size=ISO_SCAN_BATCH_SIZE,
+            content_indexing=ISO_CONTENT_INDEXING,
+            content_workers=ISO_CONTENT_WORKERS
+        )
+        self.iso_scanner.start()
+        self.iso_scanner_timer.start()
 
-            # ایندکس‌سازی
-            processed = 0
-            for root, dirs, files in os.walk(ISO_PATH):
-                for file in files:
-                    if file.lower().endswith(('.pdf', '.dwg')):
-                        file_path = os.path.join(root, file)
-                        self.dm.upsert_iso_index_entry(file_path)
-                        processed += 1
+        self.update_iso_status_label("اسکن دوره‌ای ISO فعال شد")
+        self.log_to_console(f"اسکن دوره‌ای مسیر {ISO_PATH} آغاز شد.", "success")
 
-                        # به‌روزرسانی پیشرفت
-                        progress = int((processed / total_files) * 100)
-                        self.iso_progress_bar.setValue(progress)
+    def start_low_stock_listener(self):
+        """شنونده اعلان‌های موجودی کم در QThread (انتظار و اتصال دوباره خارج از ترد اصلی)"""
+        if self.low_stock_thread is not None and self.low_stock_thread.isRunning():
+            return
 
-            self.update_iso_status_label(f"ایندکس‌سازی کامل شد: {total_files} فایل")
-            self.log_to_console(f"ایندکس‌سازی {total_files} فایل ISO/DWG کامل شد.", "success")
+        self.low_stock_thread = QThread(self)
+        self.low_stock_worker = LowStockWorker(self.dm)
+        self.low_stock_worker.moveToThread(self.low_stock_thread)
 
-        except Exception as e:
-            self.update_iso_status_label(f"خطا در ایندکس‌سازی: {str(e)}")
-            self.log_to_console(f"خطا در ایندکس‌سازی ISO: {str(e)}", "error")
-        finally:
-            # مخفی کردن progress bar پس از 2 ثانیه
+        self.low_stock_thread.started.connect(self.low_stock_worker.run)
+        self.low_stock_worker.alert.connect(self._on_low_stock_alert)
+        self.low_stock_worker.failed.connect(
+            lambda error: self.log_to_console(f"خطا در شنونده موجودی کم: {error}", "error")
+        )
+        self.low_stock_worker.finished.connect(self.low_stock_thread.quit)
+        self.low_stock_worker.failed.connect(self.low_stock_thread.quit)
+        self.low_stock_thread.finished.connect(self.low_stock_worker.deleteLater)
+
+        self.low_stock_thread.start()
+
+    def _on_low_stock_alert(self, event: dict):
+        """نمایش آیتمی که وارد/خارج از حالت موجودی کم شده است (در ترد اصلی Qt)"""
+        if event.get('is_low_stock'):
+            self.log_to_console(
+                f"⚠️ موجودی کم: {event['material_code']} "
+                f"(موجود {event['available_qty']} / حداقل {event['min_stock_level']})",
+                "warning"
+            )
+        else:
+            self.log_to_console(f"موجودی {event['material_code']} از حد مجاز بالاتر رفت", "info")
+
+    def poll_iso_scanner_status(self):
+        """خواندن پیام‌های وضعیت پروسه اسکن (در ترد اصلی Qt)"""
+        if not self.iso_scanner_queue:
+            return
+        while not self.iso_scanner_queue.empty():
+            try:
+                level, message = self.iso_scanner_queue.get_nowait()
+            except Exception:
+                break
+            self.update_iso_status_label(message)
+            self.log_to_console(message, level)
+
+    def stop_iso_watcher(self):
+        """توقف ناظر تغییرات فایل‌های ISO"""
+        if self.iso_observer and self.iso_observer.is_alive():
+            self.iso_observer.stop()
+            self.iso_observer.join(timeout=2)
+        self.iso_observer = None
+
+        if self.iso_indexing_thread is not None and self.iso_indexing_thread.isRunning():
+            # حلقه دسته‌ها داخل یک slot است؛ quit بدون پرچم توقف آن را متوقف نمی‌کند
+            self.iso_indexing_worker.stop()
+            self.iso_indexing_thread.quit()
+            self.iso_indexing_thread.wait(10000)
+
+        if self.iso_content_thread is not None and self.iso_content_thread.isRunning():
+            self.iso_content_worker.stop()
+            self.iso_content_thread.quit()
+            self.iso_content_thread.wait(2000)
+
+        self.iso_scanner_timer.stop()
+        if self.iso_scanner and self.iso_scanner.is_alive():
+            self.iso_scanner.stop()
+        self.iso_scanner = None
+        self.iso_scanner_queue = None
+
+    def _initial_iso_indexing(self):
+        """ایندکس‌سازی اولیه فایل‌های ISO در QThread با نوشتن گروهی"""
+        if self.iso_indexing_thread is not None and self.iso_indexing_thread.isRunning():
+            return
+
+        self.iso_progress_bar.setValue(0)
+        self.iso_progress_bar.show()
+
+        self.iso_indexing_thread = QThread(self)
+        self.iso_indexing_worker = IsoIndexingWorker(self.dm, ISO_PATH, batch_size=ISO_SCAN_BATCH_SIZE)
+        self.iso_indexing_worker.moveToThread(self.iso_indexing_thread)
+
+        self.iso_indexing_thread.started.connect(self.iso_indexing_worker.run)
+        self.iso_indexing_worker.status_updated.connect(self.update_iso_status_label)
+        self.iso_indexing_worker.progress_updated.connect(self.update_iso_progress)
+        self.iso_indexing_worker.finished.connect(self._on_iso_indexing_finished)
+        self.iso_indexing_worker.failed.connect(self._on_iso_indexing_failed)
+        self.iso_indexing_worker.finished.connect(self.iso_indexing_thread.quit)
+        self.iso_indexing_worker.failed.connect(self.iso_indexing_thread.quit)
+        self.iso_indexing_thread.finished.connect(self.iso_indexing_worker.deleteLater)
+
+        self.iso_indexing_thread.start()
+
+    def _on_iso_indexing_finished(self, result):
+        """پایان موفق ایندکس‌سازی اولیه (در ترد اصلی)"""
+        if result.get('cancelled'):
+            self.update_iso_status_label("ایندکس‌سازی ISO متوقف شد")
             QTimer.singleShot(2000, self.iso_progress_bar.hide)
+            return
+        total = result.get('total', 0)
+        if total == 0:
+            self.update_iso_status_label("هیچ فایل ISO/DWG یافت نشد")
+        else:
+            self.update_iso_status_label(f"ایندکس‌سازی کامل شد: {total} فایل")
+            self.log_to_console(
+                f"ایندکس‌سازی {total} فایل ISO/DWG کامل شد "
+                f"(+{result['added']} ~{result['updated']} -{result['deleted']}).",
+                "success"
+            )
+        # مخفی کردن progress bar پس از 2 ثانیه
+        QTimer.singleShot(2000, self.iso_progress_bar.hide)
+
+        if ISO_CONTENT_INDEXING:
+            self._start_iso_content_indexing()
+
+    def _start_iso_content_indexing(self):
+        """استخراج افزایشی متن PDFها در QThread جدا (بعد از ایندکس نام فایل)"""
+        if self.iso_content_thread is not None and self.iso_content_thread.isRunning():
+            return
+
+        self.iso_content_thread = QThread(self)
+        self.iso_content_worker = IsoContentIndexingWorker(self.dm, max_workers=ISO_CONTENT_WORKERS)
+        self.iso_content_worker.moveToThread(self.iso_content_thread)
+
+        self.iso_content_thread.started.connect(self.iso_content_worker.run)
+        self.iso_content_worker.finished.connect(self._on_iso_content_indexing_finished)
+        self.iso_content_worker.failed.connect(
+            lambda message: self.log_to_console(f"خطا در استخراج متن ISO: {message}", "error")
+        )
+        self.iso_content_worker.finished.connect(self.iso_content_thread.quit)
+        self.iso_content_worker.failed.connect(self.iso_content_thread.quit)
+        self.iso_content_thread.finished.connect(self.iso_content_worker.deleteLater)
+
+        self.iso_content_thread.start()
+
+    def _on_iso_content_indexing_finished(self, result):
+        """گزارش سرعت استخراج متن PDFها"""
+        if not result.get('total'):
+            return
+        self.log_to_console(
+            f"متن {result['extracted']} از {result['total']} فایل PDF در {result['elapsed']} ثانیه استخراج شد "
+            f"({result['files_per_sec']} فایل/ثانیه، {result['mb_per_sec']} MB/s، {result['failed']} خطا).",
+            "success"
+        )
+
+    def start_iso_line_mapping_rebuild(self):
+        """بازسازی کامل نگاشت خط ↔ فایل ISO در QThread (مثلاً بعد از ورود خطوط جدید MTO)"""
+        if self.iso_line_mapping_thread is not None and self.iso_line_mapping_thread.isRunning():
+            self.log_to_console("بازسازی نگاشت خطوط ISO در حال اجراست.", "warning")
+            return
+
+        self.log_to_console("بازسازی نگاشت خطوط ISO شروع شد...", "info")
+        self.iso_line_mapping_thread = QThread(self)
+        self.iso_line_mapping_worker = IsoLineMappingWorker(self.dm)
+        self.iso_line_mapping_worker.moveToThread(self.iso_line_mapping_thread)
+
+        self.iso_line_mapping_thread.started.connect(self.iso_line_mapping_worker.run)
+        self.iso_line_mapping_worker.finished.connect(
+            lambda created: self.log_to_console(f"نگاشت خطوط ISO بازسازی شد: {created} ردیف.", "success")
+        )
+        self.iso_line_mapping_worker.failed.connect(
+            lambda message: self.log_to_console(f"خطا در بازسازی نگاشت خطوط ISO: {message}", "error")
+        )
+        self.iso_line_mapping_worker.finished.connect(self.iso_line_mapping_thread.quit)
+        self.iso_line_mapping_worker.failed.connect(self.iso_line_mapping_thread.quit)
+        self.iso_line_mapping_thread.finished.connect(self.iso_line_mapping_worker.deleteLater)
+
+        self.iso_line_mapping_thread.start()
+
+    def _on_iso_indexing_failed(self, message):
+        """خطا در ایندکس‌سازی اولیه (در ترد اصلی)"""
+        self.update_iso_status_label(f"خطا در ایندکس‌سازی: {message}")
+        self.log_to_console(f"خطا در ایندکس‌سازی ISO: {message}", "error")
+        QTimer.singleShot(2000, self.iso_progress_bar.hide)
 
     def update_iso_progress(self, current, total):
         """به‌روزرسانی نوار پیشرفت ایندکس ISO"""